@@ -4,7 +4,7 @@ import shutil
 import logging
 import json
 from datetime import datetime
-from flask import Flask, request, render_template, send_file, jsonify, redirect, url_for
+from flask import Flask, Response, request, render_template, send_file, jsonify, redirect, url_for
 from werkzeug.utils import secure_filename
 import threading
 import time
@@ -12,8 +12,9 @@ import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.geminiOCR.pdf_to_json import main as pdf_to_json_main
+from src.geminiOCR.pdf_to_json import main as pdf_to_json_main, get_backend_status, stream_pdf_rows, PRESETS
 from src.geminiOCR.json_to_excel import main as json_to_excel_main
+from src.geminiOCR.json_to_parquet import main as json_to_parquet_main
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -38,13 +39,22 @@ class ProcessingJob:
         self.progress = 0
         self.message = "File uploaded successfully"
         self.start_time = datetime.now()
+        self.output_dir = None
         self.json_path = None
         self.excel_path = None
+        self.parquet_path = None
         self.error = None
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() == 'pdf'
 
+def requested_preset():
+    """Preset named in the form or query string, or None; raises ValueError for an unknown name"""
+    preset = request.form.get('preset') or request.args.get('preset')
+    if preset and preset not in PRESETS:
+        raise ValueError(f"Unknown preset '{preset}', expected one of: {', '.join(PRESETS)}")
+    return preset or None
+
 def cleanup_old_files():
     current_time = time.time()
     for folder in [app.config['UPLOAD_FOLDER'], app.config['PROCESSING_FOLDER'], app.config['OUTPUT_FOLDER']]:
@@ -58,7 +68,7 @@ def cleanup_old_files():
                     except Exception as e:
                         logger.error(f"Error cleaning up {file_path}: {e}")
 
-def process_pdf_async(job_id: str, pdf_path: str):
+def process_pdf_async(job_id: str, pdf_path: str, preset: str = None):
     job = job_status[job_id]
     
     try:
@@ -69,18 +79,29 @@ def process_pdf_async(job_id: str, pdf_path: str):
         job_processing_dir = os.path.join(app.config['PROCESSING_FOLDER'], job_id)
         os.makedirs(job_processing_dir, exist_ok=True)
         
-        json_output = os.path.join(os.path.dirname(app.root_path), 'output', "results.json")
-        excel_output = os.path.join(os.path.dirname(app.root_path), 'output', "results.xlsx")
+        # Each job writes into its own folder so concurrent jobs never overwrite each other's results
+        job.output_dir = os.path.join(os.path.dirname(app.root_path), 'output', job_id)
+        os.makedirs(job.output_dir, exist_ok=True)
+        json_output = os.path.join(job.output_dir, "results.json")
+        excel_output = os.path.join(job.output_dir, "results.xlsx")
+        parquet_output = os.path.join(job.output_dir, "results.parquet")
         
         job.progress = 30
         job.message = "Extracting structured data from PDF..."
-        pdf_to_json_main(pdf_path, job_processing_dir, json_output)
+        pdf_to_json_main(pdf_path, job_processing_dir, json_output, preset=preset)
         job.json_path = json_output
 
         job.progress = 70
         job.message = "Converting data to Excel format..."
         json_to_excel_main(json_output, excel_output)
         job.excel_path = excel_output
+
+        job.progress = 90
+        job.message = "Exporting tables to Parquet..."
+        try:
+            job.parquet_path = json_to_parquet_main(json_output, parquet_output)
+        except Exception as e:
+            logger.error(f"Parquet export failed for job {job_id}, the Excel file is still available: {e}")
     
         job.status = "completed"
         job.progress = 100
@@ -101,7 +122,7 @@ def process_pdf_async(job_id: str, pdf_path: str):
         except Exception as e:
             logger.error(f"Error cleaning up processing directory for job {job_id}: {e}")
 
-def process_pdf_direct(pdf_path: str):
+def process_pdf_direct(pdf_path: str, preset: str = None):
     temp_id = str(uuid.uuid4())
     temp_processing_dir = os.path.join(app.config['PROCESSING_FOLDER'], temp_id)
     
@@ -112,7 +133,7 @@ def process_pdf_direct(pdf_path: str):
         
         logger.info(f"Starting direct PDF processing for {pdf_path}")
         
-        pdf_to_json_main(pdf_path, temp_processing_dir, json_output)
+        pdf_to_json_main(pdf_path, temp_processing_dir, json_output, preset=preset)
         
         if os.path.exists(json_output):
             with open(json_output, 'r', encoding='utf-8') as f:
@@ -153,6 +174,11 @@ def convert_pdf_direct():
         if not allowed_file(file.filename):
             logger.error(f"Invalid file type: {file.filename}")
             return jsonify({'error': 'Only PDF files are allowed'}), 400
+
+        try:
+            preset = requested_preset()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         temp_id = str(uuid.uuid4())
         filename = secure_filename(file.filename)
@@ -163,7 +189,7 @@ def convert_pdf_direct():
         
         try:
             # Process PDF and get JSON data
-            json_data = process_pdf_direct(temp_file_path)
+            json_data = process_pdf_direct(temp_file_path, preset)
             
             # Return the JSON data directly
             response = jsonify({
@@ -190,6 +216,76 @@ def convert_pdf_direct():
             'message': 'Failed to process PDF'
         }), 500
 
+def client_event(event: dict, server_paths: list) -> dict:
+    """A row event as sent to the client, without the server's file paths"""
+    def scrub(text: str) -> str:
+        for path in server_paths:
+            text = text.replace(os.path.abspath(path), '').replace(path, '')
+        return text
+
+    if event.get('type') == 'error':
+        return dict(event, error=scrub(str(event.get('error', ''))))
+    if event.get('type') != 'page' or not isinstance(event.get('content'), dict):
+        return event
+
+    content = dict(event['content'])
+    if isinstance(content.get('page_info'), dict):
+        content['page_info'] = {key: value for key, value in content['page_info'].items() if key != 'image_path'}
+    # Failed pages name their image in "page"; the event already carries the page number
+    if isinstance(content.get('page'), str):
+        del content['page']
+    if isinstance(content.get('error'), str):
+        content['error'] = scrub(content['error'])
+    return dict(event, content=content)
+
+@app.route('/convert-pdf/rows', methods=['POST'])
+def convert_pdf_rows():
+    """Stream table rows as newline-delimited JSON while the pages are still being extracted"""
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file provided'}), 400
+
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'No file selected'}), 400
+
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'Only PDF files are allowed'}), 400
+
+    try:
+        preset = requested_preset()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    temp_id = str(uuid.uuid4())
+    filename = secure_filename(file.filename)
+    temp_file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"temp_{temp_id}_{filename}")
+    temp_processing_dir = os.path.join(app.config['PROCESSING_FOLDER'], temp_id)
+    file.save(temp_file_path)
+
+    def generate():
+        rows = stream_pdf_rows(temp_file_path, temp_processing_dir, preset)
+        server_paths = [temp_processing_dir, temp_file_path]
+        try:
+            for event in rows:
+                yield json.dumps(client_event(event, server_paths), ensure_ascii=False) + '\n'
+        except Exception as e:
+            logger.error(f"Row streaming failed for {filename}: {e}")
+            yield json.dumps(client_event({'type': 'error', 'error': str(e)}, server_paths)) + '\n'
+        finally:
+            # On a client disconnect this cancels the remaining pages and waits for the workers,
+            # so the images are only removed once nothing is reading or uploading them
+            rows.close()
+            for path in [temp_file_path, temp_processing_dir]:
+                try:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path)
+                    elif os.path.exists(path):
+                        os.remove(path)
+                except Exception as e:
+                    logger.error(f"Error cleaning up {path}: {e}")
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
 @app.route('/convert', methods=['POST'])
 def upload_file():
     """Handle file upload for async processing (existing functionality)"""
@@ -203,6 +299,11 @@ def upload_file():
         
         if not allowed_file(file.filename):
             return jsonify({'error': 'Only PDF files are allowed'}), 400
+
+        try:
+            preset = requested_preset()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         job_id = str(uuid.uuid4())
         
@@ -215,7 +316,7 @@ def upload_file():
         
         processing_thread = threading.Thread(
             target=process_pdf_async,
-            args=(job_id, file_path)
+            args=(job_id, file_path, preset)
         )
         processing_thread.start()
         
@@ -244,8 +345,12 @@ def get_status(job_id):
         'filename': job.filename
     }
     
+    if job.status == 'processing':
+        response_data['backend'] = get_backend_status()
+    
     if job.status == 'completed':
         response_data['download_url'] = url_for('download_file', job_id=job_id)
+        response_data['parquet_url'] = url_for('download_file', job_id=job_id, format='parquet')
     elif job.status == 'error':
         response_data['error'] = job.error
     
@@ -264,6 +369,9 @@ def download_file(job_id):
     if not os.path.exists(job.excel_path):
         return jsonify({'error': 'Output file not found'}), 404
     
+    if request.args.get('format') == 'parquet':
+        return download_parquet(job)
+    
     try:
         return send_file(
             job.excel_path,
@@ -275,6 +383,22 @@ def download_file(job_id):
         logger.error(f"Download error for job {job_id}: {e}")
         return jsonify({'error': 'Error downloading file'}), 500
 
+def download_parquet(job: ProcessingJob):
+    """The job's tables as Parquet (one row per cell), exported when the job completed"""
+    if not job.parquet_path or not os.path.exists(job.parquet_path):
+        return jsonify({'error': 'Parquet file not available for this job'}), 404
+
+    try:
+        return send_file(
+            job.parquet_path,
+            as_attachment=True,
+            download_name=f"{os.path.splitext(job.filename)[0]}_tables.parquet",
+            mimetype='application/vnd.apache.parquet'
+        )
+    except Exception as e:
+        logger.error(f"Parquet download error for job {job.job_id}: {e}")
+        return jsonify({'error': 'Error downloading Parquet file'}), 500
+
 @app.route('/progress/<job_id>')
 def progress_page(job_id):
     if job_id not in job_status:
@@ -285,9 +409,12 @@ def progress_page(job_id):
 @app.route('/health')
 def health_check():
     """Health check endpoint for VBA to test connectivity"""
+    backend = get_backend_status()
+    circuit_open = backend['circuit_breaker']['state'] != 'closed'
     return jsonify({
-        'status': 'healthy',
-        'message': 'PDF Converter API is running',
+        'status': 'degraded' if circuit_open else 'healthy',
+        'message': 'Gemini backend unavailable, new pages are parked until it recovers' if circuit_open else 'PDF Converter API is running',
+        'backend': backend,
         'timestamp': datetime.now().isoformat()
     })
 
@@ -311,7 +438,9 @@ def periodic_cleanup():
                     jobs_to_remove.append(job_id)
             
             for job_id in jobs_to_remove:
-                del job_status[job_id]
+                job = job_status.pop(job_id)
+                if job.output_dir and os.path.exists(job.output_dir):
+                    shutil.rmtree(job.output_dir, ignore_errors=True)
                 logger.info(f"Cleaned up old job status: {job_id}")
                 
         except Exception as e:
@@ -0,0 +1,328 @@
+import os
+import json
+import time
+import base64
+import logging
+import mimetypes
+import concurrent.futures
+import urllib.error
+import urllib.request
+from typing import List, Dict, Any, Optional, Callable, BinaryIO, Union
+
+try:
+    from .pdf_to_json import (STRUCTURE_PROMPT, VERIFICATION_INSTRUCTIONS, ModelRouting, analysis_failed, api_keys,
+                              convert_pdf_to_images, default_routing, extraction_instructions_for_format, extraction_prompt_for,
+                              extraction_quality_issues, merge_page_results, page_info_for, parse_extraction_response,
+                              parse_verification_response, perform_final_qc, verification_prompt_for)
+except ImportError:
+    from pdf_to_json import (STRUCTURE_PROMPT, VERIFICATION_INSTRUCTIONS, ModelRouting, analysis_failed, api_keys,
+                             convert_pdf_to_images, default_routing, extraction_instructions_for_format, extraction_prompt_for,
+                             extraction_quality_issues, merge_page_results, page_info_for, parse_extraction_response,
+                             parse_verification_response, perform_final_qc, verification_prompt_for)
+
+logger = logging.getLogger(__name__)
+
+# Point at a local stand-in batch server for testing
+BATCH_BASE_URL = os.getenv('GEMINI_BATCH_BASE_URL', 'https://generativelanguage.googleapis.com')
+BATCH_POLL_SECONDS = float(os.getenv('GEMINI_BATCH_POLL_SECONDS', '30'))
+# Batch jobs are served within 24 hours
+BATCH_TIMEOUT_SECONDS = float(os.getenv('GEMINI_BATCH_TIMEOUT_SECONDS', str(24 * 3600)))
+# Requests per batch job; a stage with more pages is split into several jobs that run side by side
+BATCH_MAX_REQUESTS = int(os.getenv('GEMINI_BATCH_MAX_REQUESTS', '1000'))
+# Page images uploaded at once before the first stage
+BATCH_UPLOAD_WORKERS = 8
+
+BATCH_DONE_STATES = ("BATCH_STATE_SUCCEEDED", "BATCH_STATE_FAILED", "BATCH_STATE_CANCELLED", "BATCH_STATE_EXPIRED")
+
+class BatchJobError(Exception):
+    pass
+
+class GeminiBatchClient:
+    """Minimal REST client for the Gemini Batch API: upload page images and JSONL job files, create the job,
+    poll it and download the results"""
+    def __init__(self, api_key: str, base_url: str = BATCH_BASE_URL, timeout: float = 300):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def _request(self, method: str, path: str, body: Optional[Union[bytes, BinaryIO]] = None, content_type: str = "application/json",
+                 content_length: Optional[int] = None) -> bytes:
+        """With a file object as body (and its content_length) the upload is streamed from disk"""
+        headers = {"x-goog-api-key": self.api_key, "Content-Type": content_type}
+        if content_length is not None:
+            headers["Content-Length"] = str(content_length)
+        request = urllib.request.Request(f"{self.base_url}/{path}", data=body, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.read()
+        except urllib.error.HTTPError as e:
+            raise BatchJobError(f"{method} {path} failed with HTTP {e.code}: {e.read().decode('utf-8', 'replace')[:500]}") from e
+
+    def _json(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        return json.loads(self._request(method, path, body) or b"{}")
+
+    def upload_file(self, path: str, mime_type: str) -> Dict[str, Any]:
+        """Upload a file without reading it into memory; returns the File resource with its name and uri"""
+        with open(path, 'rb') as f:
+            response = self._request("POST", "upload/v1beta/files?uploadType=media", f, mime_type, os.path.getsize(path))
+        return json.loads(response)["file"]
+
+    def upload_jsonl(self, path: str) -> str:
+        return self.upload_file(path, "application/jsonl")["name"]
+
+    def create(self, model_name: str, file_name: str, display_name: str) -> str:
+        payload = {"batch": {"display_name": display_name, "input_config": {"file_name": file_name}}}
+        return self._json("POST", f"v1beta/models/{model_name}:batchGenerateContent", payload)["name"]
+
+    def get(self, batch_name: str) -> Dict[str, Any]:
+        return self._json("GET", f"v1beta/{batch_name}")
+
+    def wait(self, batch_name: str, poll_seconds: float = BATCH_POLL_SECONDS, timeout: float = BATCH_TIMEOUT_SECONDS) -> Dict[str, Any]:
+        start_time = time.time()
+        while True:
+            batch = self.get(batch_name)
+            state = batch.get("metadata", {}).get("state")
+            if state in BATCH_DONE_STATES:
+                if state != "BATCH_STATE_SUCCEEDED":
+                    raise BatchJobError(f"Batch {batch_name} ended in {state}: {batch.get('error')}")
+                return batch
+            if time.time() - start_time > timeout:
+                raise BatchJobError(f"Batch {batch_name} still {state} after {timeout:.0f} seconds")
+            logger.info(f"⏳ Batch {batch_name} is {state}, checking again in {poll_seconds:.0f}s")
+            time.sleep(poll_seconds)
+
+    def download(self, file_name: str) -> bytes:
+        return self._request("GET", f"download/v1beta/{file_name}:download?alt=media")
+
+    def delete_file(self, file_name: str):
+        try:
+            self._request("DELETE", f"v1beta/{file_name}")
+        except Exception as e:
+            logger.warning(f"Could not delete batch file {file_name}: {e}")
+
+def responses_file_of(batch: Dict[str, Any]) -> str:
+    output = batch.get("response") or batch.get("metadata", {}).get("output") or {}
+    file_name = output.get("responsesFile")
+    if not file_name:
+        raise BatchJobError(f"Batch {batch.get('name')} succeeded without a responses file")
+    return file_name
+
+def response_text(response: Dict[str, Any]) -> str:
+    candidates = response.get("candidates") or []
+    parts = candidates[0].get("content", {}).get("parts", []) if candidates else []
+    return "".join(part.get("text", "") for part in parts)
+
+class BatchPage:
+    def __init__(self, document: int, image_path: str):
+        self.document = document
+        self.image_path = image_path
+        self.key = f"{document}:{os.path.basename(image_path)}"
+        self.mime_type = mimetypes.guess_type(image_path)[0] or "image/jpeg"
+        self.file_name = None
+        self.file_uri = None
+        self.structure_analysis = None
+        self.structured_data = None
+
+    def image_part(self) -> Dict[str, Any]:
+        if self.file_uri:
+            return {"file_data": {"mime_type": self.mime_type, "file_uri": self.file_uri}}
+        # Only pages whose upload failed are inlined, read per job so they are never all in memory at once
+        with open(self.image_path, 'rb') as f:
+            data = base64.b64encode(f.read()).decode('ascii')
+        return {"inline_data": {"mime_type": self.mime_type, "data": data}}
+
+class BatchRunner:
+    """Runs each pipeline stage for every page of many documents as asynchronous batch jobs of at most
+    max_requests requests, with the page images uploaded once and shared by every stage"""
+    def __init__(self, client: GeminiBatchClient, work_folder: str, poll_seconds: float = BATCH_POLL_SECONDS,
+                 max_requests: int = BATCH_MAX_REQUESTS):
+        self.client = client
+        self.work_folder = work_folder
+        self.poll_seconds = poll_seconds
+        self.max_requests = max(1, max_requests)
+        self.jobs = 0
+        self.failed_jobs = 0
+        self.requests = 0
+        self.uploaded_pages = 0
+        self.usage = {"input_tokens": 0, "output_tokens": 0}
+
+    def upload_pages(self, pages: List[BatchPage]):
+        """Upload each page image to the File API so the job files refer to it instead of inlining it"""
+        def upload(page: BatchPage):
+            try:
+                uploaded = self.client.upload_file(page.image_path, page.mime_type)
+                page.file_name, page.file_uri = uploaded["name"], uploaded["uri"]
+                return True
+            except Exception as e:
+                logger.warning(f"Upload of {os.path.basename(page.image_path)} failed, inlining it in the job files: {e}")
+                return False
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(BATCH_UPLOAD_WORKERS, len(pages)))) as executor:
+            self.uploaded_pages += sum(executor.map(upload, pages))
+        logger.info(f"📤 Uploaded {self.uploaded_pages}/{len(pages)} page images for the batch jobs")
+
+    def delete_pages(self, pages: List[BatchPage]):
+        uploaded = [page for page in pages if page.file_name]
+        if not uploaded:
+            return
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(BATCH_UPLOAD_WORKERS, len(uploaded))) as executor:
+            list(executor.map(lambda page: self.client.delete_file(page.file_name), uploaded))
+        for page in uploaded:
+            page.file_name = page.file_uri = None
+
+    def write_job(self, stage: str, pages: List[BatchPage], instructions: str, prompt_for: Callable[[BatchPage], Optional[str]]) -> str:
+        self.jobs += 1
+        job_path = os.path.join(self.work_folder, f"batch_{self.jobs}_{stage}.jsonl")
+        with open(job_path, 'w', encoding='utf-8') as f:
+            for page in pages:
+                prompt = prompt_for(page)
+                parts = ([{"text": prompt}] if prompt else []) + [page.image_part()]
+                request = {
+                    "system_instruction": {"parts": [{"text": instructions}]},
+                    "contents": [{"role": "user", "parts": parts}]
+                }
+                f.write(json.dumps({"key": page.key, "request": request}) + "\n")
+        self.requests += len(pages)
+        return job_path
+
+    def run(self, stage: str, model_name: str, pages: List[BatchPage], instructions: str,
+            prompt_for: Callable[[BatchPage], Optional[str]]) -> Dict[str, str]:
+        """Submit one request per page and return the response text by page key; failed requests, and the
+        requests of a batch job that failed as a whole, are left out"""
+        if not pages:
+            return {}
+        start_time = time.time()
+        input_files, batch_names = [], []
+        try:
+            # Submit every chunk before waiting on any, so the jobs are served side by side
+            for first in range(0, len(pages), self.max_requests):
+                chunk = pages[first:first + self.max_requests]
+                try:
+                    input_files.append(self.client.upload_jsonl(self.write_job(stage, chunk, instructions, prompt_for)))
+                    batch_names.append(self.client.create(model_name, input_files[-1], f"{stage}-{self.jobs}"))
+                except Exception as e:
+                    self.failed_jobs += 1
+                    logger.error(f"Could not submit {stage} batch of {len(chunk)} requests, those pages get no response: {e}")
+                    continue
+                logger.info(f"📦 Submitted {stage} batch {batch_names[-1]}: {len(chunk)} requests on {model_name}")
+
+            lines = []
+            for batch_name in batch_names:
+                try:
+                    batch = self.client.wait(batch_name, self.poll_seconds)
+                    lines.extend(self.client.download(responses_file_of(batch)).decode('utf-8').splitlines())
+                except Exception as e:
+                    self.failed_jobs += 1
+                    logger.error(f"{stage} batch {batch_name} failed, its pages get no response: {e}")
+        finally:
+            for file_name in input_files:
+                self.client.delete_file(file_name)
+
+        texts = {}
+        for line in lines:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            if "response" in result:
+                texts[result["key"]] = response_text(result["response"])
+                usage = result["response"].get("usageMetadata", {})
+                self.usage["input_tokens"] += usage.get("promptTokenCount", 0)
+                self.usage["output_tokens"] += usage.get("candidatesTokenCount", 0)
+            else:
+                logger.error(f"{stage} request {result.get('key')} failed in batch: {result.get('error') or result.get('status')}")
+        logger.info(f"📦 {stage} finished in {time.time() - start_time:.1f}s over {len(batch_names)} batch jobs "
+                    f"with {len(texts)}/{len(pages)} responses")
+        return texts
+
+def process_pages_in_batch(documents: Dict[str, List[str]], work_folder: str, json_output_folder: Optional[str] = None,
+                           routing: Optional[ModelRouting] = None, verify: bool = True, client: Optional[GeminiBatchClient] = None,
+                           poll_seconds: float = BATCH_POLL_SECONDS, max_requests: int = BATCH_MAX_REQUESTS) -> Dict[str, Dict[str, Any]]:
+    """Extract the page images of many documents (keyed by source path) with batch jobs per stage, and return the merged JSON per document"""
+    routing = routing or default_routing
+    client = client or GeminiBatchClient(api_keys[0])
+    start_time = time.time()
+
+    source_paths = list(documents)
+    pages = [BatchPage(document, image_path) for document, source_path in enumerate(source_paths) for image_path in documents[source_path]]
+    logger.info(f"Batch processing {len(pages)} pages from {len(source_paths)} documents")
+
+    runner = BatchRunner(client, work_folder, poll_seconds, max_requests)
+    runner.upload_pages(pages)
+    try:
+        analyses = runner.run("analysis", routing.model_for("analysis"), pages, STRUCTURE_PROMPT, lambda page: None)
+        for page in pages:
+            page.structure_analysis = analyses.get(page.key) or analysis_failed(BatchJobError("no analysis in batch results"))
+
+        instructions = extraction_instructions_for_format()
+        pending, model_name = pages, routing.model_for("extraction")
+        while pending:
+            extractions = runner.run("extraction", model_name, pending, instructions, lambda page: extraction_prompt_for(page.structure_analysis))
+            for page in pending:
+                text = extractions.get(page.key)
+                page.structured_data = parse_extraction_response(text) if text is not None else {"error": "No extraction in batch results"}
+            # Pages failing the quality checks go round again on the escalation model, as one more batch
+            retry = [page for page in pending if extraction_quality_issues(page.structured_data)]
+            escalation_model = routing.escalate("extraction", model_name, f"{len(retry)} pages failed quality checks") if retry else None
+            pending, model_name = (retry, escalation_model) if escalation_model else ([], None)
+
+        if verify:
+            checkable = [page for page in pages if "error" not in page.structured_data]
+            verifications = runner.run("verification", routing.model_for("verification"), checkable, VERIFICATION_INSTRUCTIONS,
+                                       lambda page: verification_prompt_for(page.structured_data))
+            for page in checkable:
+                text = verifications.get(page.key)
+                if text is not None:
+                    page.structured_data, _ = parse_verification_response(text, page.structured_data, page.image_path)
+    finally:
+        runner.delete_pages(pages)
+
+    outputs = {}
+    for document, pdf_path in enumerate(source_paths):
+        page_results = []
+        for page in pages:
+            if page.document == document:
+                result = dict(page.structured_data)
+                result["page_info"] = page_info_for(page.image_path)
+                page_results.append(result)
+        merged_data = perform_final_qc(merge_page_results(page_results), pdf_path)
+        if json_output_folder:
+            json_output_path = os.path.join(json_output_folder, f"{os.path.splitext(os.path.basename(pdf_path))[0]}_extracted.json")
+            with open(json_output_path, 'w', encoding='utf-8') as f:
+                json.dump(merged_data, f, indent=2, ensure_ascii=False)
+            logger.info(f"JSON output saved to: {json_output_path}")
+        outputs[pdf_path] = merged_data
+
+    logger.info(f"📦 Batch run complete in {time.time() - start_time:.1f}s: {runner.jobs} jobs ({runner.failed_jobs} failed), {runner.requests} requests, "
+                f"{runner.usage['input_tokens']} input / {runner.usage['output_tokens']} output tokens")
+    return outputs
+
+def process_pdfs_in_batch(pdf_paths: List[str], output_folder: str, json_output_folder: Optional[str] = None,
+                          routing: Optional[ModelRouting] = None, verify: bool = True, client: Optional[GeminiBatchClient] = None,
+                          poll_seconds: float = BATCH_POLL_SECONDS, dpi: int = 300, max_requests: int = BATCH_MAX_REQUESTS) -> Dict[str, Dict[str, Any]]:
+    """Convert many PDFs to page images and extract them all through batch jobs"""
+    documents = {}
+    for document, pdf_path in enumerate(pdf_paths):
+        image_folder = os.path.join(output_folder, f"document_{document + 1}")
+        documents[pdf_path] = convert_pdf_to_images(pdf_path, image_folder, dpi)
+    os.makedirs(json_output_folder or output_folder, exist_ok=True)
+    return process_pages_in_batch(documents, output_folder, json_output_folder or output_folder, routing, verify, client, poll_seconds, max_requests)
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Convert many PDFs to structured JSON through the Gemini Batch API")
+    parser.add_argument("pdf_paths", nargs="+", help="PDF files to process")
+    parser.add_argument("--output-folder", default="batch_images", help="Folder for page images and batch job files")
+    parser.add_argument("--json-output-folder", help="Folder for the JSON outputs (defaults to the output folder)")
+    parser.add_argument("--no-verify", action="store_true", help="Skip the verification batch")
+    parser.add_argument("--poll-seconds", type=float, default=BATCH_POLL_SECONDS, help="Seconds between batch status checks")
+    parser.add_argument("--base-url", default=BATCH_BASE_URL, help="Batch API base URL, e.g. a local stand-in server")
+    parser.add_argument("--max-requests", type=int, default=BATCH_MAX_REQUESTS, help="Requests per batch job; larger stages are split into several jobs")
+
+    args = parser.parse_args()
+
+    process_pdfs_in_batch(args.pdf_paths, args.output_folder, args.json_output_folder, verify=not args.no_verify,
+                          client=GeminiBatchClient(api_keys[0], args.base_url), poll_seconds=args.poll_seconds, max_requests=args.max_requests)
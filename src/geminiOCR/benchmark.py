@@ -0,0 +1,951 @@
+import os
+import json
+import time
+import random
+import re
+import logging
+import tempfile
+import tracemalloc
+from threading import Lock, Thread
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any
+from collections import deque
+
+os.environ.setdefault("GOOGLE_API_KEY", "fake-benchmark-key")
+
+import numpy as np
+import pandas as pd
+from PIL import Image, ImageDraw
+from google.api_core import exceptions as google_exceptions
+import pdf_to_json
+import batch_mode
+import json_to_excel
+import cell_types
+import json_to_parquet
+from page_crop import CROP_PADDING
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+FAKE_TABLE_ROWS = 25
+
+# Gemini bills a page image at a flat 258 tokens
+IMAGE_TOKENS = 258
+
+# USD per million input / output tokens, for comparing runs rather than exact billing
+MODEL_PRICES = {
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.5-pro": (1.25, 10.00)
+}
+
+def estimate_tokens(text: str) -> int:
+    """Rough BPE-like count: each word or number and each run of punctuation is a token"""
+    return len(re.findall(r"\w+|[^\w\s]+", text))
+
+class FakeUsage:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int, cached_content_token_count: int = 0):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.cached_content_token_count = cached_content_token_count
+
+class FakeResponse:
+    def __init__(self, text: str, prompt_tokens: int = 0, cached_tokens: int = 0):
+        self.text = text
+        self.usage_metadata = FakeUsage(prompt_tokens, estimate_tokens(text), cached_tokens)
+
+class FakeStreamResponse:
+    """Streamed response: the first chunk arrives after prefill, the rest spread over the remaining latency"""
+    def __init__(self, text: str, prompt_tokens: int, cached_tokens: int, first_chunk_seconds: float, decode_seconds: float, chunk_chars: int = 200):
+        self.chunks = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+        self.text = text
+        self.usage_metadata = FakeUsage(prompt_tokens, estimate_tokens(text), cached_tokens)
+        self.first_chunk_seconds = first_chunk_seconds
+        self.decode_seconds = decode_seconds
+
+    def __iter__(self):
+        time.sleep(self.first_chunk_seconds)
+        for chunk in self.chunks:
+            yield FakeChunk(chunk)
+            time.sleep(self.decode_seconds / len(self.chunks))
+
+class FakeChunk:
+    def __init__(self, text: str):
+        self.text = text
+        self.parts = [text]
+
+class FakeGeminiBackend:
+    """In-process stand-in for Gemini with per-key RPM quotas and random latency"""
+    def __init__(self, latency=0.1, quota_per_minute=60, tail_probability=0.0, tail_latency=2.0, seed=0,
+                 prefill_seconds_per_token=0.0, decode_seconds_per_token=0.0, generic_failure_rate=0.0):
+        self.latency = latency
+        self.generic_failure_rate = generic_failure_rate
+        self.prefill_seconds_per_token = prefill_seconds_per_token
+        self.decode_seconds_per_token = decode_seconds_per_token
+        self.quota_per_minute = quota_per_minute
+        self.tail_probability = tail_probability
+        self.tail_latency = tail_latency
+        self.random = random.Random(seed)
+        self.key_calls = {}
+        self.calls = 0
+        self.quota_errors = 0
+        self.uploaded_files = {}
+        self.image_bytes_received = 0
+        self.image_pixels_received = 0
+        self.lock = Lock()
+
+    def create_model(self, api_key: str, model_name: str) -> "FakeGeminiModel":
+        return FakeGeminiModel(self, api_key, model_name)
+
+    def upload_file(self, api_key: str, path: str, mime_type: str, timeout: float = 60.0) -> pdf_to_json.UploadedFile:
+        size = os.path.getsize(path)
+        with self.lock:
+            self.image_bytes_received += size
+            name = f"files/fake-{len(self.uploaded_files) + 1}"
+            self.uploaded_files[name] = api_key
+        uri = f"https://generativelanguage.googleapis.com/v1beta/{name}"
+        return pdf_to_json.UploadedFile(name, uri, mime_type, delete=lambda: self.uploaded_files.pop(name))
+
+    def admit(self, api_key: str, model_name: str = ""):
+        with self.lock:
+            now = time.time()
+            window = self.key_calls.setdefault(api_key, deque())
+            while window and window[0] <= now - 60.0:
+                window.popleft()
+            if len(window) >= self.quota_per_minute:
+                self.quota_errors += 1
+                retry_in = window[0] + 60.0 - now
+                raise google_exceptions.ResourceExhausted(f"429 Resource has been exhausted. Please retry in {retry_in:.1f}s")
+            window.append(now)
+            self.calls += 1
+            slow = self.random.random() < self.tail_probability
+            latency = self.tail_latency if slow else self.random.uniform(0.5, 1.5) * self.latency
+            return latency * (0.5 if "lite" in model_name else 2.0 if "pro" in model_name else 1.0)
+
+    def respond(self, prompt: str, table_rows: int = FAKE_TABLE_ROWS) -> str:
+        if "numbered crops of table cells" in prompt:
+            crops = int(re.search(r"There are (\d+) crops", prompt).group(1))
+            return json.dumps({str(number): "Signature detected" for number in range(1, crops + 1)})
+        if "Analyze this document page" in prompt:
+            return "Single column layout with one bordered asset register table and a signature column."
+        if "verify and correct" in prompt:
+            return "VERIFICATION_PASSED"
+        headers = ["S. No", "Asset", "Region", "Sign", "AMC", "Warranty"]
+        rows = [[str(i + 1), f"Asset {i + 1}", "North", "Signature detected", "AMC", "2026-03-31"] for i in range(table_rows)]
+        if pdf_to_json.GENERIC_STRUCTURE_ANALYSIS in prompt:
+            with self.lock:
+                misread = self.random.random() < self.generic_failure_rate
+            if misread:
+                # Without the analysis the signature column is sometimes missed on a few rows
+                rows = [row[:3] + row[4:] if i % 5 == 0 else row for i, row in enumerate(rows)]
+        if '"tsv"' in prompt:
+            table = {"table_title": "Asset Register", "tsv": "\n".join("\t".join(row) for row in [headers] + rows)}
+        else:
+            table = {"table_title": "Asset Register", "headers": headers, "data": rows}
+        return json.dumps({
+            "document_type": "asset register",
+            "page_metadata": {"page_number": "", "header": "", "footer": ""},
+            "sections": [],
+            "tables": [table],
+            "key_value_pairs": {}
+        })
+
+class FakeGeminiModel:
+    def __init__(self, backend: FakeGeminiBackend, api_key: str, model_name: str):
+        self.backend = backend
+        self.api_key = api_key
+        self.model_name = model_name
+
+    def generate_content(self, contents, stream=False, request_options=None, **kwargs):
+        latency = self.backend.admit(self.api_key, self.model_name)
+        text = "".join(part for part in contents if isinstance(part, str))
+        images = [part for part in contents if not isinstance(part, str)]
+        inline_bytes = sum(os.path.getsize(image.filename) for image in images if getattr(image, "filename", None))
+        pixels = sum(image.size[0] * image.size[1] for image in images if isinstance(image, Image.Image))
+        with self.backend.lock:
+            self.backend.image_bytes_received += inline_bytes
+            self.backend.image_pixels_received += pixels
+        prompt_tokens = len(text) // 4 + len(images) * IMAGE_TOKENS
+        prefill = prompt_tokens * self.backend.prefill_seconds_per_token
+        # A drawn form is read with as many rows as it has
+        grids = [fake_page_grids[image.filename] for image in images if getattr(image, "filename", None) in fake_page_grids]
+        response_text = self.backend.respond(text, len(grids[0][1]) - 2 if grids else FAKE_TABLE_ROWS)
+        decode = estimate_tokens(response_text) * self.backend.decode_seconds_per_token
+        if stream:
+            # Output is generated at a steady rate after the first chunk, which costs a fifth of the latency
+            return FakeStreamResponse(response_text, prompt_tokens, 0,
+                                      prefill + 0.2 * latency, 0.8 * latency + decode)
+        time.sleep(latency + prefill + decode)
+        return FakeResponse(response_text, prompt_tokens, 0)
+
+class FakeBatchServer:
+    """Local stand-in for the Gemini Batch API over HTTP; a job completes job_seconds after it is created,
+    answered by the fake backend's responses"""
+    def __init__(self, backend: FakeGeminiBackend, job_seconds: float = 1.0):
+        self.backend = backend
+        self.job_seconds = job_seconds
+        self.files = {}
+        self.jobs = {}
+        self.requests = 0
+        self.file_count = 0
+        self.job_file_bytes = 0
+        self.image_bytes = 0
+        self.lock = Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def reply(self, status: int, body: bytes, content_type: str = "application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path.startswith("/upload/v1beta/files"):
+                    name = server.add_file(body, self.headers.get("Content-Type", ""))
+                    self.reply(200, json.dumps({"file": {"name": name, "uri": f"{server.base_url}/v1beta/{name}"}}).encode())
+                elif self.path.endswith(":batchGenerateContent"):
+                    model_name = self.path.split("/models/")[1].split(":")[0]
+                    name = server.create_job(model_name, json.loads(body)["batch"]["input_config"]["file_name"])
+                    self.reply(200, json.dumps({"name": name, "metadata": {"state": "BATCH_STATE_PENDING"}}).encode())
+                else:
+                    self.reply(404, b"{}")
+
+            def do_GET(self):
+                if self.path.startswith("/v1beta/batches/"):
+                    self.reply(200, json.dumps(server.job_status(self.path[len("/v1beta/"):])).encode())
+                elif self.path.startswith("/download/v1beta/"):
+                    name = self.path[len("/download/v1beta/"):].split(":download")[0]
+                    self.reply(200, server.files[name], "application/jsonl")
+                else:
+                    self.reply(404, b"{}")
+
+            def do_DELETE(self):
+                server.files.pop(self.path[len("/v1beta/"):], None)
+                self.reply(200, b"{}")
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def add_file(self, data: bytes, content_type: str = "") -> str:
+        with self.lock:
+            self.file_count += 1
+            name = f"files/batch-{self.file_count}"
+            self.files[name] = data
+            if content_type.startswith("image/"):
+                self.image_bytes += len(data)
+            elif content_type == "application/jsonl":
+                self.job_file_bytes += len(data)
+        return name
+
+    def create_job(self, model_name: str, file_name: str) -> str:
+        with self.lock:
+            name = f"batches/fake-{len(self.jobs) + 1}"
+            self.jobs[name] = {"model": model_name, "input": file_name, "done_at": time.time() + self.job_seconds, "output": None}
+        return name
+
+    def job_status(self, name: str) -> Dict[str, Any]:
+        job = self.jobs[name]
+        if time.time() < job["done_at"]:
+            return {"name": name, "metadata": {"state": "BATCH_STATE_RUNNING"}}
+        if job["output"] is None:
+            lines = []
+            for line in self.files[job["input"]].decode("utf-8").splitlines():
+                item = json.loads(line)
+                request = item["request"]
+                text = "".join(part.get("text", "") for part in request["system_instruction"]["parts"])
+                text += "".join(part.get("text", "") for part in request["contents"][0]["parts"])
+                response_text = self.backend.respond(text)
+                lines.append(json.dumps({"key": item["key"], "response": {
+                    "candidates": [{"content": {"role": "model", "parts": [{"text": response_text}]}}],
+                    "usageMetadata": {"promptTokenCount": len(text) // 4 + IMAGE_TOKENS, "candidatesTokenCount": estimate_tokens(response_text)}
+                }}))
+            with self.lock:
+                self.requests += len(lines)
+            job["output"] = self.add_file("\n".join(lines).encode("utf-8"))
+        return {"name": name, "metadata": {"state": "BATCH_STATE_SUCCEEDED"}, "response": {"responsesFile": job["output"]}}
+
+    def close(self):
+        self.httpd.shutdown()
+
+# Column boundaries of the fake asset register form, as fractions of the page width
+FAKE_FORM_COLUMNS = [0.08, 0.16, 0.42, 0.56, 0.72, 0.82, 0.92]
+FAKE_FORM_HEADERS = ["S. No", "Asset", "Region", "Sign", "AMC", "Warranty"]
+SIGN_COLUMN = FAKE_FORM_HEADERS.index("Sign")
+
+# Grid lines of each drawn form page, so the fake OCR knows where its text is
+fake_page_grids = {}
+
+def draw_ruled_form(image: Image.Image, offset_x: int, offset_y: int, rows: int, signed: bool = True):
+    """Draw the form's ruling, with a scribbled signature in every row if signed; returns its line positions"""
+    draw = ImageDraw.Draw(image)
+    width, _ = image.size
+    top = 120 + offset_y
+    header_bottom = top + 60
+    ys = [top, header_bottom] + [header_bottom + (r + 1) * 32 for r in range(rows)]
+    xs = [int(width * column) + offset_x for column in FAKE_FORM_COLUMNS]
+    for y in ys:
+        draw.line([(xs[0], y), (xs[-1], y)], fill="black", width=2)
+    for x in xs:
+        draw.line([(x, top), (x, ys[-1])], fill="black", width=2)
+    for y0, y1 in zip(ys[1:], ys[2:]) if signed else []:
+        x0, x1 = xs[SIGN_COLUMN] + 10, xs[SIGN_COLUMN + 1] - 10
+        draw.line([(x0, y1 - 8), ((x0 + x1) // 2, y0 + 8), (x1, y1 - 10)], fill="black", width=2)
+    return xs, ys
+
+class FakeOCRReader:
+    """Local OCR stand-in for drawn forms: printed cells are read, mostly confidently, and signatures are not"""
+    def __init__(self, low_confidence_rate: float = 0.03, seed: int = 0):
+        self.low_confidence_rate = low_confidence_rate
+        self.random = random.Random(seed)
+
+    def read(self, image_path: str) -> List[Dict[str, Any]]:
+        xs, ys = fake_page_grids[image_path]
+        blocks = []
+        for r, (y0, y1) in enumerate(zip(ys, ys[1:])):
+            values = FAKE_FORM_HEADERS if r == 0 else [str(r), f"Asset {r}", "North", "", "AMC", "2026-03-31"]
+            for c, (x0, x1) in enumerate(zip(xs, xs[1:])):
+                if not values[c]:
+                    continue
+                confidence = 0.6 if self.random.random() < self.low_confidence_rate else 0.97
+                blocks.append({"text": values[c], "confidence": confidence,
+                               "min_x": x0 + 6, "max_x": x1 - 6, "min_y": y0 + 8, "max_y": y1 - 8})
+        return blocks
+
+def make_fake_pages(folder: str, count: int, ruled: bool = False, seed: int = 0, unsigned_share: float = 0.0) -> List[str]:
+    """Blank pages, or scans of one ruled form with a little offset and a varying number of rows;
+    unsigned_share of the forms are left unsigned, so they hold printed text only"""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f"page_{i+1}.jpg")
+        image = Image.new("RGB", (850, 1100), "white")
+        if ruled:
+            signed = not (unsigned_share and rng.random() < unsigned_share)
+            fake_page_grids[path] = draw_ruled_form(image, rng.randint(-8, 8), rng.randint(-8, 8), rng.randint(18, FAKE_TABLE_ROWS), signed)
+        image.save(path, "JPEG")
+        paths.append(path)
+    return paths
+
+def reset_pipeline_state():
+    pdf_to_json.call_stats = pdf_to_json.CallStats()
+    pdf_to_json.circuit_breaker = pdf_to_json.CircuitBreaker()
+
+def run_fake_document(image_paths: List[str], backend: FakeGeminiBackend, key_count: int = 1, calls_per_minute: int = 120, max_workers: int = 2,
+                      upload_pages: bool = False, templates=None, engine=None, router=None, routing=None, verify: bool = True,
+                      hedge: bool = False) -> Dict[str, Any]:
+    reset_pipeline_state()
+    pdf_to_json.configure_api_keys([f"fake-key-{i+1}" for i in range(key_count)], calls_per_minute, backend)
+
+    uploads = pdf_to_json.PageUploadManager() if upload_pages else None
+    start_time = time.time()
+    try:
+        page_results = pdf_to_json.run_page_tasks(image_paths, max_workers=max_workers, hedge=hedge, routing=routing, uploads=uploads,
+                                                   templates=templates, engine=engine, router=router, verify=verify)
+    finally:
+        if uploads is not None:
+            uploads.delete_all()
+    elapsed = time.time() - start_time
+
+    return {
+        "pages": len(page_results),
+        "failed_pages": sum(1 for page in page_results if "error" in page),
+        "seconds": elapsed,
+        "pages_per_minute": len(page_results) / elapsed * 60,
+        "calls": backend.calls,
+        "calls_per_minute": backend.calls / elapsed * 60,
+        "quota_errors": backend.quota_errors,
+        "image_bytes": backend.image_bytes_received,
+        "image_pixels": backend.image_pixels_received,
+        "files_left": len(backend.uploaded_files),
+        "tables": [page.get("tables") for page in sorted(page_results, key=lambda page: page.get("page_info", {}).get("page_number", 0))],
+        "stats": pdf_to_json.call_stats.summary()
+    }
+
+def benchmark_key_scaling(image_paths: List[str], key_counts: List[int], calls_per_minute: int, latency: float) -> List[Dict[str, Any]]:
+    rows = []
+    for key_count in key_counts:
+        backend = FakeGeminiBackend(latency=latency, quota_per_minute=calls_per_minute)
+        result = run_fake_document(image_paths, backend, key_count, calls_per_minute, max_workers=2 * key_count)
+        result["keys"] = key_count
+        rows.append(result)
+
+    baseline = rows[0]["calls_per_minute"] / rows[0]["keys"]
+    print(f"\n{'keys':>4} | {'pages/min':>9} | {'calls/min':>9} | {'scaling':>7} | {'quota errors':>12}")
+    print("-" * 54)
+    for row in rows:
+        scaling = row["calls_per_minute"] / baseline
+        print(f"{row['keys']:>4} | {row['pages_per_minute']:>9.1f} | {row['calls_per_minute']:>9.1f} | {scaling:>6.2f}x | {row['quota_errors']:>12}")
+    return rows
+
+def benchmark_page_uploads(image_paths: List[str], latency: float, key_count: int = 1) -> List[Dict[str, Any]]:
+    """Image bytes sent for the document with every stage inlining the page vs one File API upload per page and key"""
+    rows = []
+    for label, upload_pages in [("inline", False), ("file api", True)]:
+        backend = FakeGeminiBackend(latency=latency, quota_per_minute=100000)
+        result = run_fake_document(image_paths, backend, key_count, calls_per_minute=100000, max_workers=2 * key_count,
+                                   upload_pages=upload_pages)
+        result["mode"] = label
+        rows.append(result)
+
+    baseline = rows[0]["image_bytes"]
+    print(f"\n{'mode':<8} | {'calls':>5} | {'image MB sent':>13} | {'reduction':>9} | {'seconds':>7} | {'files left':>10}")
+    print("-" * 68)
+    for row in rows:
+        reduction = 100.0 * (baseline - row["image_bytes"]) / baseline if baseline else 0.0
+        print(f"{row['mode']:<8} | {row['calls']:>5} | {row['image_bytes'] / 1e6:>13.2f} | {reduction:>8.1f}% | {row['seconds']:>7.2f} | {row['files_left']:>10}")
+    return rows
+
+def benchmark_row_streaming(image_paths: List[str], latency: float) -> List[Dict[str, Any]]:
+    """Time from start of the run to each page's first table row, with and without streamed extraction.
+    Without streaming a row is only available once its page has been verified."""
+    rows = []
+    for label, streamed in [("buffered", False), ("streamed", True)]:
+        reset_pipeline_state()
+        backend = FakeGeminiBackend(latency=latency, quota_per_minute=100000)
+        pdf_to_json.configure_api_keys(["fake-key-1"], 100000, backend)
+        first_row = {}
+        page_done = {}
+        start_time = time.time()
+        if streamed:
+            for event in pdf_to_json.iter_page_rows(image_paths):
+                elapsed = time.time() - start_time
+                if event["type"] == "row":
+                    first_row.setdefault(event["page"], elapsed)
+                elif event["type"] == "page":
+                    page_done[event["page"]] = elapsed
+        else:
+            def process(image_path: str):
+                pdf_to_json.process_single_page_with_timeout(image_path)
+                page_done[pdf_to_json.page_number_from_path(image_path)] = time.time() - start_time
+
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(process, image_paths))
+            first_row = dict(page_done)
+        rows.append({
+            "mode": label,
+            "first_row": min(first_row.values()),
+            "avg_first_row": sum(first_row.values()) / len(first_row),
+            "avg_page_done": sum(page_done.values()) / len(page_done),
+            "seconds": time.time() - start_time
+        })
+
+    print(f"\n{'mode':<9} | {'first row (s)':>13} | {'avg first row/page (s)':>22} | {'avg page done (s)':>17} | {'total (s)':>9}")
+    print("-" * 84)
+    for row in rows:
+        print(f"{row['mode']:<9} | {row['first_row']:>13.2f} | {row['avg_first_row']:>22.2f} | {row['avg_page_done']:>17.2f} | {row['seconds']:>9.2f}")
+    return rows
+
+def benchmark_table_format(image_paths: List[str], latency: float, decode_seconds_per_token: float = 0.002) -> List[Dict[str, Any]]:
+    """Extraction output tokens and latency with tables returned as JSON arrays vs tab-separated text"""
+    rows = []
+    decoded = {}
+    for table_format in pdf_to_json.TABLE_FORMATS:
+        pdf_to_json.TABLE_FORMAT = table_format
+        backend = FakeGeminiBackend(latency=latency, quota_per_minute=100000, decode_seconds_per_token=decode_seconds_per_token)
+        result = run_fake_document(image_paths, backend, calls_per_minute=100000)
+        decoded[table_format] = result["tables"]
+        for usage in result["stats"]["models"]:
+            if usage["stage"] == "extraction":
+                rows.append({
+                    "format": table_format,
+                    "output_tokens": usage["output_tokens"] / usage["calls"],
+                    "avg_seconds": usage["avg_seconds"],
+                    "pages_per_minute": result["pages_per_minute"]
+                })
+    pdf_to_json.TABLE_FORMAT = "json"
+
+    baseline = rows[0]["output_tokens"]
+    print(f"\n{'format':<6} | {'output tok/page':>15} | {'saving':>6} | {'extraction (s)':>14} | {'pages/min':>9}")
+    print("-" * 64)
+    for row in rows:
+        saving = 100.0 * (baseline - row["output_tokens"]) / baseline
+        print(f"{row['format']:<6} | {row['output_tokens']:>15.0f} | {saving:>5.1f}% | {row['avg_seconds']:>14.3f} | {row['pages_per_minute']:>9.1f}")
+    print(f"Decoded tables identical: {decoded['json'] == decoded['tsv']}")
+    return rows
+
+def benchmark_layout_templates(image_paths: List[str], latency: float) -> List[Dict[str, Any]]:
+    """Model calls and time for a run of one ruled form, analysing every page vs matching learned templates"""
+    rows = []
+    for label, use_templates in [("analyse all", False), ("templates", True)]:
+        templates = pdf_to_json.LayoutTemplateRegistry() if use_templates else None
+        backend = FakeGeminiBackend(latency=latency, quota_per_minute=100000)
+        result = run_fake_document(image_paths, backend, calls_per_minute=100000, templates=templates)
+        stages = result["stats"]["stages"]
+        rows.append({
+            "mode": label,
+            "analysis_calls": stages.get("analysis", {}).get("calls", 0),
+            "calls": result["calls"],
+            "seconds": result["seconds"],
+            "matched": templates.summary()["matched_pages"] if templates else 0
+        })
+
+    print(f"\n{'mode':<11} | {'analysis calls':>14} | {'total calls':>11} | {'pages matched':>13} | {'seconds':>7}")
+    print("-" * 70)
+    for row in rows:
+        print(f"{row['mode']:<11} | {row['analysis_calls']:>14} | {row['calls']:>11} | {row['matched']:>13} | {row['seconds']:>7.2f}")
+    return rows
+
+def benchmark_hybrid_tables(image_paths: List[str], latency: float) -> List[Dict[str, Any]]:
+    """Model input pixels and output tokens per page for the full Gemini pipeline vs local OCR with model-read cells"""
+    rows = []
+    for label, hybrid in [("gemini", False), ("hybrid", True)]:
+        engine = pdf_to_json.HybridTableEngine(reader=FakeOCRReader()) if hybrid else None
+        backend = FakeGeminiBackend(latency=latency, quota_per_minute=100000)
+        result = run_fake_document(image_paths, backend, calls_per_minute=100000, engine=engine)
+        pages = result["pages"]
+        rows.append({
+            "mode": label,
+            "calls": result["calls"] / pages,
+            "pixels": result["image_pixels"] / pages,
+            "output_tokens": sum(usage["output_tokens"] for usage in result["stats"]["models"]) / pages,
+            "seconds": result["seconds"],
+            "model_cells": f"{engine.summary()['model_cells']}/{engine.summary()['cells']}" if engine else "-"
+        })
+
+    print(f"\n{'mode':<6} | {'calls/page':>10} | {'input px/page':>13} | {'output tok/page':>15} | {'model cells':>11} | {'seconds':>7}")
+    print("-" * 79)
+    for row in rows:
+        print(f"{row['mode']:<6} | {row['calls']:>10.1f} | {row['pixels']:>13.0f} | {row['output_tokens']:>15.0f} | {row['model_cells']:>11} | {row['seconds']:>7.2f}")
+    print(f"Input pixels {rows[0]['pixels'] / rows[1]['pixels']:.1f}x and output tokens {rows[0]['output_tokens'] / rows[1]['output_tokens']:.1f}x lower with hybrid tables")
+    return rows
+
+def benchmark_page_router(image_paths: List[str], latency: float) -> List[Dict[str, Any]]:
+    """Pages per minute with every page on the Gemini pipeline vs clean printed pages routed to local OCR"""
+    rows = []
+    for label, routed in [("gemini", False), ("routed", True)]:
+        router = pdf_to_json.PageRouter(pdf_to_json.HybridTableEngine(reader=FakeOCRReader(low_confidence_rate=0.0))) if routed else None
+        backend = FakeGeminiBackend(latency=latency, quota_per_minute=100000)
+        result = run_fake_document(image_paths, backend, calls_per_minute=100000, router=router)
+        routes = router.summary()["routes"] if router else {"gemini": {"pages": result["pages"], "pages_per_minute": None, "avg_seconds": None}}
+        rows.append({
+            "mode": label,
+            "calls": result["calls"],
+            "seconds": result["seconds"],
+            "pages_per_minute": result["pages_per_minute"],
+            "routes": routes
+        })
+
+    print(f"\n{'mode':<6} | {'calls':>5} | {'seconds':>7} | {'pages/min':>9} | routes")
+    print("-" * 90)
+    for row in rows:
+        routes = ", ".join(f"{route}: {stats['pages']} pages" + (f" at {stats['pages_per_minute']} pages/min ({stats['avg_seconds']}s each)" if stats["avg_seconds"] is not None else "")
+                           for route, stats in sorted(row["routes"].items()))
+        print(f"{row['mode']:<6} | {row['calls']:>5} | {row['seconds']:>7.2f} | {row['pages_per_minute']:>9.1f} | {routes}")
+    print(f"{rows[0]['calls'] - rows[1]['calls']} model calls saved, throughput {rows[1]['pages_per_minute'] / rows[0]['pages_per_minute']:.1f}x with page routing")
+    return rows
+
+def benchmark_page_crop(folder: str, count: int, latency: float) -> List[Dict[str, Any]]:
+    """Pixels and bytes sent for full scans (margins plus a dark scanner edge) vs pages cropped to their content"""
+    os.makedirs(os.path.join(folder, "full"))
+    os.makedirs(os.path.join(folder, "cropped"))
+    full_paths = make_fake_pages(os.path.join(folder, "full"), count, ruled=True)
+    cropped_paths = []
+    for path in full_paths:
+        # Scanned paper is never pure white: add grain and a dark scanner edge
+        pixels = np.asarray(Image.open(path).convert("L"), dtype=np.int16)
+        grain = np.random.default_rng(len(cropped_paths)).normal(0, 6, pixels.shape)
+        image = Image.fromarray(np.clip(pixels - 10 + grain, 0, 255).astype(np.uint8)).convert("RGB")
+        ImageDraw.Draw(image).rectangle([(0, 0), (image.width - 1, 14)], fill="#333333")
+        image.save(path, "JPEG", quality=95)
+        cropped, crop = pdf_to_json.crop_to_content(image)
+        cropped_path = os.path.join(folder, "cropped", os.path.basename(path))
+        cropped.save(cropped_path, "JPEG", quality=95)
+        cropped_paths.append(cropped_path)
+        # The crop offsets must map the cropped table back onto the drawn one
+        xs, ys = fake_page_grids[path]
+        assert crop is not None and abs(crop["offset_x"] + CROP_PADDING - xs[0]) <= 2 and abs(crop["offset_y"] + CROP_PADDING - ys[0]) <= 2
+
+    rows = []
+    for label, paths in [("full page", full_paths), ("cropped", cropped_paths)]:
+        backend = FakeGeminiBackend(latency=latency, quota_per_minute=100000)
+        result = run_fake_document(paths, backend, calls_per_minute=100000)
+        rows.append({
+            "mode": label,
+            "pixels": result["image_pixels"] / result["pages"],
+            "bytes": result["image_bytes"] / result["pages"],
+            "seconds": result["seconds"]
+        })
+
+    print(f"\n{'mode':<9} | {'image px/page':>13} | {'image bytes/page':>16} | {'seconds':>7}")
+    print("-" * 55)
+    for row in rows:
+        print(f"{row['mode']:<9} | {row['pixels']:>13.0f} | {row['bytes']:>16.0f} | {row['seconds']:>7.2f}")
+    print(f"Cropping sends {100 * (1 - rows[1]['pixels'] / rows[0]['pixels']):.1f}% fewer pixels and {100 * (1 - rows[1]['bytes'] / rows[0]['bytes']):.1f}% fewer bytes")
+    return rows
+
+def benchmark_presets(folder: str, count: int, latency: float) -> List[Dict[str, Any]]:
+    """Pages per minute, page bytes and model cost of each preset; pages are rendered at the preset's DPI and JPEG quality"""
+    rows = []
+    for name, preset in pdf_to_json.PRESETS.items():
+        preset_folder = os.path.join(folder, name)
+        os.makedirs(preset_folder)
+        image_paths = make_fake_pages(preset_folder, count, ruled=True)
+        for path in image_paths:
+            image = Image.open(path)
+            image = image.resize((image.width * preset.dpi // 100, image.height * preset.dpi // 100))
+            image.save(path, "JPEG", quality=preset.jpeg_quality)
+
+        backend = FakeGeminiBackend(latency=latency, quota_per_minute=100000, tail_probability=0.05, tail_latency=6 * latency)
+        result = run_fake_document(image_paths, backend, calls_per_minute=100000, max_workers=preset.max_workers,
+                                   routing=preset.routing, verify=preset.verify, hedge=preset.hedge)
+        cost = sum(usage["input_tokens"] * MODEL_PRICES[usage["model"]][0] + usage["output_tokens"] * MODEL_PRICES[usage["model"]][1]
+                   for usage in result["stats"]["models"]) / 1e6
+        rows.append({
+            "preset": name,
+            "pages_per_minute": result["pages_per_minute"],
+            "calls": result["calls"] / result["pages"],
+            "page_kb": sum(os.path.getsize(path) for path in image_paths) / len(image_paths) / 1024,
+            "cost_per_1000_pages": cost / result["pages"] * 1000
+        })
+
+    print(f"\n{'preset':<9} | {'pages/min':>9} | {'calls/page':>10} | {'page KB':>7} | {'USD/1000 pages':>14}")
+    print("-" * 62)
+    for row in rows:
+        print(f"{row['preset']:<9} | {row['pages_per_minute']:>9.1f} | {row['calls']:>10.1f} | {row['page_kb']:>7.0f} | {row['cost_per_1000_pages']:>14.3f}")
+    return rows
+
+def benchmark_batch_mode(folder: str, documents: int, pages_per_document: int, latency: float, calls_per_minute: int,
+                         max_requests: int = 8) -> List[Dict[str, Any]]:
+    """A month-end backlog through the interactive pipeline under a per-minute quota vs one batch job per stage"""
+    document_pages = {}
+    for document in range(documents):
+        document_folder = os.path.join(folder, f"document_{document + 1}")
+        os.makedirs(document_folder)
+        document_pages[f"document_{document + 1}.pdf"] = make_fake_pages(document_folder, pages_per_document)
+
+    backend = FakeGeminiBackend(latency=latency, quota_per_minute=calls_per_minute)
+    start_time = time.time()
+    interactive_tables = []
+    for image_paths in document_pages.values():
+        interactive_tables.append(run_fake_document(image_paths, backend, calls_per_minute=calls_per_minute)["tables"])
+    interactive = {"mode": "interactive", "seconds": time.time() - start_time, "jobs": "-", "requests": backend.calls, "quota_errors": backend.quota_errors}
+
+    server = FakeBatchServer(FakeGeminiBackend(latency=latency), job_seconds=1.0)
+    try:
+        client = batch_mode.GeminiBatchClient("fake-batch-key", server.base_url)
+        start_time = time.time()
+        outputs = batch_mode.process_pages_in_batch(document_pages, folder, client=client, poll_seconds=0.2, max_requests=max_requests)
+        batch = {"mode": "batch", "seconds": time.time() - start_time, "jobs": len(server.jobs), "requests": server.requests, "quota_errors": 0,
+                 "image_bytes": server.image_bytes, "job_file_bytes": server.job_file_bytes, "files_left": len(server.files) - len(server.jobs)}
+    finally:
+        server.close()
+
+    batch_tables = [[page["content"].get("tables") for page in output["pages"]] for output in outputs.values()]
+    matched = sum(1 for a, b in zip(interactive_tables, batch_tables) if a == b)
+
+    rows = [interactive, batch]
+    print(f"\n{'mode':<11} | {'seconds':>7} | {'jobs':>4} | {'requests':>8} | {'quota errors':>12}")
+    print("-" * 55)
+    for row in rows:
+        print(f"{row['mode']:<11} | {row['seconds']:>7.2f} | {row['jobs']:>4} | {row['requests']:>8} | {row['quota_errors']:>12}")
+    print(f"{len(document_pages)} documents x {pages_per_document} pages; batch output matched the interactive output for {matched}/{len(document_pages)} documents")
+    print(f"Batch uploads: {batch['image_bytes'] / 1e6:.2f} MB of page images (once per page), {batch['job_file_bytes'] / 1e6:.3f} MB of job files "
+          f"in jobs of at most {max_requests} requests; {batch['files_left']} uploaded files left")
+    return rows
+
+def benchmark_speculative_extraction(image_paths: List[str], latency: float, generic_failure_rate: float = 0.2) -> List[Dict[str, Any]]:
+    """Per-page latency and calls with analysis then extraction vs analysis and a generic extraction in parallel"""
+    rows = []
+    for label, speculative in [("sequential", False), ("speculative", True)]:
+        reset_pipeline_state()
+        backend = FakeGeminiBackend(latency=latency, quota_per_minute=100000, generic_failure_rate=generic_failure_rate)
+        pdf_to_json.configure_api_keys(["fake-key-1"], 100000, backend)
+        page_seconds = []
+
+        def process(image_path: str):
+            start_time = time.time()
+            pdf_to_json.process_single_page_with_timeout(image_path, speculative=speculative)
+            page_seconds.append(time.time() - start_time)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(process, image_paths))
+        ordered = sorted(page_seconds)
+        rows.append({
+            "mode": label,
+            "p50": ordered[len(ordered) // 2],
+            "max": ordered[-1],
+            "calls": backend.calls / len(image_paths),
+            "speculation": pdf_to_json.call_stats.summary()["speculation"]
+        })
+
+    print(f"\n{'mode':<11} | {'p50 page (s)':>12} | {'max page (s)':>12} | {'calls/page':>10} | speculation")
+    print("-" * 80)
+    for row in rows:
+        speculation = (f"{row['speculation']['accepted']} used, {row['speculation']['rejected']} redone, "
+                       f"{row['speculation']['unused_analyses']} analyses paid for but unused") if row["mode"] == "speculative" else "-"
+        print(f"{row['mode']:<11} | {row['p50']:>12.2f} | {row['max']:>12.2f} | {row['calls']:>10.2f} | {speculation}")
+    return rows
+
+def indian_grouping(number: int) -> str:
+    """12345678 -> 1,23,45,678 (lakh/crore grouping as printed on IOCL forms)"""
+    digits = str(number)
+    head, groups = digits[:-3], [digits[-3:]]
+    while head:
+        groups.insert(0, head[-2:])
+        head = head[:-2]
+    return ",".join(groups)
+
+def make_fake_document_json(path: str, pages: int, rows_per_page: int, seed: int = 0) -> str:
+    """An extracted-JSON document of ledger pages shaped like the pipeline's output, for the Excel writer benchmarks"""
+    rng = random.Random(seed)
+    headers = ["S.No", "Date", "Description", "Quantity", "Rate", "Amount (Rs.)", "Remarks"]
+    document_pages = []
+    for page_number in range(1, pages + 1):
+        data = []
+        for row in range(rows_per_page):
+            data.append([
+                str(row + 1),
+                f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024",
+                rng.choice(["Diesel HSD", "Lube oil", "Transport", "Pipeline maintenance", "Tank cleaning"]),
+                str(rng.randint(1, 500)),
+                f"{rng.uniform(10, 999):.2f}",
+                f"{indian_grouping(rng.randint(100, 10000000))}.00",
+                rng.choice(["", "", "Signature detected", "verified"])
+            ])
+        document_pages.append({
+            "page_number": page_number,
+            "content": {
+                "document_type": "ledger",
+                "page_metadata": {"page_number": str(page_number), "header": "Indian Oil Corporation Limited", "footer": ""},
+                "sections": [{"section_type": "form", "section_title": "Voucher", "content": {"Voucher No": f"V-{page_number:05d}", "Checked by": "Signature detected"}}],
+                "tables": [{"table_title": "Stock Ledger", "headers": headers, "data": data}],
+                "key_value_pairs": {"Location": "Panipat Refinery", "Period": "March 2024"}
+            }
+        })
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"document_name": "ledger.pdf", "pages": document_pages}, f)
+    return path
+
+def measure(function, *args, repeat: int = 3, **kwargs) -> Dict[str, float]:
+    """Best wall time of a few calls, and peak traced Python memory of one more (tracing slows it down several times)"""
+    seconds = float("inf")
+    for _ in range(repeat):
+        start_time = time.time()
+        function(*args, **kwargs)
+        seconds = min(seconds, time.time() - start_time)
+    tracemalloc.start()
+    function(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": seconds, "peak_mb": peak / 1024 / 1024}
+
+def benchmark_excel_writers(folder: str, pages: int, rows_per_page: int) -> List[Dict[str, Any]]:
+    """Time and peak memory of converting one extracted document to xlsx with each writer backend"""
+    json_path = make_fake_document_json(os.path.join(folder, "ledger.json"), pages, rows_per_page)
+
+    rows = []
+    for backend in json_to_excel.WRITER_BACKENDS:
+        excel_path = os.path.join(folder, f"ledger_{backend}.xlsx")
+        result = measure(json_to_excel.convert_json_to_excel, json_path, excel_path, backend=backend)
+        result.update({"writer": backend, "kb": os.path.getsize(excel_path) / 1024})
+        rows.append(result)
+
+    print(f"\n{pages} pages x {rows_per_page} rows")
+    print(f"{'writer':<10} | {'seconds':>7} | {'rows/s':>8} | {'peak MB':>7} | {'file KB':>7}")
+    print("-" * 52)
+    for row in rows:
+        print(f"{row['writer']:<10} | {row['seconds']:>7.2f} | {pages * rows_per_page / row['seconds']:>8.0f} | {row['peak_mb']:>7.1f} | {row['kb']:>7.0f}")
+    return rows
+
+def load_json(path: str):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def benchmark_excel_input(folder: str, pages: int, rows_per_page: int) -> List[Dict[str, Any]]:
+    """Peak memory of the streaming writer as the document grows, against loading the whole JSON tree up front"""
+    rows = []
+    for scale in (1, 2, 4):
+        json_path = make_fake_document_json(os.path.join(folder, f"ledger_{scale}.json"), pages * scale, rows_per_page)
+        streaming = measure(json_to_excel.convert_json_to_excel, json_path, os.path.join(folder, f"ledger_{scale}.xlsx"), repeat=1, backend="streaming")
+        full_load = measure(load_json, json_path, repeat=1)
+        rows.append({
+            "pages": pages * scale,
+            "json_mb": os.path.getsize(json_path) / 1024 / 1024,
+            "json_load_mb": full_load["peak_mb"],
+            "streaming_mb": streaming["peak_mb"],
+            "seconds": streaming["seconds"]
+        })
+
+    print(f"\n{'pages':>5} | {'JSON MB':>7} | {'json.load peak MB':>17} | {'streaming peak MB':>17} | {'seconds':>7}")
+    print("-" * 68)
+    for row in rows:
+        print(f"{row['pages']:>5} | {row['json_mb']:>7.1f} | {row['json_load_mb']:>17.1f} | {row['streaming_mb']:>17.1f} | {row['seconds']:>7.2f}")
+    return rows
+
+def benchmark_parallel_sheets(folder: str, pages: int, rows_per_page: int, process_counts: List[int]) -> List[Dict[str, Any]]:
+    """Wall time of the parallel sheet backend by worker process count, against the single-threaded openpyxl writer"""
+    json_path = make_fake_document_json(os.path.join(folder, "ledger.json"), pages, rows_per_page)
+    runs = [("openpyxl", "openpyxl", None)] + [(f"parallel x{count}", "parallel", count) for count in process_counts]
+
+    rows = []
+    for label, backend, processes in runs:
+        if processes:
+            json_to_excel.EXCEL_WRITER_PROCESSES = processes
+        start_time = time.time()
+        json_to_excel.convert_json_to_excel(json_path, os.path.join(folder, "ledger.xlsx"), backend=backend)
+        rows.append({"writer": label, "seconds": time.time() - start_time})
+
+    print(f"\n{pages} pages x {rows_per_page} rows on {os.cpu_count()} cores")
+    print(f"{'writer':<12} | {'seconds':>7} | {'rows/s':>8} | {'speedup':>7}")
+    print("-" * 44)
+    for row in rows:
+        print(f"{row['writer']:<12} | {row['seconds']:>7.2f} | {pages * rows_per_page / row['seconds']:>8.0f} | {rows[0]['seconds'] / row['seconds']:>6.1f}x")
+    return rows
+
+def benchmark_type_inference(folder: str, pages: int, rows_per_page: int) -> List[Dict[str, Any]]:
+    """Cost of typing table cells (numbers, Indian-format amounts, dates): the typing pass alone and end to end per backend"""
+    json_path = make_fake_document_json(os.path.join(folder, "ledger.json"), pages, rows_per_page)
+    tables = [table["data"] for page in load_json(json_path)["pages"] for table in page["content"]["tables"]]
+    cells = sum(len(row) for data in tables for row in data)
+
+    start_time = time.time()
+    typed_cells = 0
+    for data in tables:
+        typed, kinds = cell_types.type_rows(data)
+        typed_cells += sum(1 for row in typed for value in row if not isinstance(value, str) and value is not None)
+    typing_seconds = time.time() - start_time
+
+    rows = []
+    for backend in ("openpyxl", "xlsxwriter", "parallel"):
+        timings = {}
+        for infer_types in (False, True):
+            start_time = time.time()
+            json_to_excel.convert_json_to_excel(json_path, os.path.join(folder, "ledger.xlsx"), backend=backend, infer_types=infer_types)
+            timings[infer_types] = time.time() - start_time
+        rows.append({"writer": backend, "text_seconds": timings[False], "typed_seconds": timings[True]})
+
+    print(f"\n{cells} cells: typing pass {typing_seconds:.2f}s ({cells / typing_seconds:.0f} cells/s), {typed_cells} cells became numbers or dates")
+    print(f"{'writer':<10} | {'text (s)':>8} | {'typed (s)':>9} | {'overhead':>8}")
+    print("-" * 45)
+    for row in rows:
+        print(f"{row['writer']:<10} | {row['text_seconds']:>8.2f} | {row['typed_seconds']:>9.2f} | {100 * (row['typed_seconds'] / row['text_seconds'] - 1):>7.0f}%")
+    return rows
+
+def benchmark_parquet_export(folder: str, pages: int, rows_per_page: int) -> List[Dict[str, Any]]:
+    """Write and load times of the Parquet table export against the xlsx workbook, for analytics loads"""
+    json_path = make_fake_document_json(os.path.join(folder, "ledger.json"), pages, rows_per_page)
+    excel_path = os.path.join(folder, "ledger.xlsx")
+    parquet_path = os.path.join(folder, "ledger.parquet")
+
+    rows = []
+    for name, write, read in [
+        ("xlsx", lambda: json_to_excel.convert_json_to_excel(json_path, excel_path, backend="parallel"),
+         lambda: pd.read_excel(excel_path, sheet_name=None, header=None)),
+        ("parquet", lambda: json_to_parquet.convert_json_to_parquet(json_path, parquet_path),
+         lambda: pd.read_parquet(parquet_path)),
+    ]:
+        write_seconds = measure(write, repeat=1)["seconds"]
+        path = excel_path if name == "xlsx" else parquet_path
+        rows.append({"format": name, "write_seconds": write_seconds, "load_seconds": measure(read)["seconds"],
+                     "megabytes": os.path.getsize(path) / 1e6})
+
+    print(f"\n{pages} pages x {rows_per_page} rows")
+    print(f"{'format':<8} | {'write (s)':>9} | {'load (s)':>8} | {'size (MB)':>9}")
+    print("-" * 45)
+    for row in rows:
+        print(f"{row['format']:<8} | {row['write_seconds']:>9.2f} | {row['load_seconds']:>8.3f} | {row['megabytes']:>9.2f}")
+    return rows
+
+def benchmark_autofit(folder: str, pages: int, rows_per_page: int) -> List[Dict[str, Any]]:
+    """Column autofit on the page sheets and on one table consolidated from all pages, against a per-cell loop"""
+    json_path = make_fake_document_json(os.path.join(folder, "ledger.json"), pages, rows_per_page)
+    page_contents = [page["content"] for page in load_json(json_path)["pages"]]
+    consolidator = json_to_excel.TableConsolidator()
+    for page_number, page_content in enumerate(page_contents, 1):
+        consolidator.add_page(page_number, page_content)
+    _, _, consolidated = next(consolidator.tables())
+
+    def cell_loop(df):
+        widths = {}
+        for row in [list(df.columns)] + df.to_numpy(dtype=object).tolist():
+            for col_idx, value in enumerate(row, 1):
+                widths[col_idx] = max(widths.get(col_idx, 0), len("" if value is None else str(value)))
+        return widths
+
+    sample_rows = json_to_excel.AUTOFIT_SAMPLE_ROWS
+    rows = [{"case": f"{pages} page sheets", "seconds": measure(lambda: [json_to_excel.page_column_widths(c) for c in page_contents])["seconds"]},
+            {"case": f"{len(consolidated)}-row table, cell loop", "seconds": measure(cell_loop, consolidated)["seconds"]}]
+    json_to_excel.AUTOFIT_SAMPLE_ROWS = len(consolidated)
+    rows.append({"case": f"{len(consolidated)}-row table, all rows", "seconds": measure(json_to_excel.consolidated_column_widths, consolidated)["seconds"]})
+    json_to_excel.AUTOFIT_SAMPLE_ROWS = sample_rows
+    rows.append({"case": f"{len(consolidated)}-row table, sampled", "seconds": measure(json_to_excel.consolidated_column_widths, consolidated)["seconds"]})
+
+    print(f"\n{'case':<32} | {'seconds':>8}")
+    print("-" * 43)
+    for row in rows:
+        print(f"{row['case']:<32} | {row['seconds']:>8.3f}")
+    return rows
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the PDF to JSON pipeline against a fake Gemini backend")
+    parser.add_argument("--pages", type=int, default=12, help="Number of synthetic pages")
+    parser.add_argument("--keys", default="1,2,4", help="Comma-separated API key pool sizes to compare")
+    parser.add_argument("--calls-per-minute", type=int, default=120, help="Quota per fake key")
+    parser.add_argument("--latency", type=float, default=0.1, help="Mean fake call latency in seconds")
+    parser.add_argument("--processes", default="1,2,4", help="Comma-separated worker process counts for the parallel sheet benchmark")
+    parser.add_argument("--rows", type=int, default=1000, help="Table rows per page for the Excel writer benchmark")
+    parser.add_argument("--scenario", choices=["keys", "uploads", "streaming", "table-format", "templates", "hybrid", "router", "crop", "presets", "batch", "speculative", "excel", "excel-input", "excel-parallel", "excel-types", "parquet", "autofit"], default="keys", help="Which benchmark to run")
+
+    args = parser.parse_args()
+
+    pdf_to_json.logger.setLevel(logging.WARNING)
+    json_to_excel.logger.setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as folder:
+        if args.scenario == "excel":
+            benchmark_excel_writers(folder, args.pages, args.rows)
+            return
+        if args.scenario == "excel-input":
+            benchmark_excel_input(folder, args.pages, args.rows)
+            return
+        if args.scenario == "autofit":
+            benchmark_autofit(folder, args.pages, args.rows)
+            return
+        if args.scenario == "parquet":
+            benchmark_parquet_export(folder, args.pages, args.rows)
+            return
+        if args.scenario == "excel-types":
+            benchmark_type_inference(folder, args.pages, args.rows)
+            return
+        if args.scenario == "excel-parallel":
+            benchmark_parallel_sheets(folder, args.pages, args.rows, [int(p) for p in args.processes.split(",")])
+            return
+        if args.scenario == "crop":
+            benchmark_page_crop(folder, args.pages, args.latency)
+            return
+        if args.scenario == "presets":
+            benchmark_presets(folder, args.pages, args.latency)
+            return
+        if args.scenario == "batch":
+            benchmark_batch_mode(folder, 5, args.pages, args.latency, args.calls_per_minute)
+            return
+        image_paths = make_fake_pages(folder, args.pages, ruled=args.scenario in ("templates", "hybrid", "router"),
+                                      unsigned_share=0.5 if args.scenario == "router" else 0.0)
+        if args.scenario == "keys":
+            benchmark_key_scaling(image_paths, [int(k) for k in args.keys.split(",")], args.calls_per_minute, args.latency)
+        elif args.scenario == "uploads":
+            benchmark_page_uploads(image_paths, args.latency, int(args.keys.split(",")[0]))
+        elif args.scenario == "streaming":
+            benchmark_row_streaming(image_paths, args.latency)
+        elif args.scenario == "table-format":
+            benchmark_table_format(image_paths, args.latency)
+        elif args.scenario == "templates":
+            benchmark_layout_templates(image_paths, args.latency)
+        elif args.scenario == "hybrid":
+            benchmark_hybrid_tables(image_paths, args.latency)
+        elif args.scenario == "speculative":
+            benchmark_speculative_extraction(image_paths, args.latency)
+        elif args.scenario == "router":
+            benchmark_page_router(image_paths, args.latency)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+NUMBER = "number"
+INDIAN_NUMBER = "indian_number"
+DATE = "date"
+
+# A column is typed when at least this share of its non-empty cells convert; the cells that don't stay text
+MIN_TYPED_SHARE = 0.8
+# Longer digit runs are account, consumer or serial numbers; Excel would round them past 15 digits
+MAX_DIGITS = 15
+
+# Rupee prefixes and the "/-" written after amounts on Indian forms
+CURRENCY_MARKS = r"^(?:₹|rs\.?|inr)\s*|\s*/-$"
+PLAIN_NUMBER = r"[-+]?(?:0|[1-9]\d*)(?:\.\d+)?"
+WESTERN_NUMBER = r"[-+]?\d{1,3}(?:,\d{3})+(?:\.\d+)?"
+# 1,23,45,678.00: thousands, then groups of two (lakh, crore)
+INDIAN_GROUPED = r"[-+]?\d{1,2}(?:,\d{2})*,\d{3}(?:\.\d+)?"
+DATE_PATTERN = r"\d{1,2}[/.-]\d{1,2}[/.-](?:\d{4}|\d{2})"
+DATE_FORMATS = ["%d/%m/%Y", "%d/%m/%y"]
+
+def parse_numbers(text: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """Numbers parsed from cleaned cell text (NaN where it isn't one), and the mask of cells written with lakh/crore grouping"""
+    plain = text.str.fullmatch(PLAIN_NUMBER)
+    western = text.str.fullmatch(WESTERN_NUMBER)
+    indian = text.str.fullmatch(INDIAN_GROUPED) & ~western
+    digits = text.str.count(r"\d")
+    candidates = (plain | western | indian) & (digits <= MAX_DIGITS)
+    numbers = pd.to_numeric(text.where(candidates).str.replace(",", "", regex=False), errors="coerce")
+    return numbers, indian & candidates
+
+def parse_dates(text: pd.Series) -> pd.Series:
+    """Day-first dates (dd/mm/yyyy, dd-mm-yy, dd.mm.yyyy) parsed from cell text, NaT where it isn't one"""
+    shaped = text.str.fullmatch(DATE_PATTERN, na=False)
+    dates = pd.Series(pd.NaT, index=text.index, dtype="datetime64[ns]")
+    if not shaped.any():
+        return dates
+    normalized = text.where(shaped).str.replace(r"[.-]", "/", regex=True)
+    for date_format in DATE_FORMATS:
+        missing = dates.isna() & normalized.notna()
+        if not missing.any():
+            break
+        dates[missing] = pd.to_datetime(normalized[missing], format=date_format, errors="coerce")
+    return dates
+
+def infer_column(values: pd.Series) -> Tuple[pd.Series, Optional[str]]:
+    """Native numbers or dates for a column of extracted cell text, with the column's kind; cells that fail to convert
+    (a signature note, a stray word) keep their text, and a column that is mostly text is returned unchanged"""
+    present = values.notna() & (values.astype(str).str.strip() != "")
+    count = int(present.sum())
+    if not count:
+        return values, None
+    text = values.where(present).astype(str).str.strip()
+
+    # Cheap shape checks first, so free-text columns skip the conversions entirely
+    if text.str.count(r"\d").sum() < MIN_TYPED_SHARE * count:
+        return values, None
+
+    dates = parse_dates(text)
+    if dates.notna().sum() >= MIN_TYPED_SHARE * count:
+        typed = values.astype(object).copy()
+        mask = dates.notna()
+        # Timestamps are datetimes, so every writer backend takes them as dates
+        typed[mask] = dates[mask].astype(object)
+        return typed, DATE
+
+    numbers, indian = parse_numbers(text.str.replace(CURRENCY_MARKS, "", case=False, regex=True))
+    mask = numbers.notna()
+    if mask.sum() < MIN_TYPED_SHARE * count:
+        return values, None
+
+    typed = values.astype(object).copy()
+    converted = numbers[mask]
+    integral = (converted % 1 == 0) & (converted.abs() < 2 ** 53)
+    typed[mask] = converted.astype(object)
+    typed[converted.index[integral]] = converted[integral].astype(np.int64).astype(object)
+    return typed, INDIAN_NUMBER if indian[mask].sum() * 2 >= mask.sum() else NUMBER
+
+def infer_table_types(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[Any, Optional[str]]]:
+    """Type every column of a table; returns the typed table (object columns) and each column's kind by position"""
+    typed = df.astype(object).copy()
+    kinds = {}
+    for position in range(df.shape[1]):
+        column, kind = infer_column(df.iloc[:, position])
+        typed.iloc[:, position] = column
+        kinds[position] = kind
+    return typed, kinds
+
+def type_rows(rows: List[List[Any]]) -> Tuple[List[List[Any]], Dict[int, Optional[str]]]:
+    """Typed copies of ragged table rows (each keeps its own length) and the kind of each column by position"""
+    width = max((len(row) for row in rows), default=0)
+    if not width:
+        return rows, {}
+    df = pd.DataFrame([list(row) + [None] * (width - len(row)) for row in rows], dtype=object)
+    typed, kinds = infer_table_types(df)
+    typed_rows = typed.where(typed.notna(), None).values.tolist()
+    return [typed_row[:len(row)] for typed_row, row in zip(typed_rows, rows)], kinds
@@ -0,0 +1,241 @@
+import os
+import re
+import json
+import bisect
+import logging
+from threading import Lock
+from typing import List, Dict, Any, Optional
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw
+
+try:
+    from .layout_templates import find_grid_lines
+except ImportError:
+    from layout_templates import find_grid_lines
+
+logger = logging.getLogger(__name__)
+
+# Cells read locally below this confidence, or inked but without any text, are read by the model instead
+CONFIDENCE_THRESHOLD = float(os.getenv('OCR_CONFIDENCE_THRESHOLD', '0.85'))
+INK_THRESHOLD = 0.01
+# Pixels trimmed from each side of a cell so its ruling lines don't count as ink
+CELL_MARGIN = 4
+# Any inked cell in these columns holds handwriting (names, signatures) and goes to the model
+HANDWRITTEN_COLUMNS = re.compile(r"sign|signature|name|initial", re.IGNORECASE)
+
+SHEET_LABEL_WIDTH = 48
+SHEET_GAP = 6
+
+CELL_PROMPT = """
+        The image shows numbered crops of table cells from a scanned form, one below the other, each labelled with its number on the left.
+        Read each crop exactly as written, preserving numbers, dates and punctuation.
+        If a crop contains a signature rather than readable text, answer "Signature detected".
+        If a crop is blank, answer "".
+        Return ONLY a JSON object mapping every crop number to its text, e.g. {"1": "...", "2": "..."}
+        """
+
+class PaddleOCRReader:
+    """Local OCR with PaddleOCR as in the trial scripts, returning text blocks with their bounds and confidence"""
+    def __init__(self, lang: str = 'en', use_gpu: bool = False):
+        from paddleocr import PaddleOCR
+        self.ocr = PaddleOCR(use_angle_cls=True, lang=lang, use_gpu=use_gpu, show_log=False)
+        self.lock = Lock()
+
+    def read(self, image_path: str) -> List[Dict[str, Any]]:
+        with self.lock:
+            result = self.ocr.ocr(image_path, cls=True)
+        if not result or not result[0]:
+            return []
+
+        blocks = []
+        for line in result[0]:
+            box = line[0]
+            text = line[1][0].strip()
+            if not text:
+                continue
+            x_coords = [p[0] for p in box]
+            y_coords = [p[1] for p in box]
+            blocks.append({
+                'text': text,
+                'confidence': float(line[1][1]),
+                'min_x': min(x_coords),
+                'max_x': max(x_coords),
+                'min_y': min(y_coords),
+                'max_y': max(y_coords)
+            })
+        return blocks
+
+class HybridPage:
+    """A ruled page read cell by cell; flagged cells still need the model"""
+    def __init__(self, image_path: str, image: np.ndarray, cells: List[List[Dict[str, Any]]], header: List[str], footer: List[str]):
+        self.image_path = image_path
+        self.image = image
+        self.cells = cells
+        self.header = header
+        self.footer = footer
+        self.flagged = [(r, c) for r, row in enumerate(cells) for c, cell in enumerate(row) if cell["flagged"]]
+        self._sheet = None
+
+    @property
+    def cell_count(self) -> int:
+        return sum(len(row) for row in self.cells)
+
+    @property
+    def page_pixels(self) -> int:
+        return self.image.shape[0] * self.image.shape[1]
+
+    def sheet(self) -> Image.Image:
+        """All flagged cells stacked into one labelled image, so they go to the model in a single request"""
+        if self._sheet is not None:
+            return self._sheet
+        crops = []
+        for r, c in self.flagged:
+            x0, y0, x1, y1 = self.cells[r][c]["box"]
+            crops.append(Image.fromarray(cv2.cvtColor(self.image[y0:y1, x0:x1], cv2.COLOR_BGR2RGB)))
+
+        width = SHEET_LABEL_WIDTH + max(crop.width for crop in crops)
+        height = sum(crop.height for crop in crops) + SHEET_GAP * (len(crops) + 1)
+        sheet = Image.new("RGB", (width, height), "white")
+        draw = ImageDraw.Draw(sheet)
+        y = SHEET_GAP
+        for number, crop in enumerate(crops, start=1):
+            draw.text((4, y + crop.height // 2 - 5), str(number), fill="black")
+            sheet.paste(crop, (SHEET_LABEL_WIDTH, y))
+            y += crop.height + SHEET_GAP
+        self._sheet = sheet
+        return sheet
+
+    def prompt(self) -> str:
+        return f"There are {len(self.flagged)} crops, numbered 1 to {len(self.flagged)}."
+
+    def structured_data(self, readings: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """The page in the extraction schema, with model readings filled into the flagged cells"""
+        readings = readings or {}
+        texts = [[cell["text"] for cell in row] for row in self.cells]
+        for number, (r, c) in enumerate(self.flagged, start=1):
+            reading = readings.get(str(number))
+            if isinstance(reading, str):
+                texts[r][c] = reading
+
+        return {
+            "document_type": "table",
+            "page_metadata": {
+                "page_number": "",
+                "header": " ".join(self.header),
+                "footer": " ".join(self.footer)
+            },
+            "sections": [],
+            "tables": [{
+                "table_title": "",
+                "headers": texts[0],
+                "data": texts[1:]
+            }],
+            "key_value_pairs": {}
+        }
+
+def parse_cell_readings(response_text: str) -> Dict[str, str]:
+    json_start = response_text.find('{')
+    json_end = response_text.rfind('}') + 1
+    if json_start < 0 or json_end <= json_start:
+        logger.error("No JSON found in cell reading response")
+        return {}
+    try:
+        readings = json.loads(response_text[json_start:json_end])
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid JSON in cell reading response: {e}")
+        return {}
+    return {str(key): str(value) for key, value in readings.items()} if isinstance(readings, dict) else {}
+
+class HybridTableEngine:
+    """Reads ruled tables with local OCR and leaves only uncertain or handwritten cells to the model"""
+    def __init__(self, reader=None, confidence_threshold: float = CONFIDENCE_THRESHOLD):
+        self.reader = reader
+        self.confidence_threshold = confidence_threshold
+        self.pages = 0
+        self.cells = 0
+        self.model_cells = 0
+        self.page_pixels = 0
+        self.model_pixels = 0
+        self.lock = Lock()
+
+    def _reader(self):
+        with self.lock:
+            if self.reader is None:
+                self.reader = PaddleOCRReader()
+            return self.reader
+
+    def read_blocks(self, image_path: str) -> List[Dict[str, Any]]:
+        """Text blocks of the whole page from the local OCR reader"""
+        return self._reader().read(image_path)
+
+    def read_page(self, image_path: str, blocks: Optional[List[Dict[str, Any]]] = None) -> Optional[HybridPage]:
+        """OCR a page cell by cell, or None if it has no ruled table with a header and at least one row.
+        Text blocks from an earlier OCR pass of the page can be passed in to skip reading it again."""
+        image = cv2.imread(image_path)
+        if image is None:
+            raise FileNotFoundError(f"Could not read image: {image_path}")
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        rows, columns = find_grid_lines(gray)
+        if len(rows) < 3 or len(columns) < 3:
+            return None
+
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        cells = []
+        for r in range(len(rows) - 1):
+            row = []
+            for c in range(len(columns) - 1):
+                x0, y0 = columns[c] + CELL_MARGIN, rows[r] + CELL_MARGIN
+                x1, y1 = max(columns[c + 1] - CELL_MARGIN, x0 + 1), max(rows[r + 1] - CELL_MARGIN, y0 + 1)
+                ink = float(np.count_nonzero(binary[y0:y1, x0:x1])) / ((x1 - x0) * (y1 - y0))
+                row.append({"text": "", "confidence": 1.0, "ink": ink, "box": (x0, y0, x1, y1), "flagged": False})
+            cells.append(row)
+
+        header, footer = [], []
+        if blocks is None:
+            blocks = self.read_blocks(image_path)
+        for block in sorted(blocks, key=lambda b: (b['min_y'], b['min_x'])):
+            center_x = (block['min_x'] + block['max_x']) / 2
+            center_y = (block['min_y'] + block['max_y']) / 2
+            r = bisect.bisect_right(rows, center_y) - 1
+            c = bisect.bisect_right(columns, center_x) - 1
+            if 0 <= r < len(cells) and 0 <= c < len(cells[r]):
+                cell = cells[r][c]
+                cell["text"] = f"{cell['text']} {block['text']}".strip()
+                cell["confidence"] = min(cell["confidence"], block['confidence'])
+            elif center_y < rows[0]:
+                header.append(block['text'])
+            else:
+                footer.append(block['text'])
+
+        handwritten = {c for c, cell in enumerate(cells[0]) if HANDWRITTEN_COLUMNS.search(cell["text"])}
+        for r, row in enumerate(cells):
+            for c, cell in enumerate(row):
+                inked = cell["ink"] > INK_THRESHOLD
+                cell["flagged"] = bool((cell["text"] and cell["confidence"] < self.confidence_threshold)
+                                       or (not cell["text"] and inked)
+                                       or (r > 0 and c in handwritten and inked))
+        return HybridPage(image_path, image, cells, header, footer)
+
+    def record(self, page: HybridPage):
+        sheet_pixels = page.sheet().width * page.sheet().height if page.flagged else 0
+        with self.lock:
+            self.pages += 1
+            self.cells += page.cell_count
+            self.model_cells += len(page.flagged)
+            self.page_pixels += page.page_pixels
+            self.model_pixels += sheet_pixels
+        logger.info(f"🧮 {os.path.basename(page.image_path)}: {page.cell_count - len(page.flagged)}/{page.cell_count} cells read locally, "
+                    f"{sheet_pixels} of {page.page_pixels} pixels sent to the model")
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "pages": self.pages,
+                "cells": self.cells,
+                "model_cells": self.model_cells,
+                "page_pixels": self.page_pixels,
+                "model_pixels": self.model_pixels,
+                "pixel_reduction": round(self.page_pixels / self.model_pixels, 1) if self.model_pixels else None
+            }
@@ -1,68 +1,196 @@
 import os
+import re
 import json
 import logging
-from typing import Dict, Any, List, Optional, Tuple
+from copy import copy
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple, Iterator, Iterable
+import numpy as np
 import pandas as pd
 from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.styles.borders import DEFAULT_BORDER
 from openpyxl.utils import get_column_letter
+from openpyxl.workbook.child import avoid_duplicate_name
 from openpyxl.worksheet.worksheet import Worksheet
 
+try:
+    from .xlsx_package import styles_xml, sheet_xml, stored_column_width, XlsxPackageWriter
+    from .cell_types import type_rows, infer_table_types, DATE, INDIAN_NUMBER
+except ImportError:
+    from xlsx_package import styles_xml, sheet_xml, stored_column_width, XlsxPackageWriter
+    from cell_types import type_rows, infer_table_types, DATE, INDIAN_NUMBER
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def convert_json_to_excel(json_file_path: str, excel_output_path: Optional[str] = None) -> str:
-    logger.info(f"Converting JSON file {json_file_path} to Excel")
-
-    if not excel_output_path:
-        base_name = os.path.splitext(os.path.basename(json_file_path))[0]
-        excel_output_path = f"{base_name}.xlsx"
-
+# Amounts shown with lakh/crore grouping (1,23,45,678.00) as on the source forms
+INDIAN_NUMBER_FORMAT = '[>=10000000]##\\,##\\,##\\,##0.00;[>=100000]##\\,##\\,##0.00;##,##0.00'
+
+# Every style the sheets use, independent of the writer backend
+STYLE_DEFINITIONS = {
+    "ocr_title": {"bold": True, "size": 14},
+    "ocr_header": {"bold": True, "size": 12, "fill": "DDEBF7", "border": True, "align": "center"},
+    "ocr_cell": {"border": True},
+    "ocr_cell_date": {"border": True, "number_format": "dd/mm/yyyy"},
+    "ocr_cell_indian": {"border": True, "number_format": INDIAN_NUMBER_FORMAT},
+    "ocr_key": {"bold": True}
+}
+
+# Column autofit: widths in characters, and the most table rows measured per sheet
+AUTOFIT_MIN_WIDTH = 10
+AUTOFIT_MAX_WIDTH = int(os.getenv('EXCEL_AUTOFIT_MAX_WIDTH', '60'))
+AUTOFIT_PADDING = 2
+AUTOFIT_SAMPLE_ROWS = 5000
+
+# Table cell style for each inferred column type
+COLUMN_KIND_STYLES = {DATE: "ocr_cell_date", INDIAN_NUMBER: "ocr_cell_indian"}
+
+# Write numeric, amount and date columns as native Excel values instead of text
+INFER_CELL_TYPES = os.getenv('EXCEL_INFER_TYPES', '1') != '0'
+
+def openpyxl_named_style(name: str, definition: Dict[str, Any]) -> NamedStyle:
+    # Start from the workbook defaults so unstyled attributes match plain cells
+    style = NamedStyle(name=name, font=copy(DEFAULT_FONT), border=copy(DEFAULT_BORDER))
+    if definition.get("bold") or definition.get("size"):
+        style.font = Font(bold=definition.get("bold", False), size=definition.get("size"))
+    if definition.get("fill"):
+        style.fill = PatternFill(start_color=definition["fill"], end_color=definition["fill"], fill_type="solid")
+    if definition.get("border"):
+        thin = Side(style='thin')
+        style.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    if definition.get("align"):
+        style.alignment = Alignment(horizontal=definition["align"])
+    if definition.get("number_format"):
+        style.number_format = definition["number_format"]
+    return style
+
+def typed_table_data(table: Dict[str, Any], infer_types: bool = True) -> Tuple[List[Any], List[str]]:
+    """A table's data rows, with numbers and dates converted when infer_types is set, and the cell style of each column"""
+    data = table.get("data", [])
+    if not infer_types or not data or not all(isinstance(row, list) for row in data):
+        return data, []
+    data, kinds = type_rows(data)
+    return data, [COLUMN_KIND_STYLES.get(kinds[position], "ocr_cell") for position in range(len(kinds))]
+
+class StyleRegistry:
+    """Named styles registered once per workbook and applied to cells by name"""
+    def __init__(self, wb: Workbook):
+        self.styles = {}
+        for name, definition in STYLE_DEFINITIONS.items():
+            if name in wb.named_styles:
+                style = next(s for s in wb._named_styles if s.name == name)
+            else:
+                style = openpyxl_named_style(name, definition)
+                wb.add_named_style(style)
+            self.styles[name] = style
+
+    def apply(self, cell, name: str):
+        # What assigning cell.style = name does, without looking the name up in the workbook on every cell (about
+        # twice as fast). _named_styles and _style are openpyxl internals, hence the version pin in requirements.txt
+        cell._style = copy(self.styles[name].as_tuple())
+
+# Characters read from the JSON file at a time; a page larger than this just takes a few more reads
+READ_CHUNK_SIZE = 1 << 16
+JSON_WHITESPACE = " \t\r\n"
+NUMBER_ENDS = ",]}" + JSON_WHITESPACE
+
+class IncrementalJSONReader:
+    """Reads a JSON document token by token from a file, decoding one value at a time with raw_decode,
+    so only the value being parsed (not the whole document) is held in memory"""
+    def __init__(self, f, chunk_size: int = READ_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _read_more(self, size: int) -> bool:
+        chunk = self.f.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """The next non-whitespace character, or "" at the end of the file"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in JSON_WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read_more(self.chunk_size):
+                return ""
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(f"Expecting one of {chars!r}", self.buffer, self.pos)
+        self.pos += 1
+        return char
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Usually the value continues past the buffer; read as much again so a large page costs few retries
+                if not self._read_more(max(self.chunk_size, len(self.buffer) - self.pos)):
+                    raise
+                continue
+            # A number is only complete once the character after it is in the buffer ("1.5" may be the start of "1.5e3")
+            if (isinstance(value, (int, float)) and not isinstance(value, bool) and not self.eof
+                    and (end == len(self.buffer) or self.buffer[end] not in NUMBER_ENDS) and self._read_more(self.chunk_size)):
+                continue
+            self.pos = end
+            return value
+
+def iter_json_array(reader: IncrementalJSONReader) -> Iterator[Any]:
+    reader.expect("[")
+    if reader.peek() == "]":
+        reader.expect("]")
+        return
+    while True:
+        yield reader.value()
+        if reader.expect(",]") == "]":
+            return
+
+def read_pages(json_file_path: str) -> Iterator[Dict[str, Any]]:
+    """Yield the entries of the document's "pages" array one at a time as they are parsed; other top-level keys are skipped"""
     try:
         with open(json_file_path, 'r', encoding='utf-8') as f:
-            doc_data = json.load(f)
-    except Exception as e:
+            reader = IncrementalJSONReader(f)
+            reader.expect("{")
+            if reader.peek() == "}":
+                return
+            while True:
+                key = reader.value()
+                reader.expect(":")
+                if key == "pages":
+                    yield from iter_json_array(reader)
+                else:
+                    reader.value()
+                if reader.expect(",}") == "}":
+                    return
+    except (OSError, json.JSONDecodeError) as e:
         logger.error(f"Error loading JSON file: {e}")
         raise
 
-    wb = Workbook()
-
-    default_sheet = wb.active
-    wb.remove(default_sheet)
-
-    for page in doc_data.get("pages", []):
-        page_number = page.get("page_number", 0)
-        page_content = page.get("content", {})
-
-        sheet_name = f"Page {page_number}"
-        ws = wb.create_sheet(title=sheet_name)
-
-        format_page_worksheet(ws, page_content, page_number)
-
-    try:
-        wb.save(excel_output_path)
-        logger.info(f"Excel file saved to {excel_output_path}")
-        return excel_output_path
-    except Exception as e:
-        logger.error(f"Error saving Excel file: {e}")
-        raise
-
-def format_page_worksheet(ws: Worksheet, page_content: Dict[str, Any], page_number: int) -> None:
-    header_font = Font(bold=True, size=12)
-    title_font = Font(bold=True, size=14)
-    header_fill = PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid")
-    border = Border(
-        left=Side(style='thin'), 
-        right=Side(style='thin'), 
-        top=Side(style='thin'), 
-        bottom=Side(style='thin')
-    )
+def format_page_worksheet(ws: Worksheet, page_content: Dict[str, Any], page_number: int, styles: Optional[StyleRegistry] = None,
+                          infer_types: bool = True) -> None:
+    styles = styles or StyleRegistry(ws.parent)
 
     document_type = page_content.get("document_type", "Unknown Document Type")
     page_metadata = page_content.get("page_metadata", {})
 
-    ws.cell(row=1, column=1, value=f"Document Type: {document_type}")
-    ws.cell(row=1, column=1).font = title_font
+    styles.apply(ws.cell(row=1, column=1, value=f"Document Type: {document_type}"), "ocr_title")
 
     if "header" in page_metadata and page_metadata["header"]:
         ws.cell(row=2, column=1, value=f"Header: {page_metadata['header']}")
@@ -76,28 +204,20 @@ def format_page_worksheet(ws: Worksheet, page_content: Dict[str, Any], page_numb
         for table_idx, table in enumerate(tables):
             table_title = table.get("table_title", f"Table {table_idx+1}")
             headers = table.get("headers", [])
-            data = table.get("data", [])
+            data, column_styles = typed_table_data(table, infer_types)
 
-            ws.cell(row=current_row, column=1, value=table_title)
-            ws.cell(row=current_row, column=1).font = title_font
+            styles.apply(ws.cell(row=current_row, column=1, value=table_title), "ocr_title")
             current_row += 1
 
             for col_idx, header in enumerate(headers, 1):
-                cell = ws.cell(row=current_row, column=col_idx, value=header)
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.border = border
-                cell.alignment = Alignment(horizontal='center')
-
-                col_letter = get_column_letter(col_idx)
-                ws.column_dimensions[col_letter].width = max(len(str(header)) + 2, 12)
+                styles.apply(ws.cell(row=current_row, column=col_idx, value=header), "ocr_header")
             
             current_row += 1
 
             for row_data in data:
                 for col_idx, cell_value in enumerate(row_data, 1):
-                    cell = ws.cell(row=current_row, column=col_idx, value=cell_value)
-                    cell.border = border
+                    style = column_styles[col_idx - 1] if column_styles else "ocr_cell"
+                    styles.apply(ws.cell(row=current_row, column=col_idx, value=cell_value), style)
                 
                 current_row += 1
 
@@ -113,8 +233,7 @@ def format_page_worksheet(ws: Worksheet, page_content: Dict[str, Any], page_numb
             if section_type == "table":
                 continue
 
-            ws.cell(row=current_row, column=1, value=section_title)
-            ws.cell(row=current_row, column=1).font = title_font
+            styles.apply(ws.cell(row=current_row, column=1, value=section_title), "ocr_title")
             current_row += 1
 
             if section_type == "text":
@@ -123,8 +242,7 @@ def format_page_worksheet(ws: Worksheet, page_content: Dict[str, Any], page_numb
             elif section_type == "form":
                 if isinstance(content, dict):
                     for key, value in content.items():
-                        ws.cell(row=current_row, column=1, value=key)
-                        ws.cell(row=current_row, column=1).font = Font(bold=True)
+                        styles.apply(ws.cell(row=current_row, column=1, value=key), "ocr_key")
                         ws.cell(row=current_row, column=2, value=value)
                         current_row += 1
                     current_row += 1
@@ -132,8 +250,7 @@ def format_page_worksheet(ws: Worksheet, page_content: Dict[str, Any], page_numb
                     for item in content:
                         if isinstance(item, dict):
                             for key, value in item.items():
-                                ws.cell(row=current_row, column=1, value=key)
-                                ws.cell(row=current_row, column=1).font = Font(bold=True)
+                                styles.apply(ws.cell(row=current_row, column=1, value=key), "ocr_key")
                                 ws.cell(row=current_row, column=2, value=value)
                                 current_row += 1
                     current_row += 1
@@ -143,33 +260,325 @@ def format_page_worksheet(ws: Worksheet, page_content: Dict[str, Any], page_numb
 
     key_value_pairs = page_content.get("key_value_pairs", {})
     if key_value_pairs:
-        ws.cell(row=current_row, column=1, value="Additional Information")
-        ws.cell(row=current_row, column=1).font = title_font
+        styles.apply(ws.cell(row=current_row, column=1, value="Additional Information"), "ocr_title")
         current_row += 1
         
         for key, value in key_value_pairs.items():
-            ws.cell(row=current_row, column=1, value=key)
-            ws.cell(row=current_row, column=1).font = Font(bold=True)
+            styles.apply(ws.cell(row=current_row, column=1, value=key), "ocr_key")
             ws.cell(row=current_row, column=2, value=value)
             current_row += 1
 
-    for col in range(1, 10):
-        col_letter = get_column_letter(col)
-        ws.column_dimensions[col_letter].width = 15
+    for col_idx, width in page_column_widths(page_content).items():
+        ws.column_dimensions[get_column_letter(col_idx)].width = stored_column_width(width)
+
+def page_layout_rows(page_content: Dict[str, Any], page_number: int, infer_types: bool = True) -> Iterator[List[Tuple[Any, Optional[str]]]]:
+    """The rows of a page sheet from the top, as (value, style name) cells, in the layout of format_page_worksheet"""
+    document_type = page_content.get("document_type", "Unknown Document Type")
+    page_metadata = page_content.get("page_metadata", {})
+
+    yield [(f"Document Type: {document_type}", "ocr_title")]
+    yield [(f"Header: {page_metadata['header']}", None)] if page_metadata.get("header") else []
+    yield [(f"Page: {page_number}", None)]
+    yield []
+
+    for table_idx, table in enumerate(page_content.get("tables", [])):
+        yield [(table.get("table_title", f"Table {table_idx+1}"), "ocr_title")]
+        yield [(header, "ocr_header") for header in table.get("headers", [])]
+        data, column_styles = typed_table_data(table, infer_types)
+        for row_data in data:
+            if column_styles:
+                yield list(zip(row_data, column_styles))
+            else:
+                yield [(cell_value, "ocr_cell") for cell_value in row_data]
+        yield []
+        yield []
+
+    for section_idx, section in enumerate(page_content.get("sections", [])):
+        section_type = section.get("section_type", "")
+        content = section.get("content", "")
+        if section_type == "table":
+            continue
+
+        yield [(section.get("section_title", f"Section {section_idx+1}"), "ocr_title")]
+        if section_type == "text":
+            yield [(content, None)]
+            yield []
+        elif section_type == "form" and isinstance(content, (dict, list)):
+            items = [content] if isinstance(content, dict) else [item for item in content if isinstance(item, dict)]
+            for item in items:
+                for key, value in item.items():
+                    yield [(key, "ocr_key"), (value, None)]
+            yield []
+        elif section_type == "chart":
+            yield [(f"Chart: {content}", None)]
+            yield []
+
+    key_value_pairs = page_content.get("key_value_pairs", {})
+    if key_value_pairs:
+        yield [("Additional Information", "ocr_title")]
+        for key, value in key_value_pairs.items():
+            yield [(key, "ocr_key"), (value, None)]
+
+def autofit_column_widths(rows: List[List[Any]], header_count: int = 0) -> Dict[int, float]:
+    """Width of each column fitting its longest text, measured in one sweep over all the cells. The first header_count
+    rows are always measured, the rest on a sample of AUTOFIT_SAMPLE_ROWS when there are more"""
+    body = rows[header_count:]
+    if len(body) > AUTOFIT_SAMPLE_ROWS:
+        picks = np.sort(np.random.default_rng(0).choice(len(body), AUTOFIT_SAMPLE_ROWS, replace=False))
+        rows = rows[:header_count] + [body[i] for i in picks]
+    if not rows:
+        return {}
+    # Ragged rows are padded with None, which measures as empty
+    cells = pd.DataFrame(rows, dtype=object)
+    if not cells.size:
+        return {}
+    lengths = pd.Series(cells.to_numpy().ravel()).fillna("").astype(str).str.len().to_numpy().reshape(cells.shape).max(axis=0)
+    return {col_idx: float(min(max(length + AUTOFIT_PADDING, AUTOFIT_MIN_WIDTH), AUTOFIT_MAX_WIDTH))
+            for col_idx, length in enumerate(lengths, 1)}
+
+def page_column_widths(page_content: Dict[str, Any]) -> Dict[int, float]:
+    """Autofit widths for a page sheet, from its table headers and cells and its key/value rows; titles and text
+    lines are left to overflow into the empty cells beside them"""
+    fixed_rows = []
+    data_rows = []
+    for table in page_content.get("tables", []):
+        fixed_rows.append(list(table.get("headers", [])))
+        data_rows.extend(row for row in table.get("data", []) if isinstance(row, list))
+
+    for section in page_content.get("sections", []):
+        content = section.get("content", "")
+        if section.get("section_type") == "form" and isinstance(content, (dict, list)):
+            items = [content] if isinstance(content, dict) else [item for item in content if isinstance(item, dict)]
+            fixed_rows.extend([key, value] for item in items for key, value in item.items())
+    fixed_rows.extend([key, value] for key, value in page_content.get("key_value_pairs", {}).items())
+
+    return autofit_column_widths(fixed_rows + data_rows, header_count=len(fixed_rows))
+
+def write_page_rows(ws, page_content: Dict[str, Any], page_number: int, styles: StyleRegistry, infer_types: bool = True) -> None:
+    """Append a page to a write-only worksheet one row at a time"""
+    write_rows(ws, page_layout_rows(page_content, page_number, infer_types), page_column_widths(page_content), styles)
+
+def write_rows(ws, rows: Iterable[List[Tuple[Any, Optional[str]]]], column_widths: Dict[int, float], styles: StyleRegistry) -> None:
+    """Append (value, style name) rows to a write-only worksheet; unstyled cells go in as plain values"""
+    for col_idx, width in column_widths.items():
+        ws.column_dimensions[get_column_letter(col_idx)].width = stored_column_width(width)
+
+    for row in rows:
+        cells = []
+        for value, style in row:
+            if style is None:
+                cells.append(value)
+                continue
+            cell = WriteOnlyCell(ws, value=value)
+            styles.apply(cell, style)
+            cells.append(cell)
+        ws.append(cells)
+
+def xlsxwriter_format_properties(definition: Dict[str, Any]) -> Dict[str, Any]:
+    """A style definition as XlsxWriter format properties"""
+    properties = {}
+    if definition.get("bold"):
+        properties["bold"] = True
+    if definition.get("size"):
+        properties["font_size"] = definition["size"]
+    if definition.get("fill"):
+        properties["pattern"] = 1
+        properties["bg_color"] = f"#{definition['fill']}"
+    if definition.get("border"):
+        properties["border"] = 1
+    if definition.get("align"):
+        properties["align"] = definition["align"]
+    if definition.get("number_format"):
+        properties["num_format"] = definition["number_format"]
+    return properties
+
+class WorkbookBackend:
+    """Writes sheets of (value, style name) rows into an xlsx file; subclasses wrap an xlsx library"""
+    def __init__(self, excel_output_path: str, infer_types: bool = True):
+        self.excel_output_path = excel_output_path
+        self.infer_types = infer_types
+        self.sheet_names = []
+
+    def unique_sheet_name(self, name: str) -> str:
+        """The name, numbered as openpyxl's create_sheet numbers it when a sheet of that name already exists"""
+        name = avoid_duplicate_name(self.sheet_names, name)
+        self.sheet_names.append(name)
+        return name
+
+    def write_page(self, page_number: int, page_content: Dict[str, Any]) -> None:
+        self.write_sheet(f"Page {page_number}", page_layout_rows(page_content, page_number, self.infer_types), page_column_widths(page_content))
+
+    def write_sheet(self, name: str, rows: Iterable[List[Tuple[Any, Optional[str]]]], column_widths: Dict[int, float]) -> None:
+        raise NotImplementedError
+
+    def save(self) -> None:
+        raise NotImplementedError
+
+class OpenpyxlBackend(WorkbookBackend):
+    """The whole workbook in memory, cells written in place by format_page_worksheet"""
+    def __init__(self, excel_output_path: str, infer_types: bool = True):
+        super().__init__(excel_output_path, infer_types)
+        self.wb = Workbook()
+        self.wb.remove(self.wb.active)
+        self.styles = StyleRegistry(self.wb)
+
+    def write_page(self, page_number: int, page_content: Dict[str, Any]) -> None:
+        ws = self.wb.create_sheet(title=self.unique_sheet_name(f"Page {page_number}"))
+        format_page_worksheet(ws, page_content, page_number, self.styles, self.infer_types)
+
+    def write_sheet(self, name: str, rows: Iterable[List[Tuple[Any, Optional[str]]]], column_widths: Dict[int, float]) -> None:
+        ws = self.wb.create_sheet(title=self.unique_sheet_name(name))
+        for row_idx, row in enumerate(rows, 1):
+            for col_idx, (value, style) in enumerate(row, 1):
+                cell = ws.cell(row=row_idx, column=col_idx, value=value)
+                if style:
+                    self.styles.apply(cell, style)
+        for col_idx, width in column_widths.items():
+            ws.column_dimensions[get_column_letter(col_idx)].width = stored_column_width(width)
+
+    def save(self) -> None:
+        self.wb.save(self.excel_output_path)
+
+class OpenpyxlStreamingBackend(WorkbookBackend):
+    """openpyxl write-only worksheets: rows are serialised as they are appended"""
+    def __init__(self, excel_output_path: str, infer_types: bool = True):
+        super().__init__(excel_output_path, infer_types)
+        self.wb = Workbook(write_only=True)
+        self.styles = StyleRegistry(self.wb)
+
+    def write_sheet(self, name: str, rows: Iterable[List[Tuple[Any, Optional[str]]]], column_widths: Dict[int, float]) -> None:
+        write_rows(self.wb.create_sheet(title=self.unique_sheet_name(name)), rows, column_widths, self.styles)
+
+    def save(self) -> None:
+        self.wb.save(self.excel_output_path)
+
+class XlsxWriterBackend(WorkbookBackend):
+    """XlsxWriter in constant_memory mode: each row is flushed to a temp file as soon as the next one starts"""
+    def __init__(self, excel_output_path: str, infer_types: bool = True):
+        super().__init__(excel_output_path, infer_types)
+        import xlsxwriter
+        self.wb = xlsxwriter.Workbook(excel_output_path, {"constant_memory": True})
+        self.formats = {name: self.wb.add_format(xlsxwriter_format_properties(definition)) for name, definition in STYLE_DEFINITIONS.items()}
+
+    def write_sheet(self, name: str, rows: Iterable[List[Tuple[Any, Optional[str]]]], column_widths: Dict[int, float]) -> None:
+        ws = self.wb.add_worksheet(self.unique_sheet_name(name))
+        for col_idx, width in column_widths.items():
+            ws.set_column(col_idx - 1, col_idx - 1, width)
+
+        for row_idx, row in enumerate(rows):
+            for col_idx, (value, style) in enumerate(row):
+                ws.write(row_idx, col_idx, value, self.formats[style] if style else None)
+
+    def save(self) -> None:
+        self.wb.close()
+
+PACKAGE_STYLES, PACKAGE_STYLE_IDS = styles_xml(STYLE_DEFINITIONS)
+
+def render_page_sheet(page_number: int, page_content: Dict[str, Any], infer_types: bool = True) -> bytes:
+    """A page's worksheet XML; runs in a worker process"""
+    return sheet_xml(page_layout_rows(page_content, page_number, infer_types), page_column_widths(page_content), PACKAGE_STYLE_IDS)
+
+class ParallelXmlBackend(WorkbookBackend):
+    """Renders each page's sheet XML in a process pool and zips the parts into the workbook in page order as they finish"""
+    def __init__(self, excel_output_path: str, infer_types: bool = True, processes: Optional[int] = None):
+        super().__init__(excel_output_path, infer_types)
+        self.processes = processes or EXCEL_WRITER_PROCESSES
+        self.executor = ProcessPoolExecutor(max_workers=self.processes)
+        self.package = XlsxPackageWriter(excel_output_path, PACKAGE_STYLES)
+        # Only a few pages per worker are in flight, so memory stays bounded however long the document is
+        self.pending = deque()
+
+    def _collect(self, limit: int):
+        while len(self.pending) > limit:
+            name, future = self.pending.popleft()
+            self.package.add_sheet(name, future.result())
+
+    def write_page(self, page_number: int, page_content: Dict[str, Any]) -> None:
+        self.pending.append((self.unique_sheet_name(f"Page {page_number}"), self.executor.submit(render_page_sheet, page_number, page_content, self.infer_types)))
+        self._collect(2 * self.processes)
+
+    def write_sheet(self, name: str, rows: Iterable[List[Tuple[Any, Optional[str]]]], column_widths: Dict[int, float]) -> None:
+        self.pending.append((self.unique_sheet_name(name), self.executor.submit(sheet_xml, list(rows), column_widths, PACKAGE_STYLE_IDS)))
+        self._collect(2 * self.processes)
+
+    def save(self) -> None:
+        try:
+            self._collect(0)
+            self.package.close()
+        finally:
+            self.executor.shutdown()
+
+WRITER_BACKENDS = {
+    "openpyxl": OpenpyxlBackend,
+    "streaming": OpenpyxlStreamingBackend,
+    "xlsxwriter": XlsxWriterBackend,
+    "parallel": ParallelXmlBackend
+}
+DEFAULT_WRITER_BACKEND = os.getenv('EXCEL_WRITER_BACKEND', 'openpyxl')
+# Also write one sheet per logical table, merged across pages
+CONSOLIDATE_TABLES = os.getenv('EXCEL_CONSOLIDATE_TABLES', '0') == '1'
+EXCEL_WRITER_PROCESSES = int(os.getenv('EXCEL_WRITER_PROCESSES', str(os.cpu_count() or 1)))
+
+def convert_json_to_excel(json_file_path: str, excel_output_path: Optional[str] = None, backend: Optional[str] = None,
+                          consolidate: Optional[bool] = None, infer_types: Optional[bool] = None) -> str:
+    backend = backend or DEFAULT_WRITER_BACKEND
+    consolidate = CONSOLIDATE_TABLES if consolidate is None else consolidate
+    infer_types = INFER_CELL_TYPES if infer_types is None else infer_types
+    logger.info(f"Converting JSON file {json_file_path} to Excel ({backend})")
+
+    if not excel_output_path:
+        base_name = os.path.splitext(os.path.basename(json_file_path))[0]
+        excel_output_path = f"{base_name}.xlsx"
+
+    if backend not in WRITER_BACKENDS:
+        raise ValueError(f"Unknown Excel writer backend '{backend}', expected one of: {', '.join(WRITER_BACKENDS)}")
+    writer = WRITER_BACKENDS[backend](excel_output_path, infer_types=infer_types)
+    consolidator = TableConsolidator() if consolidate else None
 
-def create_pandas_dataframes(page_content: Dict[str, Any]) -> List[Tuple[str, pd.DataFrame]]:
+    for page in read_pages(json_file_path):
+        page_number = page.get("page_number", 0)
+        writer.write_page(page_number, page.get("content", {}))
+        if consolidator:
+            consolidator.add_page(page_number, page.get("content", {}))
+
+    if consolidator:
+        for table_idx, (title, pages, df) in enumerate(consolidator.tables(), 1):
+            sheet_name = consolidated_sheet_name(table_idx, title)
+            logger.info(f"Consolidated '{sheet_name}': {len(df)} rows from {len(pages)} pages")
+            # Widths come from the extracted text, which is what the typed cells' number formats display
+            column_widths = consolidated_column_widths(df)
+            kinds = {}
+            if infer_types:
+                df, kinds = infer_table_types(df)
+            writer.write_sheet(sheet_name, consolidated_table_rows(df, kinds), column_widths)
+
+    try:
+        writer.save()
+        logger.info(f"Excel file saved to {excel_output_path}")
+        return excel_output_path
+    except Exception as e:
+        logger.error(f"Error saving Excel file: {e}")
+        raise
+
+def create_pandas_dataframes(page_content: Dict[str, Any], tables_only: bool = False) -> List[Tuple[str, pd.DataFrame]]:
     dataframes = []
     
     tables = page_content.get("tables", [])
     for table_idx, table in enumerate(tables):
         table_title = table.get("table_title", f"Table {table_idx+1}")
         headers = table.get("headers", [])
-        data = table.get("data", [])
+        data = [row for row in table.get("data", []) if isinstance(row, list)]
         
-        if headers and data:
-            df = pd.DataFrame(data, columns=headers)
+        if data:
+            # Continuation pages often come without a header row, and OCR'd rows can be short or long by a cell
+            width = len(headers) or max(len(row) for row in data)
+            columns = list(headers) if headers else [f"Column {i+1}" for i in range(width)]
+            df = pd.DataFrame([row[:width] + [None] * (width - len(row)) for row in data], columns=columns)
             dataframes.append((table_title, df))
 
+    if tables_only:
+        return dataframes
+
     sections = page_content.get("sections", [])
     for section_idx, section in enumerate(sections):
         if section.get("section_type") == "form":
@@ -190,7 +599,80 @@ def create_pandas_dataframes(page_content: Dict[str, Any]) -> List[Tuple[str, pd
     
     return dataframes
 
-def main(json_file_path: str, excel_output_path: Optional[str] = None) -> str:
+# Headers the model gives a table it found no header row for
+GENERIC_HEADER = re.compile(r"^(col(umn)?)?\s*\d*$", re.IGNORECASE)
+# Cell text that is data rather than a column name: numbers, amounts and dates
+DATA_LIKE = re.compile(r"^[-+(]?[\d.,/:\- ]*\d[\d.,/:\- ]*\)?$")
+CONSOLIDATED_SOURCE_COLUMN = "Source Page"
+
+def header_signature(columns: Iterable[Any]) -> Tuple[str, ...]:
+    """Headers compared case-, spacing- and punctuation-insensitively"""
+    return tuple(re.sub(r"[^a-z0-9]+", " ", str(column).lower()).strip() for column in columns)
+
+def continuation_kind(columns: List[Any]) -> Optional[str]:
+    """"generic" when the table has no real header row, "data" when its header row is really the first data row, else None"""
+    texts = [str(column).strip() for column in columns]
+    if all(GENERIC_HEADER.match(text) for text in texts):
+        return "generic"
+    if sum(1 for text in texts if DATA_LIKE.match(text)) * 2 >= len(texts):
+        return "data"
+    return None
+
+class TableConsolidator:
+    """Groups the tables of a document into logical tables: tables with the same real headers anywhere in the document,
+    plus a continuation table (no header row, or a data row in its place) opening a page, when the previous page
+    ended with a table of the same width"""
+    def __init__(self):
+        self.groups = {}
+        self.last_group = None
+
+    def add_page(self, page_number: int, page_content: Dict[str, Any]):
+        previous_group, self.last_group = self.last_group, None
+        for table_idx, (title, df) in enumerate(create_pandas_dataframes(page_content, tables_only=True)):
+            columns = list(df.columns)
+            signature = header_signature(columns)
+            kind = continuation_kind(columns)
+            if kind == "data" and signature in self.groups:
+                kind = None
+            if kind and table_idx == 0 and previous_group and len(previous_group["columns"]) == len(columns):
+                group = previous_group
+                if kind == "data":
+                    df = pd.concat([pd.DataFrame([columns]), df.set_axis(range(len(columns)), axis=1)], ignore_index=True)
+            elif kind == "generic":
+                # "Column N" headers say nothing about which table this is, so it starts a table of its own
+                group = self.groups.setdefault((kind, len(self.groups)), {"title": title, "columns": columns, "frames": [], "pages": []})
+            else:
+                group = self.groups.setdefault(signature, {"title": title, "columns": columns, "frames": [], "pages": []})
+            df = df.set_axis(range(len(columns)), axis=1)
+            df.insert(0, CONSOLIDATED_SOURCE_COLUMN, page_number)
+            group["frames"].append(df)
+            group["pages"].append(page_number)
+            self.last_group = group
+
+    def tables(self) -> Iterator[Tuple[str, List[int], pd.DataFrame]]:
+        """(title, source pages, rows) for each logical table, in order of first appearance"""
+        for group in self.groups.values():
+            df = pd.concat(group["frames"], ignore_index=True)
+            df.columns = [CONSOLIDATED_SOURCE_COLUMN] + group["columns"]
+            yield group["title"], sorted(set(group["pages"])), df
+
+def consolidated_sheet_name(index: int, title: str) -> str:
+    """Excel sheet names are at most 31 characters and cannot contain []:*?/\\"""
+    return re.sub(r"[\[\]:*?/\\]", " ", f"Table {index} - {title}" if title else f"Table {index}")[:31].strip()
+
+def consolidated_table_rows(df: pd.DataFrame, kinds: Optional[Dict[int, Optional[str]]] = None) -> Iterator[List[Tuple[Any, Optional[str]]]]:
+    yield [(column, "ocr_header") for column in df.columns]
+    column_styles = [COLUMN_KIND_STYLES.get((kinds or {}).get(position), "ocr_cell") for position in range(df.shape[1])]
+    values = df.astype(object).where(df.notna(), None)
+    for row in values.itertuples(index=False, name=None):
+        yield list(zip(row, column_styles))
+
+def consolidated_column_widths(df: pd.DataFrame) -> Dict[int, float]:
+    sample = df.sample(AUTOFIT_SAMPLE_ROWS, random_state=0) if len(df) > AUTOFIT_SAMPLE_ROWS else df
+    return autofit_column_widths([list(df.columns)] + sample.to_numpy(dtype=object).tolist(), header_count=1)
+
+def main(json_file_path: str, excel_output_path: Optional[str] = None, backend: Optional[str] = None, consolidate: Optional[bool] = None,
+         infer_types: Optional[bool] = None) -> str:
     logger.info(f"Starting conversion of {json_file_path} to Excel")
     
     if not excel_output_path:
@@ -198,7 +680,7 @@ def main(json_file_path: str, excel_output_path: Optional[str] = None) -> str:
         excel_output_path = f"{base_name}.xlsx"
     
     try:
-        excel_path = convert_json_to_excel(json_file_path, excel_output_path)
+        excel_path = convert_json_to_excel(json_file_path, excel_output_path, backend, consolidate, infer_types)
         logger.info(f"Successfully converted JSON to Excel: {excel_path}")
         return excel_path
     
@@ -212,7 +694,14 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Convert extracted JSON data to Excel format")
     parser.add_argument("json_file", help="Path to the JSON file containing extracted data")
     parser.add_argument("--output", help="Path to save the Excel file")
+    parser.add_argument("--backend", choices=list(WRITER_BACKENDS), default=None,
+                        help="Writer backend: openpyxl (default), streaming (openpyxl write-only), xlsxwriter (constant memory) or parallel (sheets rendered in a process pool)")
+    
+    parser.add_argument("--consolidate", action="store_true", default=None,
+                        help="Also write one sheet per logical table, merging tables that continue across pages, with a source page column")
+    
+    parser.add_argument("--text-cells", action="store_true", help="Write every table cell as text instead of typing numbers and dates")
     
     args = parser.parse_args()
     
-    main(args.json_file, args.output)
\ No newline at end of file
+    main(args.json_file, args.output, args.backend, args.consolidate, False if args.text_cells else None)
\ No newline at end of file
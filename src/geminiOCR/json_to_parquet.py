@@ -0,0 +1,121 @@
+import os
+import logging
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    from .json_to_excel import read_pages, create_pandas_dataframes, INFER_CELL_TYPES
+    from .cell_types import infer_table_types, NUMBER, INDIAN_NUMBER, DATE
+except ImportError:
+    from json_to_excel import read_pages, create_pandas_dataframes, INFER_CELL_TYPES
+    from cell_types import infer_table_types, NUMBER, INDIAN_NUMBER, DATE
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# The indication the extraction prompt asks the model to put in a signed cell
+SIGNATURE_TEXT = r"signature\s+detected"
+# Cells buffered before they are written out as one row group
+ROW_GROUP_CELLS = 500_000
+
+# One row per table cell, so tables of any shape share a schema. Repetitive text is dictionary-encoded,
+# and reads back as pandas categoricals
+PARQUET_SCHEMA = pa.schema([
+    ("page", pa.int32()),
+    ("table_index", pa.int32()),
+    ("table_title", pa.dictionary(pa.int32(), pa.string())),
+    ("row", pa.int32()),
+    ("column", pa.int32()),
+    ("header", pa.dictionary(pa.int32(), pa.string())),
+    ("value", pa.dictionary(pa.int32(), pa.string())),
+    ("number", pa.float64()),
+    ("date", pa.timestamp("ms")),
+    ("signature", pa.bool_()),
+])
+
+def table_cells(page_number: int, table_index: int, title: str, df: pd.DataFrame, infer_types: bool = True) -> pa.RecordBatch:
+    """The cells of one table, row by row, with their typed number or date where the column has one"""
+    row_count, column_count = df.shape
+    cell_count = row_count * column_count
+    text = pd.Series(df.to_numpy(dtype=object).ravel(), dtype=object)
+    text = text.where(text.isna(), text.astype(str))
+
+    numbers = np.full((row_count, column_count), np.nan)
+    dates = np.full((row_count, column_count), np.datetime64("NaT"), dtype="datetime64[ms]")
+    if infer_types:
+        typed, kinds = infer_table_types(df)
+        for position, kind in kinds.items():
+            if kind in (NUMBER, INDIAN_NUMBER):
+                numbers[:, position] = pd.to_numeric(typed.iloc[:, position], errors="coerce").to_numpy(dtype=float)
+            elif kind == DATE:
+                dates[:, position] = pd.to_datetime(typed.iloc[:, position], errors="coerce").to_numpy(dtype="datetime64[ms]")
+
+    signature = text.str.contains(SIGNATURE_TEXT, case=False, regex=True, na=False).to_numpy(dtype=bool)
+    headers = pa.array([str(column) for column in df.columns]).dictionary_encode()
+    return pa.RecordBatch.from_arrays([
+        pa.array(np.full(cell_count, page_number, dtype=np.int32)),
+        pa.array(np.full(cell_count, table_index, dtype=np.int32)),
+        pa.DictionaryArray.from_arrays(pa.array(np.zeros(cell_count, dtype=np.int32)), pa.array([title], pa.string())),
+        pa.array(np.repeat(np.arange(1, row_count + 1, dtype=np.int32), column_count)),
+        pa.array(np.tile(np.arange(1, column_count + 1, dtype=np.int32), row_count)),
+        pa.DictionaryArray.from_arrays(pa.array(np.tile(np.arange(column_count, dtype=np.int32), row_count)), headers.dictionary),
+        pa.array(text, type=pa.string()).dictionary_encode(),
+        pa.array(numbers.ravel(), from_pandas=True),
+        pa.array(dates.ravel()),
+        pa.array(signature),
+    ], schema=PARQUET_SCHEMA)
+
+def convert_json_to_parquet(json_file_path: str, parquet_output_path: Optional[str] = None, infer_types: Optional[bool] = None) -> str:
+    """Write every table in the document to one Parquet file, reading the pages incrementally"""
+    infer_types = INFER_CELL_TYPES if infer_types is None else infer_types
+    logger.info(f"Converting JSON file {json_file_path} to Parquet")
+
+    if not parquet_output_path:
+        base_name = os.path.splitext(os.path.basename(json_file_path))[0]
+        parquet_output_path = f"{base_name}.parquet"
+
+    batches: List[pa.RecordBatch] = []
+    buffered = tables = 0
+    with pq.ParquetWriter(parquet_output_path, PARQUET_SCHEMA, compression="zstd") as writer:
+        for page in read_pages(json_file_path):
+            page_number = page.get("page_number", 0)
+            for table_index, (title, df) in enumerate(create_pandas_dataframes(page.get("content", {}), tables_only=True), 1):
+                batches.append(table_cells(page_number, table_index, str(title), df, infer_types))
+                buffered += batches[-1].num_rows
+                tables += 1
+            if buffered >= ROW_GROUP_CELLS:
+                writer.write_table(pa.Table.from_batches(batches, PARQUET_SCHEMA))
+                batches, buffered = [], 0
+        if batches:
+            writer.write_table(pa.Table.from_batches(batches, PARQUET_SCHEMA))
+
+    logger.info(f"Parquet file with {tables} tables saved to {parquet_output_path}")
+    return parquet_output_path
+
+def main(json_file_path: str, parquet_output_path: Optional[str] = None, infer_types: Optional[bool] = None) -> str:
+    logger.info(f"Starting conversion of {json_file_path} to Parquet")
+
+    try:
+        parquet_path = convert_json_to_parquet(json_file_path, parquet_output_path, infer_types)
+        logger.info(f"Successfully converted JSON to Parquet: {parquet_path}")
+        return parquet_path
+
+    except Exception as e:
+        logger.error(f"Error converting JSON to Parquet: {e}")
+        raise
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export the tables of extracted JSON data to Parquet, one row per cell")
+    parser.add_argument("json_file", help="Path to the JSON file containing extracted data")
+    parser.add_argument("--output", help="Path to save the Parquet file")
+    parser.add_argument("--text-cells", action="store_true", help="Leave the number and date columns empty instead of typing cells")
+
+    args = parser.parse_args()
+
+    main(args.json_file, args.output, False if args.text_cells else None)
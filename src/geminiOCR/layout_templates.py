@@ -0,0 +1,231 @@
+import os
+import json
+import logging
+from threading import Lock
+from typing import List, Dict, Any, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Column lines may drift this much (as a fraction of the table width) between scans of the same form
+COLUMN_TOLERANCE = 0.015
+HEADER_TOLERANCE = 0.01
+TABLE_WIDTH_TOLERANCE = 0.05
+# A table cell holds an entry when this share of its pixels is ink
+CELL_INK_THRESHOLD = 0.01
+
+class GridFingerprint:
+    """Ruled-table geometry of a page, normalised so scans at different offsets and DPIs compare equal.
+    filled_rows is the number of body rows with ink on this particular page; it is not part of the layout"""
+    def __init__(self, columns: List[float], header_height: float, table_width: float, filled_rows: Optional[int] = None):
+        self.columns = columns
+        self.header_height = header_height
+        self.table_width = table_width
+        self.filled_rows = filled_rows
+
+    def distance(self, other: "GridFingerprint") -> Optional[float]:
+        """Largest column drift between the two grids, or None if they are different layouts"""
+        if len(self.columns) != len(other.columns):
+            return None
+        if abs(self.header_height - other.header_height) > HEADER_TOLERANCE:
+            return None
+        if abs(self.table_width - other.table_width) > TABLE_WIDTH_TOLERANCE:
+            return None
+        drift = max(abs(a - b) for a, b in zip(self.columns, other.columns))
+        return drift if drift <= COLUMN_TOLERANCE else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"columns": self.columns, "header_height": self.header_height, "table_width": self.table_width}
+
+def _line_positions(profile: np.ndarray, min_length: float, max_gap: int = 5) -> List[int]:
+    """Centres of the runs of rows (or columns) whose line pixel count reaches min_length"""
+    positions = np.flatnonzero(profile >= min_length)
+    if positions.size == 0:
+        return []
+    runs = np.split(positions, np.flatnonzero(np.diff(positions) > max_gap) + 1)
+    return [int(run.mean()) for run in runs]
+
+def find_grid_lines(gray: np.ndarray) -> Tuple[List[int], List[int]]:
+    """Pixel positions of the horizontal and vertical ruling lines of a grayscale page"""
+    height, width = gray.shape
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    horizontal_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(width // 25, 10), 1))
+    vertical_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, max(height // 40, 10)))
+    horizontal = cv2.morphologyEx(binary, cv2.MORPH_OPEN, horizontal_kernel)
+    vertical = cv2.morphologyEx(binary, cv2.MORPH_OPEN, vertical_kernel)
+
+    rows = _line_positions(horizontal.sum(axis=1) / 255, width * 0.25)
+    columns = _line_positions(vertical.sum(axis=0) / 255, height * 0.1)
+    return rows, columns
+
+def count_filled_rows(gray: np.ndarray, rows: List[int], columns: List[int]) -> int:
+    """Body rows of the grid with ink in at least one cell, measured inside the ruling lines"""
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    filled = 0
+    for y0, y1 in zip(rows[1:], rows[2:]):
+        margin_y = max(3, (y1 - y0) // 8)
+        for x0, x1 in zip(columns, columns[1:]):
+            margin_x = max(3, (x1 - x0) // 20)
+            cell = binary[y0 + margin_y:y1 - margin_y, x0 + margin_x:x1 - margin_x]
+            if cell.size and np.count_nonzero(cell) / cell.size > CELL_INK_THRESHOLD:
+                filled += 1
+                break
+    return filled
+
+def filled_table_rows(table: Dict[str, Any]) -> int:
+    """Extracted rows with at least one non-blank cell"""
+    return sum(1 for row in table.get("data") or [] if isinstance(row, list) and any(str(cell).strip() for cell in row))
+
+def detect_grid(image_path: str) -> Optional[GridFingerprint]:
+    """Find the ruled table on a page with morphological line detection"""
+    gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        raise FileNotFoundError(f"Could not read image: {image_path}")
+    width = gray.shape[1]
+
+    rows, columns = find_grid_lines(gray)
+    if len(rows) < 2 or len(columns) < 3:
+        return None
+
+    left, right = columns[0], columns[-1]
+    table_width = right - left
+    return GridFingerprint(
+        columns=[round((x - left) / table_width, 4) for x in columns],
+        header_height=round((rows[1] - rows[0]) / table_width, 4),
+        table_width=round(table_width / width, 4),
+        filled_rows=count_filled_rows(gray, rows, columns)
+    )
+
+class LayoutTemplate:
+    def __init__(self, name: str, fingerprint: GridFingerprint, headers: List[str], table_title: str = "",
+                 document_type: str = "", source: str = "", hits: int = 0, misses: int = 0):
+        self.name = name
+        self.fingerprint = fingerprint
+        self.headers = headers
+        self.table_title = table_title
+        self.document_type = document_type
+        self.source = source
+        self.hits = hits
+        self.misses = misses
+
+    @property
+    def active(self) -> bool:
+        return self.misses <= self.hits
+
+    def describe(self) -> str:
+        """Structure description sent in place of a structure-analysis call"""
+        title = f" titled '{self.table_title}'" if self.table_title else ""
+        return f"Printed form: a bordered table{title} with {len(self.headers)} columns: {' | '.join(self.headers)}."
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "fingerprint": self.fingerprint.to_dict(),
+            "headers": self.headers,
+            "table_title": self.table_title,
+            "document_type": self.document_type,
+            "source": self.source,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LayoutTemplate":
+        return cls(data["name"], GridFingerprint(**data["fingerprint"]), data["headers"], data.get("table_title", ""),
+                   data.get("document_type", ""), data.get("source", ""), data.get("hits", 0), data.get("misses", 0))
+
+class LayoutTemplateRegistry:
+    """Form layouts learned from extracted pages, matched on later pages by their grid fingerprint"""
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.templates = []
+        self.fingerprints = {}
+        self.matched_pages = 0
+        self.learned = 0
+        self.lock = Lock()
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.templates = [LayoutTemplate.from_dict(data) for data in json.load(f)]
+            logger.info(f"Loaded {len(self.templates)} layout templates from {path}")
+
+    def fingerprint(self, image_path: str) -> Optional[GridFingerprint]:
+        with self.lock:
+            if image_path in self.fingerprints:
+                return self.fingerprints[image_path]
+        try:
+            fingerprint = detect_grid(image_path)
+        except Exception as e:
+            logger.warning(f"Grid detection failed for {os.path.basename(image_path)}: {e}")
+            fingerprint = None
+        with self.lock:
+            self.fingerprints[image_path] = fingerprint
+        return fingerprint
+
+    def _closest(self, fingerprint: GridFingerprint) -> Optional[LayoutTemplate]:
+        best, best_distance = None, None
+        for template in self.templates:
+            distance = template.fingerprint.distance(fingerprint)
+            if template.active and distance is not None and (best_distance is None or distance < best_distance):
+                best, best_distance = template, distance
+        return best
+
+    def match(self, image_path: str) -> Optional[LayoutTemplate]:
+        fingerprint = self.fingerprint(image_path)
+        if fingerprint is None:
+            return None
+        with self.lock:
+            template = self._closest(fingerprint)
+            if template is not None:
+                self.matched_pages += 1
+                logger.info(f"📐 {os.path.basename(image_path)} matches layout template '{template.name}'")
+            return template
+
+    def record_extraction(self, image_path: str, structured_data: Dict[str, Any], template: Optional[LayoutTemplate] = None):
+        """Confirm a matched template against the extracted table, or learn a new one from this page.
+        The template's headers are in the extraction prompt, so a page only fits when the extracted table
+        also has one filled row for every ruled row with ink on the page"""
+        tables = structured_data.get("tables") if isinstance(structured_data, dict) else None
+        if not isinstance(tables, list) or "error" in structured_data:
+            return
+        fingerprint = self.fingerprint(image_path)
+        if fingerprint is None:
+            return
+        column_count = len(fingerprint.columns) - 1
+        table = next((t for t in tables if isinstance(t, dict) and len(t.get("headers") or []) == column_count), None)
+        fits = table is not None and filled_table_rows(table) == fingerprint.filled_rows
+
+        with self.lock:
+            if template is not None:
+                if fits:
+                    template.hits += 1
+                else:
+                    template.misses += 1
+                    logger.warning(f"Page {os.path.basename(image_path)} did not fit layout template '{template.name}'")
+                return
+            if not fits or self._closest(fingerprint) is not None:
+                return
+            name = structured_data.get("document_type") or table.get("table_title") or "form"
+            name = f"{name} ({column_count} columns)"
+            self.templates.append(LayoutTemplate(name, fingerprint, [str(h) for h in table["headers"]], table.get("table_title") or "",
+                                                 structured_data.get("document_type") or "", os.path.basename(image_path)))
+            self.learned += 1
+            logger.info(f"📐 Learned layout template '{name}' from {os.path.basename(image_path)}")
+
+    def forget(self, image_path: str):
+        """Drop a finished page's cached fingerprint; page image paths are reused between documents"""
+        with self.lock:
+            self.fingerprints.pop(image_path, None)
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            data = [template.to_dict() for template in self.templates]
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"templates": len(self.templates), "learned": self.learned, "matched_pages": self.matched_pages}
@@ -0,0 +1,86 @@
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# White margin kept around the content so edge strokes are not clipped
+CROP_PADDING = 20
+# Ink blobs smaller than this share of the page are specks and scanner dust, not content
+MIN_BLOB_SHARE = 0.0005
+# Skip the crop when it would save less than this share of the page
+MIN_CROP_SAVING = 0.05
+# A blob touching the page edge is a scanner border only if it is a thin strip: at most this share of
+# the page across, and at least BORDER_MIN_ASPECT times longer than it is thick
+BORDER_MAX_THICKNESS = 0.04
+BORDER_MIN_ASPECT = 8.0
+# Leave the page as it is when the content box would hold less than this share of the page's ink
+MIN_KEPT_INK_SHARE = 0.9
+
+def is_scanner_border(x: int, y: int, w: int, h: int, width: int, height: int) -> bool:
+    """Thin strip along a page edge, like the dark band a scanner lid leaves"""
+    if x > 0 and y > 0 and x + w < width and y + h < height:
+        return False
+    thickness, length = min(w, h), max(w, h)
+    across = height if h <= w else width
+    return thickness <= BORDER_MAX_THICKNESS * across and length >= BORDER_MIN_ASPECT * thickness
+
+def find_content_box(gray: np.ndarray, padding: int = CROP_PADDING) -> Optional[Tuple[int, int, int, int]]:
+    """Bounding box (x, y, w, h) of the page content, found by closing the ink into blobs as in
+    detect_full_table_outline. Thin strips along the page edge are scanner borders and are ignored;
+    content that runs off the edge is kept. None when there is no content or the box would lose ink"""
+    height, width = gray.shape
+    blurred = cv2.GaussianBlur(gray, (3, 3), 0)
+    _, thresh = cv2.threshold(blurred, 200, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (25, 25))
+    closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+
+    contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = MIN_BLOB_SHARE * width * height
+    borders = np.zeros_like(thresh)
+    left, top, right, bottom = width, height, 0, 0
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if is_scanner_border(x, y, w, h, width, height):
+            cv2.drawContours(borders, [contour], -1, 255, cv2.FILLED)
+            continue
+        if w * h < min_area:
+            continue
+        left, top = min(left, x), min(top, y)
+        right, bottom = max(right, x + w), max(bottom, y + h)
+    if right <= left or bottom <= top:
+        return None
+
+    left, top = max(left - padding, 0), max(top - padding, 0)
+    right, bottom = min(right + padding, width), min(bottom + padding, height)
+
+    ink = cv2.bitwise_and(thresh, cv2.bitwise_not(borders))
+    total_ink = np.count_nonzero(ink)
+    kept_ink = np.count_nonzero(ink[top:bottom, left:right])
+    if kept_ink < MIN_KEPT_INK_SHARE * total_ink:
+        logger.info(f"Not cropping: the content box holds only {kept_ink / total_ink:.0%} of the page's ink")
+        return None
+    return left, top, right - left, bottom - top
+
+def crop_to_content(image: Image.Image, padding: int = CROP_PADDING) -> Tuple[Image.Image, Optional[Dict[str, Any]]]:
+    """Crop a page to its content; the crop record maps cropped coordinates back to the original page
+    (add offset_x/offset_y), and is None when the page was left as it was"""
+    gray = cv2.cvtColor(np.asarray(image.convert("RGB")), cv2.COLOR_RGB2GRAY)
+    box = find_content_box(gray, padding)
+    if box is None:
+        return image, None
+    x, y, w, h = box
+    if w * h > (1 - MIN_CROP_SAVING) * image.width * image.height:
+        return image, None
+    crop = {
+        "offset_x": x,
+        "offset_y": y,
+        "width": w,
+        "height": h,
+        "original_width": image.width,
+        "original_height": image.height
+    }
+    return image.crop((x, y, x + w, y + h)), crop
@@ -0,0 +1,238 @@
+import os
+import logging
+from collections import deque
+from threading import Lock
+from typing import List, Dict, Any, Optional, Tuple
+
+import cv2
+import numpy as np
+
+try:
+    from .layout_templates import find_grid_lines
+    from .hybrid_ocr import HybridTableEngine
+except ImportError:
+    from layout_templates import find_grid_lines
+    from hybrid_ocr import HybridTableEngine
+
+logger = logging.getLogger(__name__)
+
+LOCAL_ROUTE = "local"
+MODEL_ROUTE = "gemini"
+
+# A page stays local only if all of these hold
+MIN_TEXT_BLOCKS = 5
+MIN_MEAN_CONFIDENCE = 0.9
+MAX_LOW_CONFIDENCE_SHARE = 0.05
+LOW_CONFIDENCE = 0.8
+MAX_HANDWRITING_SHARE = 0.05
+MIN_ROW_CONSISTENCY = 0.7
+# Pages with less ink than this share of their area are treated as having no handwriting
+MIN_INK_SHARE = 0.001
+# Most recent routing decisions kept for summary(); older ones are dropped
+MAX_DECISIONS = 500
+
+class PageFeatures:
+    def __init__(self, text_blocks: int, mean_confidence: float, low_confidence_share: float, handwriting_share: float,
+                 grid_rows: int, grid_columns: int, row_consistency: float):
+        self.text_blocks = text_blocks
+        self.mean_confidence = mean_confidence
+        self.low_confidence_share = low_confidence_share
+        self.handwriting_share = handwriting_share
+        self.grid_rows = grid_rows
+        self.grid_columns = grid_columns
+        self.row_consistency = row_consistency
+
+    @property
+    def has_grid(self) -> bool:
+        return self.grid_rows >= 3 and self.grid_columns >= 3
+
+    def model_reasons(self) -> List[str]:
+        """Why the page needs the model; empty for a clean printed page"""
+        reasons = []
+        if self.text_blocks < MIN_TEXT_BLOCKS:
+            reasons.append(f"only {self.text_blocks} text blocks")
+        if self.mean_confidence < MIN_MEAN_CONFIDENCE:
+            reasons.append(f"mean OCR confidence {self.mean_confidence:.2f}")
+        if self.low_confidence_share > MAX_LOW_CONFIDENCE_SHARE:
+            reasons.append(f"{self.low_confidence_share:.0%} low-confidence blocks")
+        if self.handwriting_share > MAX_HANDWRITING_SHARE:
+            reasons.append(f"{self.handwriting_share:.0%} of ink looks handwritten")
+        if not self.has_grid and self.row_consistency < MIN_ROW_CONSISTENCY:
+            reasons.append("no ruled grid or consistent columns")
+        return reasons
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "text_blocks": self.text_blocks,
+            "mean_confidence": round(self.mean_confidence, 3),
+            "low_confidence_share": round(self.low_confidence_share, 3),
+            "handwriting_share": round(self.handwriting_share, 3),
+            "grid_rows": self.grid_rows,
+            "grid_columns": self.grid_columns,
+            "row_consistency": round(self.row_consistency, 3)
+        }
+
+class RouteDecision:
+    def __init__(self, image_path: str, route: str, features: Optional[PageFeatures], reasons: List[str],
+                 blocks: Optional[List[Dict[str, Any]]] = None, result: Optional[Dict[str, Any]] = None):
+        self.image_path = image_path
+        self.route = route
+        self.features = features
+        self.reasons = reasons
+        self.blocks = blocks
+        self.result = result
+
+def group_rows(blocks: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Cluster text blocks into lines by vertical overlap, as in the PaddleOCR table trial"""
+    if not blocks:
+        return []
+    ordered = sorted(blocks, key=lambda b: (b['min_y'] + b['max_y']) / 2)
+    avg_height = sum(b['max_y'] - b['min_y'] for b in ordered) / len(ordered)
+    row_height_threshold = avg_height * 0.8
+
+    rows = []
+    current_row = [ordered[0]]
+    for block in ordered[1:]:
+        reference = current_row[0]
+        y_overlap = min(block['max_y'], reference['max_y']) - max(block['min_y'], reference['min_y'])
+        center_gap = abs((block['min_y'] + block['max_y']) / 2 - (reference['min_y'] + reference['max_y']) / 2)
+        if y_overlap > 0 or center_gap < row_height_threshold:
+            current_row.append(block)
+        else:
+            rows.append(sorted(current_row, key=lambda b: b['min_x']))
+            current_row = [block]
+    rows.append(sorted(current_row, key=lambda b: b['min_x']))
+    return rows
+
+def reconstruct_table(blocks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Rebuild an unruled table from text blocks: rows by vertical overlap, columns from the lines that fill every column"""
+    rows = group_rows(blocks)
+    num_columns = max(len(row) for row in rows)
+    full_rows = [row for row in rows if len(row) == num_columns]
+    column_centers = [sum((row[i]['min_x'] + row[i]['max_x']) / 2 for row in full_rows) / len(full_rows) for i in range(num_columns)]
+
+    table_matrix = []
+    for row in rows:
+        row_data = [''] * len(column_centers)
+        for block in row:
+            center_x = (block['min_x'] + block['max_x']) / 2
+            closest = min(range(len(column_centers)), key=lambda i: abs(center_x - column_centers[i]))
+            row_data[closest] = f"{row_data[closest]} {block['text']}".strip()
+        table_matrix.append(row_data)
+
+    headers = [h or f"Column {i+1}" for i, h in enumerate(table_matrix[0])]
+    data = []
+    for row in table_matrix[1:]:
+        filled = sum(1 for cell in row if cell)
+        # A line with at most half its cells filled continues the row above it (wrapped text)
+        if data and filled <= len(headers) // 2 and sum(1 for cell in data[-1] if cell) > filled:
+            data[-1] = [f"{above} {cell}".strip() for above, cell in zip(data[-1], row)]
+        elif filled:
+            data.append(row)
+
+    return {
+        "document_type": "table",
+        "page_metadata": {"page_number": "", "header": "", "footer": ""},
+        "sections": [],
+        "tables": [{"table_title": "", "headers": headers, "data": data}],
+        "key_value_pairs": {}
+    }
+
+def row_consistency(blocks: List[Dict[str, Any]]) -> float:
+    """Share of text lines with the most common number of blocks; close to 1 for a regular table"""
+    counts = [len(row) for row in group_rows(blocks)]
+    if not counts:
+        return 0.0
+    return counts.count(max(set(counts), key=counts.count)) / len(counts)
+
+def handwriting_share(gray: np.ndarray, blocks: List[Dict[str, Any]], rows: List[int], columns: List[int]) -> float:
+    """Share of the page's ink, ruling lines aside, that no OCR text block accounts for"""
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    for y in rows:
+        binary[max(y - 3, 0):y + 4, :] = 0
+    for x in columns:
+        binary[:, max(x - 3, 0):x + 4] = 0
+
+    ink = np.count_nonzero(binary)
+    if ink < MIN_INK_SHARE * binary.size:
+        return 0.0
+    covered = np.zeros_like(binary)
+    for block in blocks:
+        cv2.rectangle(covered, (int(block['min_x']) - 4, int(block['min_y']) - 4),
+                      (int(block['max_x']) + 4, int(block['max_y']) + 4), 255, -1)
+    return float(np.count_nonzero(cv2.bitwise_and(binary, cv2.bitwise_not(covered)))) / ink
+
+class PageRouter:
+    """Sends clean printed pages through local OCR and table reconstruction, and everything else to the model"""
+    def __init__(self, engine: Optional[HybridTableEngine] = None):
+        self.engine = engine or HybridTableEngine()
+        self.decisions = deque(maxlen=MAX_DECISIONS)
+        self.route_seconds = {}
+        self.route_pages = {}
+        self.lock = Lock()
+
+    def classify(self, image_path: str) -> Tuple[PageFeatures, List[Dict[str, Any]]]:
+        gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise FileNotFoundError(f"Could not read image: {image_path}")
+        blocks = self.engine.read_blocks(image_path)
+        rows, columns = find_grid_lines(gray)
+        confidences = [b['confidence'] for b in blocks]
+        return PageFeatures(
+            text_blocks=len(blocks),
+            mean_confidence=sum(confidences) / len(confidences) if confidences else 0.0,
+            low_confidence_share=sum(1 for c in confidences if c < LOW_CONFIDENCE) / len(confidences) if confidences else 1.0,
+            handwriting_share=handwriting_share(gray, blocks, rows, columns),
+            grid_rows=len(rows),
+            grid_columns=len(columns),
+            row_consistency=row_consistency(blocks)
+        ), blocks
+
+    def route(self, image_path: str) -> RouteDecision:
+        name = os.path.basename(image_path)
+        try:
+            features, blocks = self.classify(image_path)
+        except Exception as e:
+            logger.warning(f"Could not classify {name}, sending it to the model: {e}")
+            decision = RouteDecision(image_path, MODEL_ROUTE, None, [f"classification failed: {e}"])
+        else:
+            reasons = features.model_reasons()
+            result = None
+            if not reasons:
+                try:
+                    page = self.engine.read_page(image_path, blocks) if features.has_grid else None
+                    if page is not None and page.flagged:
+                        reasons.append(f"{len(page.flagged)} cells need the model")
+                    else:
+                        result = page.structured_data() if page is not None else reconstruct_table(blocks)
+                except Exception as e:
+                    logger.warning(f"Local extraction failed for {name}, sending it to the model: {e}")
+                    reasons.append(f"local extraction failed: {e}")
+            decision = RouteDecision(image_path, MODEL_ROUTE if reasons else LOCAL_ROUTE, features, reasons, blocks, result)
+
+        logger.info(f"🚦 {name} -> {decision.route}" + (f" ({'; '.join(decision.reasons)})" if decision.reasons else ""))
+        with self.lock:
+            self.decisions.append({
+                "page": name,
+                "route": decision.route,
+                "reasons": decision.reasons,
+                "features": decision.features.to_dict() if decision.features else None
+            })
+        return decision
+
+    def record_page(self, route: str, seconds: float):
+        with self.lock:
+            self.route_pages[route] = self.route_pages.get(route, 0) + 1
+            self.route_seconds[route] = self.route_seconds.get(route, 0.0) + seconds
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            routes = {}
+            for route, pages in self.route_pages.items():
+                seconds = self.route_seconds[route]
+                routes[route] = {
+                    "pages": pages,
+                    "avg_seconds": round(seconds / pages, 3),
+                    "pages_per_minute": round(pages / seconds * 60, 1) if seconds else None
+                }
+            return {"routes": routes, "decisions": list(self.decisions)}
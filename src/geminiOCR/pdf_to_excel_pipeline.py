@@ -1,13 +1,15 @@
 import os
 import logging
 from dotenv import load_dotenv
-from pdf_to_json import main as pdf_to_json_main
-from json_to_excel import main as json_to_excel_main
+from pdf_to_json import main as pdf_to_json_main, PRESETS
+from json_to_excel import main as json_to_excel_main, WRITER_BACKENDS
+from json_to_parquet import main as json_to_parquet_main
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def process_pdf_to_excel(pdf_path, output_folder="extracted_images", json_output=None, excel_output=None):
+def process_pdf_to_excel(pdf_path, output_folder="extracted_images", json_output=None, excel_output=None, preset=None, excel_backend=None, consolidate_tables=None,
+                         parquet_output=None):
     if not json_output:
         pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
         json_output = f"{pdf_name}_extracted.json"
@@ -21,10 +23,14 @@ def process_pdf_to_excel(pdf_path, output_folder="extracted_images", json_output
     
     try:
         logger.info("Step 1: Converting PDF to structured JSON...")
-        pdf_to_json_main(pdf_path, output_folder, json_output)
+        pdf_to_json_main(pdf_path, output_folder, json_output, preset=preset)
 
         logger.info("Step 2: Converting JSON to formatted Excel...")
-        json_to_excel_main(json_output, excel_output)
+        json_to_excel_main(json_output, excel_output, excel_backend, consolidate_tables)
+
+        if parquet_output:
+            logger.info("Step 3: Exporting tables to Parquet...")
+            json_to_parquet_main(json_output, parquet_output)
         
         logger.info("Pipeline completed successfully!")
         logger.info(f"Results saved to: {excel_output}")
@@ -45,6 +51,10 @@ if __name__ == "__main__":
     parser.add_argument("--images-folder", default="extracted_images", help="Folder to save extracted images")
     parser.add_argument("--json-output", help="Path to save the intermediate JSON output")
     parser.add_argument("--excel-output", help="Path to save the final Excel output")
+    parser.add_argument("--preset", choices=list(PRESETS), default=None, help="Speed/quality preset for extraction (fast, balanced, accurate)")
+    parser.add_argument("--consolidate-tables", action="store_true", default=None, help="Also write one sheet per table merged across pages")
+    parser.add_argument("--excel-backend", choices=list(WRITER_BACKENDS), default=None, help="Excel writer backend (openpyxl, streaming, xlsxwriter, parallel)")
+    parser.add_argument("--parquet-output", help="Also export every table to this Parquet file, one row per cell")
     
     args = parser.parse_args()
 
@@ -52,5 +62,9 @@ if __name__ == "__main__":
         args.pdf_path,
         args.images_folder,
         args.json_output,
-        args.excel_output
+        args.excel_output,
+        args.preset,
+        args.excel_backend,
+        args.consolidate_tables,
+        args.parquet_output
     )
\ No newline at end of file
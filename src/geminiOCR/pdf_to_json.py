@@ -1,47 +1,800 @@
 import os
 import json
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterator
 import google.generativeai as genai
+import google.ai.generativelanguage as glm
+from google.generativeai.client import FileServiceClient
 from dotenv import load_dotenv
 from pdf2image import convert_from_path
 from PIL import Image
 import concurrent.futures
+import heapq
+import itertools
+import math
+import mimetypes
+import random
+import re
 import time
+from collections import deque
 from datetime import datetime
-from threading import Lock
+from email.utils import parsedate_to_datetime
+from queue import Queue
+from threading import Condition, Event, Lock
+from google.api_core import exceptions as google_exceptions
+
+try:
+    from .layout_templates import LayoutTemplateRegistry
+    from .hybrid_ocr import CELL_PROMPT, HybridPage, HybridTableEngine, parse_cell_readings
+    from .page_router import PageRouter
+    from .page_crop import crop_to_content
+except ImportError:
+    from layout_templates import LayoutTemplateRegistry
+    from hybrid_ocr import CELL_PROMPT, HybridPage, HybridTableEngine, parse_cell_readings
+    from page_router import PageRouter
+    from page_crop import crop_to_content
 
 class APIRateLimiter:
     def __init__(self, calls_per_minute=10):
         self.calls_per_minute = calls_per_minute
         self.min_interval = 60.0 / calls_per_minute
         self.last_call_time = 0
+        self.recent_calls = deque()
         self.lock = Lock()
-    
+
+    def next_slot(self, not_before: float = 0.0) -> float:
+        return max(time.time(), not_before, self.last_call_time + self.min_interval)
+
+    def remaining_budget(self) -> int:
+        """Calls left in the trailing one-minute window"""
+        with self.lock:
+            cutoff = time.time() - 60.0
+            while self.recent_calls and self.recent_calls[0] <= cutoff:
+                self.recent_calls.popleft()
+            return self.calls_per_minute - len(self.recent_calls)
+
+    def reserve(self, not_before: float = 0.0) -> float:
+        """Claim the next call slot and return how long to wait for it"""
+        with self.lock:
+            slot_time = self.next_slot(not_before)
+            self.last_call_time = slot_time
+            self.recent_calls.append(slot_time)
+            return slot_time - time.time()
+
     def wait_if_needed(self):
+        sleep_time = self.reserve()
+        if sleep_time > 0:
+            logger.info(f"⏳ Rate limiting: waiting {sleep_time:.2f} seconds...")
+            time.sleep(sleep_time)
+
+class DeadlineExceeded(Exception):
+    pass
+
+class CircuitOpenError(Exception):
+    def __init__(self, retry_in: float):
+        super().__init__(f"Gemini circuit breaker is open, next probe in {retry_in:.1f}s")
+        self.retry_in = retry_in
+
+class Deadline:
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds if seconds else None
+
+    def remaining(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def check(self, stage: str) -> None:
+        if self.expired():
+            raise DeadlineExceeded(f"Page deadline of {self.seconds:.0f}s exceeded during {stage}")
+
+_RETRY_IN_PATTERN = re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE)
+_RETRY_DELAY_PATTERN = re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)")
+
+def retry_after_hint(error: Exception) -> Optional[float]:
+    """Server-suggested wait from a Retry-After header or a quota RetryInfo, if the error carries one"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    retry_after = headers.get("Retry-After") or headers.get("retry-after")
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    for detail in getattr(error, "details", None) or []:
+        retry_delay = getattr(detail, "retry_delay", None)
+        if retry_delay is not None:
+            return retry_delay.seconds + retry_delay.nanos / 1e9
+
+    message = str(error)
+    match = _RETRY_IN_PATTERN.search(message) or _RETRY_DELAY_PATTERN.search(message)
+    if match:
+        return float(match.group(1))
+    return None
+
+class RetryPolicy:
+    NON_RETRYABLE = (
+        DeadlineExceeded,
+        CircuitOpenError,
+        FileNotFoundError,
+        google_exceptions.InvalidArgument,
+        google_exceptions.PermissionDenied,
+        google_exceptions.Unauthenticated,
+        google_exceptions.NotFound,
+    )
+
+    def __init__(self, max_attempts=3, base_delay=2.0, max_delay=60.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def is_retryable(self, error: Exception) -> bool:
+        return not isinstance(error, self.NON_RETRYABLE)
+
+    def next_delay(self, failures: int, error: Exception, deadline: Optional[Deadline] = None) -> Optional[float]:
+        """Delay before the next attempt, or None when the stage should give up"""
+        if failures >= self.max_attempts or not self.is_retryable(error):
+            return None
+
+        hint = retry_after_hint(error)
+        if hint is not None:
+            delay = hint + random.uniform(0, self.base_delay)
+        else:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (failures - 1)))
+
+        remaining = deadline.remaining() if deadline else None
+        if remaining is not None and delay >= remaining:
+            return None
+        return delay
+
+    def run(self, stage: str, attempt_fn, deadline: Optional[Deadline] = None):
+        """Run attempt_fn in the calling thread under this policy (used outside the page queue)"""
+        failures = 0
+        while True:
+            try:
+                return attempt_fn()
+            except Exception as e:
+                failures += 1
+                delay = self.next_delay(failures, e, deadline)
+                if delay is None:
+                    raise
+                logger.warning(f"{stage} attempt {failures} failed: {e}. Retrying in {delay:.1f} seconds...")
+                time.sleep(delay)
+
+retry_policy = RetryPolicy()
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=60.0, probe_wait=5.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_wait = probe_wait
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.opened_at_wall = None
+        self.probe_in_flight = False
+        self.last_error = None
+        self.times_opened = 0
+        self.lock = Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError while open; in half-open state let a single probe call through"""
+        with self.lock:
+            if self.state == self.OPEN:
+                retry_in = self.reset_timeout - (time.monotonic() - self.opened_at)
+                if retry_in > 0:
+                    raise CircuitOpenError(retry_in)
+                logger.info("🔌 Circuit breaker half-open, sending probe request")
+                self.state = self.HALF_OPEN
+                self.probe_in_flight = False
+
+            if self.state == self.HALF_OPEN:
+                if self.probe_in_flight:
+                    raise CircuitOpenError(self.probe_wait)
+                self.probe_in_flight = True
+
+    def record_success(self):
+        with self.lock:
+            if self.state != self.CLOSED:
+                logger.info("🔌 Circuit breaker closed, Gemini backend recovered")
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.probe_in_flight = False
+
+    def release_probe(self):
+        with self.lock:
+            self.probe_in_flight = False
+
+    def record_failure(self, error: Exception):
+        with self.lock:
+            self.consecutive_failures += 1
+            self.last_error = str(error)
+            self.probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                    logger.error(f"🔌 Circuit breaker opened after {self.consecutive_failures} consecutive failures: {error}")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.opened_at_wall = datetime.now()
+
+    def status(self) -> Dict[str, Any]:
         with self.lock:
-            current_time = time.time()
-            time_since_last_call = current_time - self.last_call_time
-            if time_since_last_call < self.min_interval:
-                sleep_time = self.min_interval - time_since_last_call
-                logger.info(f"⏳ Rate limiting: waiting {sleep_time:.2f} seconds...")
-                time.sleep(sleep_time)
-            self.last_call_time = time.time()
+            status = {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "times_opened": self.times_opened,
+                "last_error": self.last_error
+            }
+            if self.state == self.OPEN:
+                status["opened_at"] = self.opened_at_wall.isoformat()
+                status["next_probe_in_seconds"] = round(max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 1)
+            return status
 
-api_limiter = APIRateLimiter(calls_per_minute=15)
+circuit_breaker = CircuitBreaker()
+
+DEFAULT_MODEL_NAME = 'gemini-2.0-flash'
+PIPELINE_STAGES = ("analysis", "extraction", "verification")
+
+class ModelRouting:
+    """Model per stage; a stage whose output fails its parse/quality check is re-run on the escalation model"""
+    def __init__(self, analysis: Optional[str] = None, extraction: Optional[str] = None,
+                 verification: Optional[str] = None, escalation: Optional[str] = None):
+        self.stage_models = {
+            "analysis": analysis or DEFAULT_MODEL_NAME,
+            "extraction": extraction or DEFAULT_MODEL_NAME,
+            "verification": verification or DEFAULT_MODEL_NAME
+        }
+        self.escalation_model = escalation or self.stage_models["extraction"]
+
+    def model_for(self, stage: str) -> str:
+        return self.stage_models[stage]
+
+    def escalate(self, stage: str, model_name: str, reason: str) -> Optional[str]:
+        if model_name == self.escalation_model:
+            return None
+        logger.warning(f"⬆️ {stage} on {model_name} failed its check ({reason}), escalating to {self.escalation_model}")
+        call_stats.record_escalation(stage)
+        return self.escalation_model
+
+default_routing = ModelRouting(
+    analysis=os.getenv('GEMINI_ANALYSIS_MODEL'),
+    extraction=os.getenv('GEMINI_EXTRACTION_MODEL'),
+    verification=os.getenv('GEMINI_VERIFICATION_MODEL'),
+    escalation=os.getenv('GEMINI_ESCALATION_MODEL')
+)
+
+class PipelinePreset:
+    """Named set of speed/quality settings applied together to a run"""
+    def __init__(self, name: str, dpi: int, max_workers: int, verify: bool, routing: ModelRouting,
+                 jpeg_quality: int = 95, hedge: bool = False):
+        self.name = name
+        self.dpi = dpi
+        self.max_workers = max_workers
+        self.verify = verify
+        self.routing = routing
+        self.jpeg_quality = jpeg_quality
+        self.hedge = hedge
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "dpi": self.dpi,
+            "max_workers": self.max_workers,
+            "verify": self.verify,
+            "models": dict(self.routing.stage_models, escalation=self.routing.escalation_model),
+            "jpeg_quality": self.jpeg_quality,
+            "hedge": self.hedge
+        }
+
+PRESETS = {
+    # Lower DPI and JPEG quality, the lite model throughout (escalating to flash) and no verification pass
+    "fast": PipelinePreset("fast", dpi=200, max_workers=4, verify=False, jpeg_quality=80, hedge=True,
+                           routing=ModelRouting("gemini-2.0-flash-lite", "gemini-2.0-flash-lite", "gemini-2.0-flash-lite", "gemini-2.0-flash")),
+    "balanced": PipelinePreset("balanced", dpi=300, max_workers=2, verify=True, jpeg_quality=90,
+                               routing=ModelRouting("gemini-2.0-flash-lite", "gemini-2.0-flash", "gemini-2.0-flash-lite", "gemini-2.0-flash")),
+    # Full resolution and the strongest model for extraction and verification
+    "accurate": PipelinePreset("accurate", dpi=400, max_workers=2, verify=True, jpeg_quality=95,
+                               routing=ModelRouting("gemini-2.0-flash", "gemini-2.5-pro", "gemini-2.5-pro", "gemini-2.5-pro"))
+}
+DEFAULT_PRESET = os.getenv('GEMINI_PRESET')
+
+def get_preset(name: Optional[str]) -> Optional[PipelinePreset]:
+    if not name:
+        return None
+    if name not in PRESETS:
+        raise ValueError(f"Unknown preset '{name}', expected one of: {', '.join(PRESETS)}")
+    return PRESETS[name]
+
+def preset_routing(preset: Optional[str], analysis: Optional[str] = None, extraction: Optional[str] = None,
+                   verification: Optional[str] = None, escalation: Optional[str] = None) -> ModelRouting:
+    """Stage models of the preset (or the GEMINI_*_MODEL defaults), with explicitly given models taking precedence"""
+    settings = get_preset(preset)
+    base = settings.routing if settings is not None else default_routing
+    return ModelRouting(analysis or base.model_for("analysis"),
+                        extraction or base.model_for("extraction"),
+                        verification or base.model_for("verification"),
+                        escalation or (base.escalation_model if settings is not None else os.getenv('GEMINI_ESCALATION_MODEL')))
+
+QUOTA_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+
+# Longest wait for the File API to finish processing an upload (capped by the page deadline)
+FILE_PROCESSING_TIMEOUT = float(os.getenv('GEMINI_FILE_PROCESSING_TIMEOUT', '60'))
+
+# "json" asks for tables as nested arrays, "tsv" as tab-separated text decoded locally (fewer output tokens)
+TABLE_FORMATS = ("json", "tsv")
+TABLE_FORMAT = os.getenv('GEMINI_TABLE_FORMAT', 'json')
+
+# Learned form layouts let matching pages skip the structure-analysis call; set a path to keep them between runs
+template_registry = LayoutTemplateRegistry(os.getenv('GEMINI_LAYOUT_TEMPLATES_PATH')) if os.getenv('GEMINI_LAYOUT_TEMPLATES', '0') == '1' else None
+
+# Ruled pages read cell by cell with local OCR (PaddleOCR), only uncertain or handwritten cells going to the model
+hybrid_engine = HybridTableEngine() if os.getenv('OCR_HYBRID_TABLES', '0') == '1' else None
+
+# Clean printed pages are classified locally and extracted with local OCR alone, without any model call
+page_router = PageRouter(hybrid_engine) if os.getenv('OCR_PAGE_ROUTER', '0') == '1' else None
+
+# Pages are cropped to their content before saving so margins and scanner borders are not uploaded;
+# page_crops keeps each page's offsets for mapping coordinates back to the full page until the
+# page's result takes them over
+CROP_PAGES = os.getenv('GEMINI_CROP_PAGES', '1') != '0'
+
+# Run structure analysis and a generic extraction side by side, and only wait for the analysis
+# (and extract again with it) when the generic result fails the quality checks
+SPECULATIVE_EXTRACTION = os.getenv('GEMINI_SPECULATIVE_EXTRACTION', '0') == '1'
+GENERIC_STRUCTURE_ANALYSIS = "Not available. Infer the layout, tables and fields directly from the image."
+page_crops = {}
+
+class UploadedFile:
+    def __init__(self, name: str, uri: str, mime_type: str, delete=None):
+        self.name = name
+        self.uri = uri
+        self.mime_type = mime_type
+        self.delete = delete
+
+class GeminiBackend:
+    """Per-key Gemini clients; genai.configure() only sets a process-wide key, so each pooled key gets its own"""
+    def create_model(self, api_key: str, model_name: str):
+        key_model = genai.GenerativeModel(model_name)
+        key_model._client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+        return key_model
+
+    def upload_file(self, api_key: str, path: str, mime_type: str, timeout: float = FILE_PROCESSING_TIMEOUT) -> UploadedFile:
+        file_client = FileServiceClient(client_options={"api_key": api_key})
+        uploaded = file_client.create_file(path, mime_type=mime_type, display_name=os.path.basename(path))
+        give_up_at = time.monotonic() + timeout
+        while uploaded.state == glm.File.State.PROCESSING:
+            if time.monotonic() >= give_up_at:
+                try:
+                    file_client.delete_file(name=uploaded.name)
+                except Exception as e:
+                    logger.warning(f"Could not delete unprocessed upload {uploaded.name}: {e}")
+                raise TimeoutError(f"File API still processing {path} after {timeout:.0f}s")
+            time.sleep(1)
+            uploaded = file_client.get_file(name=uploaded.name)
+        if uploaded.state == glm.File.State.FAILED:
+            raise ValueError(f"File API could not process {path}")
+        return UploadedFile(uploaded.name, uploaded.uri, mime_type, lambda: file_client.delete_file(name=uploaded.name))
+
+gemini_backend = GeminiBackend()
+
+class APIKeySlot:
+    def __init__(self, name: str, api_key: str, calls_per_minute: int, backend: GeminiBackend = gemini_backend):
+        self.name = name
+        self.api_key = api_key
+        self.limiter = APIRateLimiter(calls_per_minute=calls_per_minute)
+        self.backend = backend
+        self.cooldown_until = 0.0
+        self.calls = 0
+        self.quota_errors = 0
+        self.models = {}
+        self.lock = Lock()
+
+    def model(self, model_name: str = DEFAULT_MODEL_NAME):
+        with self.lock:
+            if model_name not in self.models:
+                self.models[model_name] = self.backend.create_model(self.api_key, model_name)
+            return self.models[model_name]
+
+class APIKeyPool:
+    """API keys with their own rate limiters; calls go to the key with the most budget left in its window"""
+    def __init__(self, api_keys: List[str], calls_per_minute=15, quota_cooldown=60.0, backend: GeminiBackend = gemini_backend):
+        if not api_keys:
+            raise ValueError("At least one API key is required")
+        self.quota_cooldown = quota_cooldown
+        self.slots = [APIKeySlot(f"key{i+1}", key, calls_per_minute, backend) for i, key in enumerate(api_keys)]
+        self.lock = Lock()
+
+    def acquire(self) -> APIKeySlot:
+        with self.lock:
+            now = time.time()
+            available = [slot for slot in self.slots if slot.cooldown_until <= now]
+            if not available:
+                available = [min(self.slots, key=lambda slot: slot.cooldown_until)]
+            slot = max(available, key=lambda slot: (slot.limiter.remaining_budget(), -slot.limiter.next_slot()))
+            sleep_time = slot.limiter.reserve(not_before=slot.cooldown_until)
+            slot.calls += 1
+
+        if sleep_time > 0:
+            logger.info(f"⏳ Rate limiting ({slot.name}): waiting {sleep_time:.2f} seconds...")
+            time.sleep(sleep_time)
+        return slot
+
+    def report_error(self, slot: APIKeySlot, error: Exception):
+        if not isinstance(error, QUOTA_ERRORS):
+            return
+        cooldown = retry_after_hint(error) or self.quota_cooldown
+        with self.lock:
+            slot.quota_errors += 1
+            slot.cooldown_until = max(slot.cooldown_until, time.time() + cooldown)
+        logger.warning(f"🔑 {slot.name} hit its quota, out of rotation for {cooldown:.0f}s")
+
+    def status(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        return [{
+            "key": slot.name,
+            "calls": slot.calls,
+            "quota_errors": slot.quota_errors,
+            "remaining_budget": slot.limiter.remaining_budget(),
+            "cooling_down_seconds": round(max(0.0, slot.cooldown_until - now), 1)
+        } for slot in self.slots]
+
+def get_backend_status() -> Dict[str, Any]:
+    return {
+        "circuit_breaker": circuit_breaker.status(),
+        "api_keys": key_pool.status()
+    }
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+class CallStats:
+    """Latency and usage of Gemini calls. The process-wide instance keeps a rolling window for the
+    hedge thresholds and copies every call into the documents being tracked, so each document's
+    percentiles cover only its own calls"""
+    def __init__(self, window=200, min_hedge_samples=10):
+        self.window = window
+        self.min_hedge_samples = min_hedge_samples
+        self.latencies = {}
+        self.calls = {}
+        self.hedges_sent = {}
+        self.hedge_wins = {}
+        self.deadline_misses = {}
+        self.escalations = {}
+        self.model_usage = {}
+        # unused_analyses counts speculative analysis calls that were already sent when their result was dropped
+        self.speculations = {"accepted": 0, "rejected": 0, "unused_analyses": 0}
+        self.documents = []
+        self.lock = Lock()
+
+    def begin_document(self) -> "CallStats":
+        """Start collecting the calls of one document; pass the result to end_document when it is done"""
+        document = CallStats(window=None, min_hedge_samples=self.min_hedge_samples)
+        with self.lock:
+            self.documents.append(document)
+        return document
+
+    def end_document(self, document: "CallStats"):
+        with self.lock:
+            if document in self.documents:
+                self.documents.remove(document)
+
+    def _tracking(self) -> List["CallStats"]:
+        with self.lock:
+            return list(self.documents)
+
+    def record(self, stage: str, latency: float, hedge_won: bool = False, model_name: Optional[str] = None, response=None):
+        with self.lock:
+            self.latencies.setdefault(stage, deque(maxlen=self.window)).append(latency)
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+            if hedge_won:
+                self.hedge_wins[stage] = self.hedge_wins.get(stage, 0) + 1
+            if model_name:
+                usage = self.model_usage.setdefault((stage, model_name), {
+                    "calls": 0, "total_seconds": 0.0, "input_tokens": 0, "cached_tokens": 0, "output_tokens": 0
+                })
+                usage["calls"] += 1
+                usage["total_seconds"] += latency
+                metadata = getattr(response, "usage_metadata", None)
+                usage["input_tokens"] += getattr(metadata, "prompt_token_count", 0) or 0
+                usage["cached_tokens"] += getattr(metadata, "cached_content_token_count", 0) or 0
+                usage["output_tokens"] += getattr(metadata, "candidates_token_count", 0) or 0
+        for document in self._tracking():
+            document.record(stage, latency, hedge_won, model_name, response)
+
+    def record_escalation(self, stage: str):
+        with self.lock:
+            self.escalations[stage] = self.escalations.get(stage, 0) + 1
+        for document in self._tracking():
+            document.record_escalation(stage)
+
+    def record_hedge(self, stage: str):
+        with self.lock:
+            self.hedges_sent[stage] = self.hedges_sent.get(stage, 0) + 1
+        for document in self._tracking():
+            document.record_hedge(stage)
+
+    def record_speculation(self, accepted: bool):
+        with self.lock:
+            self.speculations["accepted" if accepted else "rejected"] += 1
+        for document in self._tracking():
+            document.record_speculation(accepted)
+
+    def record_unused_analysis(self):
+        with self.lock:
+            self.speculations["unused_analyses"] += 1
+        for document in self._tracking():
+            document.record_unused_analysis()
+
+    def record_deadline_miss(self, stage: str):
+        with self.lock:
+            self.deadline_misses[stage] = self.deadline_misses.get(stage, 0) + 1
+        for document in self._tracking():
+            document.record_deadline_miss(stage)
+
+    def hedge_threshold(self, stage: str) -> Optional[float]:
+        with self.lock:
+            samples = self.latencies.get(stage)
+            if not samples or len(samples) < self.min_hedge_samples:
+                return None
+            return _percentile(sorted(samples), 0.95)
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            stages = {}
+            for stage, samples in self.latencies.items():
+                ordered = sorted(samples)
+                stages[stage] = {
+                    "calls": self.calls.get(stage, 0),
+                    "p50_seconds": round(_percentile(ordered, 0.50), 3),
+                    "p95_seconds": round(_percentile(ordered, 0.95), 3),
+                    "p99_seconds": round(_percentile(ordered, 0.99), 3),
+                    "max_seconds": round(ordered[-1], 3),
+                    "hedges_sent": self.hedges_sent.get(stage, 0),
+                    "hedge_wins": self.hedge_wins.get(stage, 0),
+                    "deadline_misses": self.deadline_misses.get(stage, 0),
+                    "escalations": self.escalations.get(stage, 0)
+                }
+            for stage, misses in self.deadline_misses.items():
+                stages.setdefault(stage, {"calls": 0, "deadline_misses": misses})
+            models = []
+            for (stage, model_name), usage in sorted(self.model_usage.items()):
+                models.append({
+                    "stage": stage,
+                    "model": model_name,
+                    "calls": usage["calls"],
+                    "avg_seconds": round(usage["total_seconds"] / usage["calls"], 3),
+                    "input_tokens": usage["input_tokens"],
+                    "cached_tokens": usage["cached_tokens"],
+                    "output_tokens": usage["output_tokens"]
+                })
+            return {
+                "stages": stages,
+                "models": models,
+                "extra_calls": sum(self.hedges_sent.values()),
+                "speculation": dict(self.speculations)
+            }
+
+call_stats = CallStats()
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 load_dotenv()
-api_key = os.getenv('GOOGLE_API_KEY')
-if not api_key:
-    raise ValueError("GOOGLE_API_KEY environment variable not found. Please set it in your .env file.")
+api_keys = [key.strip() for key in os.getenv('GOOGLE_API_KEYS', '').split(',') if key.strip()]
+if not api_keys and os.getenv('GOOGLE_API_KEY'):
+    api_keys = [os.getenv('GOOGLE_API_KEY')]
+if not api_keys:
+    raise ValueError("GOOGLE_API_KEY (or comma-separated GOOGLE_API_KEYS) environment variable not found. Please set it in your .env file.")
+
+genai.configure(api_key=api_keys[0])
+key_pool = APIKeyPool(api_keys, calls_per_minute=int(os.getenv('GEMINI_CALLS_PER_MINUTE', '15')))
+
+# Model calls run on this pool so the page worker can stop waiting once its deadline passes. It is sized
+# from the key pool so that adding keys adds calls in flight
+CALLS_IN_FLIGHT_PER_KEY = int(os.getenv('GEMINI_CALLS_IN_FLIGHT_PER_KEY', '8'))
+
+def create_call_executor(pool: APIKeyPool) -> concurrent.futures.ThreadPoolExecutor:
+    return concurrent.futures.ThreadPoolExecutor(max_workers=CALLS_IN_FLIGHT_PER_KEY * len(pool.slots), thread_name_prefix="gemini-call")
+
+_call_executor = create_call_executor(key_pool)
+
+def configure_api_keys(keys: List[str], calls_per_minute: int = 15, backend: GeminiBackend = gemini_backend) -> APIKeyPool:
+    """Replace the key pool, e.g. to spread one run over several projects' quotas"""
+    global key_pool, _call_executor
+    key_pool = APIKeyPool(keys, calls_per_minute=calls_per_minute, backend=backend)
+    previous_executor, _call_executor = _call_executor, create_call_executor(key_pool)
+    previous_executor.shutdown(wait=False)
+    return key_pool
+
+class PageUploadManager:
+    """Uploads each page image to the File API once per key and reuses the file for every stage"""
+    def __init__(self):
+        self.uploads = {}
+        self.upload_locks = {}
+        self.uploaded_bytes = 0
+        self.inline_bytes = 0
+        self.inline_equivalent_bytes = 0
+        self.lock = Lock()
+
+    def part_for(self, slot: APIKeySlot, image_path: str, deadline: Optional[Deadline] = None):
+        size = os.path.getsize(image_path)
+        upload_key = (slot.name, image_path)
+        with self.lock:
+            self.inline_equivalent_bytes += size
+            upload_lock = self.upload_locks.setdefault(upload_key, Lock())
+
+        with upload_lock:
+            uploaded = self.uploads.get(upload_key)
+            if uploaded is None:
+                try:
+                    mime_type = mimetypes.guess_type(image_path)[0] or "image/jpeg"
+                    remaining = deadline.remaining() if deadline else None
+                    timeout = FILE_PROCESSING_TIMEOUT if remaining is None else min(FILE_PROCESSING_TIMEOUT, remaining)
+                    uploaded = slot.backend.upload_file(slot.api_key, image_path, mime_type, timeout)
+                except Exception as e:
+                    logger.warning(f"Upload of {os.path.basename(image_path)} failed, sending it inline: {e}")
+                    with self.lock:
+                        self.inline_bytes += size
+                    return Image.open(image_path)
+                logger.info(f"📤 Uploaded {os.path.basename(image_path)} via {slot.name}: {uploaded.name}")
+                with self.lock:
+                    self.uploads[upload_key] = uploaded
+                    self.uploaded_bytes += size
+
+        return glm.Part(file_data=glm.FileData(mime_type=uploaded.mime_type, file_uri=uploaded.uri))
+
+    def delete_all(self):
+        with self.lock:
+            uploads = list(self.uploads.values())
+            self.uploads.clear()
+        if not uploads:
+            return
+
+        def delete(uploaded: UploadedFile):
+            try:
+                uploaded.delete()
+                return True
+            except Exception as e:
+                logger.warning(f"Could not delete uploaded file {uploaded.name}: {e}")
+                return False
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(8, len(uploads))) as executor:
+            deleted = sum(executor.map(delete, uploads))
+        logger.info(f"🗑️ Deleted {deleted}/{len(uploads)} uploaded page files")
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            sent = self.uploaded_bytes + self.inline_bytes
+            saved = self.inline_equivalent_bytes - sent
+            return {
+                "uploaded_bytes": self.uploaded_bytes,
+                "inline_bytes": self.inline_bytes,
+                "inline_equivalent_bytes": self.inline_equivalent_bytes,
+                "reduction_percent": round(100.0 * saved / self.inline_equivalent_bytes, 1) if self.inline_equivalent_bytes else 0.0
+            }
+
+    def log_summary(self) -> Dict[str, Any]:
+        summary = self.summary()
+        logger.info(f"📊 Page bytes sent: {(summary['uploaded_bytes'] + summary['inline_bytes']) / 1e6:.2f} MB "
+                    f"vs {summary['inline_equivalent_bytes'] / 1e6:.2f} MB inline "
+                    f"({summary['reduction_percent']}% less)")
+        return summary
 
-genai.configure(api_key=api_key)
-model = genai.GenerativeModel('gemini-2.0-flash')
+class PageImage:
+    """Page image placeholder, resolved per API key to an uploaded file or inline image when the call is made"""
+    def __init__(self, image_path: str, uploads: Optional[PageUploadManager] = None):
+        self.image_path = image_path
+        self.uploads = uploads
 
-def convert_pdf_to_images(pdf_path: str, output_folder: str, dpi: int = 300) -> List[str]:
+    def resolve(self, slot: APIKeySlot, deadline: Optional[Deadline] = None):
+        if self.uploads is not None:
+            return self.uploads.part_for(slot, self.image_path, deadline)
+        return Image.open(self.image_path)
+
+def _call_model(slot: APIKeySlot, model_name: str, contents: List[Any], deadline: Deadline,
+                instructions: Optional[str] = None, on_text: Optional[Callable[[str], None]] = None):
+    remaining = deadline.remaining()
+    request_options = {"timeout": max(remaining, 1.0)} if remaining is not None else None
+    try:
+        contents = [part.resolve(slot, deadline) if isinstance(part, PageImage) else part for part in contents]
+        if instructions:
+            contents = [instructions] + list(contents)
+        call_model = slot.model(model_name)
+        if on_text is None:
+            return call_model.generate_content(contents, request_options=request_options)
+
+        response = call_model.generate_content(contents, stream=True, request_options=request_options)
+        for chunk in response:
+            if chunk.parts:
+                on_text(chunk.text)
+        return response
+    except Exception as e:
+        key_pool.report_error(slot, e)
+        raise
+
+def _submit_call(model_name: str, contents: List[Any], deadline: Deadline, instructions: Optional[str] = None,
+                 on_text: Optional[Callable[[str], None]] = None):
+    slot = key_pool.acquire()
+    deadline.check("rate limiting")
+    return _call_executor.submit(_call_model, slot, model_name, contents, deadline, instructions, on_text)
+
+def generate_with_deadline(stage: str, contents: List[Any], deadline: Optional[Deadline] = None, hedge: bool = False,
+                           model_name: str = DEFAULT_MODEL_NAME, instructions: Optional[str] = None,
+                           on_text: Optional[Callable[[str], None]] = None):
+    """Call Gemini within the page deadline, optionally hedging calls slower than the stage's p95.
+
+    instructions is the stage's fixed instruction block, sent ahead of contents. With on_text the
+    response is streamed and each chunk passed on as it arrives; streamed calls are never hedged.
+    """
+    deadline = deadline or Deadline()
+    deadline.check(stage)
+    circuit_breaker.before_call()
+    try:
+        response = _wait_for_call(stage, model_name, contents, deadline, hedge and on_text is None, instructions, on_text)
+    except Exception as e:
+        # Quota and client errors say nothing about the backend's health, so they leave the breaker as it was
+        if isinstance(e, DeadlineExceeded) or (retry_policy.is_retryable(e) and not isinstance(e, QUOTA_ERRORS)):
+            circuit_breaker.record_failure(e)
+        else:
+            circuit_breaker.release_probe()
+        raise
+    circuit_breaker.record_success()
+    return response
+
+def _wait_for_call(stage: str, model_name: str, contents: List[Any], deadline: Deadline, hedge: bool,
+                   instructions: Optional[str] = None, on_text: Optional[Callable[[str], None]] = None):
+    hedge_after = call_stats.hedge_threshold(stage) if hedge else None
+    pending = {_submit_call(model_name, contents, deadline, instructions, on_text)}
+    start_time = time.monotonic()
+    hedged = None
+    last_error = None
+
+    while pending:
+        timeout = deadline.remaining()
+        if hedge_after is not None and hedged is None:
+            until_hedge = max(0.0, hedge_after - (time.monotonic() - start_time))
+            timeout = until_hedge if timeout is None else min(timeout, until_hedge)
+
+        done, pending = concurrent.futures.wait(pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                for other in pending:
+                    other.cancel()
+                call_stats.record(stage, time.monotonic() - start_time, future is hedged, model_name, future.result())
+                return future.result()
+            last_error = future.exception()
+
+        if deadline.expired():
+            for other in pending:
+                other.cancel()
+            call_stats.record_deadline_miss(stage)
+            raise DeadlineExceeded(f"Page deadline of {deadline.seconds:.0f}s exceeded waiting for {stage}")
+
+        if pending and hedged is None and hedge_after is not None and time.monotonic() - start_time >= hedge_after:
+            logger.info(f"🔁 {stage} call exceeded p95 ({hedge_after:.2f}s), sending hedged request")
+            hedged = _submit_call(model_name, contents, deadline, instructions)
+            pending.add(hedged)
+            call_stats.record_hedge(stage)
+
+    raise last_error
+
+def convert_pdf_to_images(pdf_path: str, output_folder: str, dpi: int = 300, crop: Optional[bool] = None, jpeg_quality: int = 95) -> List[str]:
     logger.info(f"Converting PDF: {pdf_path} to images")
     logger.info(f"Using DPI: {dpi}, Output folder: {output_folder}")
     
@@ -56,14 +809,25 @@ def convert_pdf_to_images(pdf_path: str, output_folder: str, dpi: int = 300) ->
         conversion_time = time.time() - start_time
         logger.info(f"PDF conversion completed in {conversion_time:.2f} seconds. Found {len(images)} pages")
         
+        crop = CROP_PAGES if crop is None else crop
+        original_pixels = cropped_pixels = 0
         image_paths = []
         for i, image in enumerate(images):
             logger.info(f"Saving page {i+1}/{len(images)}...")
             image_path = os.path.join(output_folder, f'page_{i+1}.jpg')
-            image.save(image_path, 'JPEG', quality=95)
+            page_crops.pop(image_path, None)
+            if crop:
+                original_pixels += image.width * image.height
+                image, page_crop = crop_to_content(image)
+                cropped_pixels += image.width * image.height
+                if page_crop is not None:
+                    page_crops[image_path] = page_crop
+            image.save(image_path, 'JPEG', quality=jpeg_quality)
             image_paths.append(image_path)
             logger.info(f"Saved: {image_path}")
             
+        if crop and original_pixels:
+            logger.info(f"✂️ Cropped {len(image_paths)} pages to their content: {cropped_pixels / original_pixels:.0%} of the original pixels kept")
         logger.info(f"Successfully extracted {len(image_paths)} pages from {pdf_path}")
         return image_paths
     
@@ -71,15 +835,8 @@ def convert_pdf_to_images(pdf_path: str, output_folder: str, dpi: int = 300) ->
         logger.error(f"Error converting PDF to images: {e}")
         raise
 
-def analyze_document_structure(image_path: str) -> str:
-    logger.info(f"Analyzing document structure: {image_path}")
-
-    try:
-        start_time = time.time()
-        image = Image.open(image_path)
-        logger.info(f"Image loaded, size: {image.size}")
-        
-        structure_prompt = """
+# Fixed instruction blocks, sent ahead of the page-specific text and image in every request
+STRUCTURE_PROMPT = """
         Analyze this document page and describe its structure in detail.
         
         Focus on identifying:
@@ -94,43 +851,7 @@ def analyze_document_structure(image_path: str) -> str:
         extracting structured information from this document.
         """
 
-        api_limiter.wait_if_needed()
-        
-        logger.info("Sending analysis request to Gemini...")
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                response = model.generate_content([structure_prompt, image])
-                analysis_time = time.time() - start_time
-                
-                structure_analysis = response.text
-                logger.info(f"Structure analysis completed in {analysis_time:.2f} seconds")
-                return structure_analysis
-                
-            except Exception as e:
-                logger.warning(f"Attempt {attempt + 1} failed: {str(e)}")
-                if attempt < max_retries - 1:
-                    wait_time = (attempt + 1) * 5  # 5, 10, 15 seconds
-                    logger.info(f"Retrying in {wait_time} seconds...")
-                    time.sleep(wait_time)
-                else:
-                    raise e
-    except Exception as e:
-        logger.error(f"Error analyzing document structure: {e}")
-        return "Error analyzing document structure"
-
-def extract_structured_content(image_path: str, structure_analysis: str) -> Dict[str, Any]:
-    logger.info(f"Extracting structured content from: {image_path}")
-    
-    try:
-        start_time = time.time()
-        image = Image.open(image_path)
-    
-        extraction_prompt = f"""
-        Based on the structural analysis, extract ALL content from this document page into well-structured JSON.
-        
-        Structural analysis: {structure_analysis}
-        
+EXTRACTION_GUIDELINES = """
         Instructions for extraction:
         
         1. For general text:
@@ -157,104 +878,88 @@ def extract_structured_content(image_path: str, structure_analysis: str) -> Dict
         - Capture page numbers, dates, and reference numbers
         - Extract any metadata like document ID or revision info
         
-        OUTPUT FORMAT:
+        """
+
+SIGNATURE_INSTRUCTION = """
+        VERY IMPORTANT: If a signature is detected in a column like User Sign or anything of that kind, add an indication that signature detected in that column in your structure output
+        """
+
+EXTRACTION_INSTRUCTIONS = EXTRACTION_GUIDELINES + """OUTPUT FORMAT:
         Return ONLY valid JSON with this structure:
-        {{
+        {
             "document_type": "detected document type (e.g., invoice, form, report)",
-            "page_metadata": {{
+            "page_metadata": {
                 "page_number": "detected page number if present",
                 "header": "header text if present",
                 "footer": "footer text if present"
-            }},
+            },
             "sections": [
-                {{
+                {
                     "section_type": "text|table|form|chart",
                     "section_title": "section heading if present",
                     "content": "appropriate content structure based on section type"
-                }}
+                }
             ],
             "tables": [
-                {{
+                {
                     "table_title": "title if present",
                     "headers": ["header1", "header2", ...],
                     "data": [
                         ["row1col1", "row1col2", ...],
                         ["row2col1", "row2col2", ...]
                     ]
-                }}
+                }
             ],
-            "key_value_pairs": {{
+            "key_value_pairs": {
                 "key1": "value1",
                 "key2": "value2"
-            }}
-        }}
+            }
+        }
         
         Make sure to use proper JSON escaping for special characters and ensure the output is valid JSON.
-        If certain elements don't exist, include them as empty arrays or objects rather than omitting them.
-        VERY IMPORTANT: If a signature is detected in a column like User Sign or anything of that kind, add an indication that signature detected in that column in your structure output
-        """
+        If certain elements don't exist, include them as empty arrays or objects rather than omitting them.""" + SIGNATURE_INSTRUCTION
 
-        api_limiter.wait_if_needed()
+# Cells may not contain raw tabs or newlines in the tsv block, so line breaks inside a cell are written as this marker
+TSV_LINE_BREAK = "<br>"
 
-        logger.info("Sending extraction request to Gemini...")
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                response = model.generate_content([extraction_prompt, image])
-                extraction_time = time.time() - start_time
-                logger.info(f"Content extraction completed in {extraction_time:.2f} seconds")
-                
-                extract_text = response.text
-                logger.info(f"Raw response length: {len(extract_text)} characters")
-                break
-                
-            except Exception as e:
-                logger.warning(f"Extraction attempt {attempt + 1} failed: {str(e)}")
-                if attempt < max_retries - 1:
-                    wait_time = (attempt + 1) * 5
-                    logger.info(f"Retrying in {wait_time} seconds...")
-                    time.sleep(wait_time)
-                else:
-                    logger.error(f"All extraction attempts failed for {image_path}")
-                    return {"error": f"API failed after {max_retries} attempts: {str(e)}"}
+EXTRACTION_TSV_INSTRUCTIONS = EXTRACTION_GUIDELINES + """OUTPUT FORMAT:
+        Return ONLY valid JSON with this structure. Tables are written as tab-separated text rather than nested arrays:
+        {
+            "document_type": "detected document type (e.g., invoice, form, report)",
+            "page_metadata": {
+                "page_number": "detected page number if present",
+                "header": "header text if present",
+                "footer": "footer text if present"
+            },
+            "sections": [
+                {
+                    "section_type": "text|table|form|chart",
+                    "section_title": "section heading if present",
+                    "content": "appropriate content structure based on section type"
+                }
+            ],
+            "tables": [
+                {
+                    "table_title": "title if present",
+                    "tsv": "header1\\theader2\\nrow1col1\\trow1col2\\nrow2col1\\trow2col2"
+                }
+            ],
+            "key_value_pairs": {
+                "key1": "value1",
+                "key2": "value2"
+            }
+        }
         
-        json_start = extract_text.find('{')
-        json_end = extract_text.rfind('}') + 1
+        Rules for "tsv":
+        - The first line holds the column headers and every following line is one table row
+        - Separate cells with a tab (\\t) and rows with a newline (\\n); do not quote cells
+        - Give every row as many cells as the header line, leaving missing values empty
+        - Write a line break inside a cell as """ + TSV_LINE_BREAK + """ and a tab inside a cell as a space
         
-        if json_start >= 0 and json_end > json_start:
-            logger.info("Parsing JSON response...")
-            json_content = extract_text[json_start:json_end]
-            try:
-                structured_data = json.loads(json_content)
-                logger.info(f"Successfully parsed JSON structure with {len(structured_data)} top-level keys")
-                return structured_data
-            except json.JSONDecodeError as e:
-                logger.error(f"Invalid JSON from model: {e}")
-                return {"error": "Failed to parse JSON", "raw_text": extract_text}
-        else:
-            logger.error("No JSON found in model response")
-            return {"error": "No JSON found in response", "raw_text": extract_text}
-    
-    except Exception as e:
-        logger.error(f"Error extracting structured content: {e}")
-        return {"error": str(e)}
+        Make sure to use proper JSON escaping for special characters and ensure the output is valid JSON.
+        If certain elements don't exist, include them as empty arrays or objects rather than omitting them.""" + SIGNATURE_INSTRUCTION
 
-def verify_extraction(image_path: str, structured_data: Dict[str, Any]) -> Dict[str, Any]:
-    logger.info(f"Verifying extraction quality for: {image_path}")
-    
-    try:
-        start_time = time.time()
-        image = Image.open(image_path)
-        structured_json = json.dumps(structured_data, indent=2)
-    
-        verification_prompt = f"""
-        I need you to verify and correct the structured data extracted from this document image.
-        
-        Extracted structured data:
-        ```json
-        {structured_json}
-        ```
-        
+VERIFICATION_INSTRUCTIONS = """
         Verification tasks:
         1. Check for missing content (sections, tables, form fields, etc.)
         2. Verify accuracy of all extracted text, numbers, and values
@@ -270,82 +975,728 @@ def verify_extraction(image_path: str, structured_data: Dict[str, Any]) -> Dict[
         OUTPUT FORMAT:
         Either:
         VERIFICATION_PASSED
-        {{original JSON}}
+        {original JSON}
         
         Or:
         CORRECTIONS_NEEDED
-        {{corrected JSON}}
+        {corrected JSON}
         """
-        
-        logger.info("Sending verification request to Gemini...")
-        response = model.generate_content([verification_prompt, image])
-        verification_time = time.time() - start_time
-        
-        verification_text = response.text
-        logger.info(f"Verification completed in {verification_time:.2f} seconds")
-        
-        if "VERIFICATION_PASSED" in verification_text:
-            logger.info("Verification PASSED - no corrections needed")
+
+def request_structure_analysis(image_path: str, deadline: Optional[Deadline] = None, hedge: bool = False,
+                               routing: Optional[ModelRouting] = None, uploads: Optional[PageUploadManager] = None) -> str:
+    routing = routing or default_routing
+    start_time = time.time()
+    image = PageImage(image_path, uploads)
+    
+    model_name = routing.model_for("analysis")
+    logger.info(f"Sending analysis request to Gemini ({model_name})...")
+    structure_analysis = generate_with_deadline("analysis", [image], deadline, hedge, model_name, STRUCTURE_PROMPT).text
+    if not structure_analysis.strip():
+        escalation_model = routing.escalate("analysis", model_name, "empty analysis")
+        if escalation_model:
+            structure_analysis = generate_with_deadline("analysis", [image], deadline, hedge, escalation_model, STRUCTURE_PROMPT).text
+    analysis_time = time.time() - start_time
+
+    logger.info(f"Structure analysis completed in {analysis_time:.2f} seconds")
+    return structure_analysis
+
+def analysis_failed(error: Exception) -> str:
+    logger.error(f"Error analyzing document structure: {error}")
+    return "Error analyzing document structure"
+
+def decode_tsv_line(line: str) -> List[str]:
+    return [cell.replace(TSV_LINE_BREAK, "\n") for cell in line.rstrip("\r").split("\t")]
+
+def decode_tsv_tables(structured_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn tables returned as tab-separated text back into the headers/data schema"""
+    for table in structured_data.get("tables") or []:
+        if isinstance(table, dict) and isinstance(table.get("tsv"), str):
+            lines = [decode_tsv_line(line) for line in table.pop("tsv").split("\n") if line.strip("\r")]
+            table["headers"] = lines[0] if lines else []
+            table["data"] = lines[1:]
+    return structured_data
+
+def parse_extraction_response(extract_text: str) -> Dict[str, Any]:
+    json_start = extract_text.find('{')
+    json_end = extract_text.rfind('}') + 1
+    
+    if json_start >= 0 and json_end > json_start:
+        logger.info("Parsing JSON response...")
+        json_content = extract_text[json_start:json_end]
+        try:
+            structured_data = json.loads(json_content)
+            logger.info(f"Successfully parsed JSON structure with {len(structured_data)} top-level keys")
+            if isinstance(structured_data, dict):
+                decode_tsv_tables(structured_data)
             return structured_data
-        
-        elif "CORRECTIONS_NEEDED" in verification_text:
-            logger.info(f"Corrections needed for {image_path}")
-            json_start = verification_text.find('{')
-            json_end = verification_text.rfind('}') + 1
-            
-            if json_start >= 0 and json_end > json_start:
-                json_content = verification_text[json_start:json_end]
-                try:
-                    corrected_data = json.loads(json_content)
-                    return corrected_data
-                except json.JSONDecodeError as e:
-                    logger.error(f"Invalid JSON in verification response: {e}")
-                    return structured_data
-            else:
-                logger.error("No corrected JSON found in verification response")
-                return structured_data
+        except json.JSONDecodeError as e:
+            logger.error(f"Invalid JSON from model: {e}")
+            return {"error": "Failed to parse JSON", "raw_text": extract_text}
+    else:
+        logger.error("No JSON found in model response")
+        return {"error": "No JSON found in response", "raw_text": extract_text}
+
+def extraction_quality_issues(structured_data: Dict[str, Any]) -> List[str]:
+    if not isinstance(structured_data, dict):
+        return ["response is not a JSON object"]
+    if "error" in structured_data:
+        return [structured_data["error"]]
+
+    issues = []
+    tables = structured_data.get("tables") or []
+    if not isinstance(tables, list):
+        return ["tables is not a list"]
+    for table_idx, table in enumerate(tables):
+        if not isinstance(table, dict) or not isinstance(table.get("data", []), list):
+            issues.append(f"table {table_idx+1} is malformed")
+            continue
+        headers = table.get("headers") or []
+        ragged_rows = sum(1 for row in table.get("data") or [] if not isinstance(row, list) or (headers and len(row) != len(headers)))
+        if ragged_rows:
+            issues.append(f"table {table_idx+1} has {ragged_rows} rows not matching its {len(headers)} headers")
+    return issues
+
+class TableRowStreamParser:
+    """Incremental scan of streamed extraction JSON that emits each table's title, headers and rows as soon as they close"""
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = 0
+        self.tsv = None
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, int, Any]]:
+        """Add a chunk of response text and return the (kind, table index, value) events it completed"""
+        self.text += chunk
+        events = []
+        while self.pos < len(self.text) and not self.done:
+            char = self.text[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                    if char == "n" and self.tsv is not None:
+                        self._tsv_line(self.pos - 1, events)
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.tsv is not None:
+                        self._tsv_line(self.pos, events)
+                        self.tsv = None
+                    self._string_closed(events)
+            elif not self.stack:
+                # Skip anything the model put before the JSON, e.g. a ```json fence
+                if char == "{":
+                    self._open("object")
+            elif char == '"':
+                self.in_string = True
+                self.string_start = self.pos
+                self._string_opened()
+            elif char in "{[":
+                self._open("object" if char == "{" else "array")
+            elif char in "}]":
+                self._close(events)
+            elif char == ",":
+                frame = self.stack[-1]
+                if frame["type"] == "array":
+                    frame["index"] += 1
+                else:
+                    frame["expect_key"] = True
+            elif char == ":":
+                self.stack[-1]["expect_key"] = False
+            self.pos += 1
+        return events
+
+    def _path(self) -> Tuple:
+        return tuple(frame["key"] for frame in self.stack[1:])
+
+    def _value(self, start: int):
+        try:
+            return json.loads(self.text[start:self.pos + 1])
+        except json.JSONDecodeError:
+            return None
+
+    def _open(self, kind: str):
+        key = None
+        if self.stack:
+            parent = self.stack[-1]
+            key = parent["index"] if parent["type"] == "array" else parent["member"]
+        self.stack.append({"type": kind, "key": key, "start": self.pos, "index": 0, "member": None, "expect_key": True})
+
+    def _close(self, events: List[Tuple[str, int, Any]]):
+        path = self._path()
+        frame = self.stack.pop()
+        if not self.stack:
+            self.done = True
+            return
+        if frame["type"] != "array" or len(path) < 3 or path[0] != "tables":
+            return
+        if len(path) == 4 and path[2] == "data":
+            kind = "row"
+        elif len(path) == 3 and path[2] == "headers":
+            kind = "headers"
         else:
-            logger.warning("Unexpected verification response format")
+            return
+        value = self._value(frame["start"])
+        if isinstance(value, list):
+            events.append((kind, path[1], value))
+
+    def _string_opened(self):
+        frame = self.stack[-1]
+        path = self._path()
+        if frame["type"] == "object" and not frame["expect_key"] and frame["member"] == "tsv" and len(path) == 2 and path[0] == "tables":
+            self.tsv = {"table": path[1], "line_start": self.pos + 1, "lines": 0}
+
+    def _tsv_line(self, end: int, events: List[Tuple[str, int, Any]]):
+        """Emit the tab-separated line that ends at end inside a streaming "tsv" string"""
+        raw = self.text[self.tsv["line_start"]:end]
+        self.tsv["line_start"] = end + 2
+        try:
+            line = json.loads('"' + raw + '"')
+        except json.JSONDecodeError:
+            return
+        if not line.strip("\r"):
+            return
+        kind = "headers" if self.tsv["lines"] == 0 else "row"
+        self.tsv["lines"] += 1
+        events.append((kind, self.tsv["table"], decode_tsv_line(line)))
+
+    def _string_closed(self, events: List[Tuple[str, int, Any]]):
+        frame = self.stack[-1]
+        if frame["type"] != "object":
+            return
+        value = self._value(self.string_start)
+        if frame["expect_key"]:
+            frame["member"] = value
+            return
+        path = self._path()
+        if frame["member"] == "table_title" and len(path) == 2 and path[0] == "tables":
+            events.append(("title", path[1], value))
+
+def page_number_from_path(image_path: str) -> int:
+    return int(os.path.basename(image_path).split('_')[1].split('.')[0])
+
+def page_info_for(image_path: str) -> Dict[str, Any]:
+    """Page number, path and crop of a finished page; the crop entry is handed over and dropped from page_crops"""
+    page_info = {
+        "page_number": page_number_from_path(image_path),
+        "image_path": image_path
+    }
+    crop = page_crops.pop(image_path, None)
+    if crop is not None:
+        page_info["crop"] = crop
+    return page_info
+
+class PageRowStream:
+    """Forwards the rows of one page's extraction to a consumer while the response is still streaming.
+
+    Streamed rows are provisional: a "reset" event drops the rows of an attempt that is retried or
+    escalated, and the closing "page" event carries the verified content.
+    """
+    def __init__(self, image_path: str, emit: Callable[[Dict[str, Any]], None]):
+        self.page_number = page_number_from_path(image_path)
+        self.emit = emit
+        self.parser = None
+        self.rows_sent = False
+        self.start_time = time.time()
+        self.first_row_seconds = None
+        self.lock = Lock()
+
+    def start_attempt(self) -> Callable[[str], None]:
+        with self.lock:
+            if self.rows_sent:
+                self.emit({"type": "reset", "page": self.page_number})
+                self.rows_sent = False
+            parser = TableRowStreamParser()
+            self.parser = parser
+        return lambda text: self.feed(parser, text)
+
+    def feed(self, parser: TableRowStreamParser, text: str):
+        events = parser.feed(text)
+        with self.lock:
+            # Chunks still arriving from an abandoned call are dropped
+            if parser is not self.parser:
+                return
+            for kind, table_index, value in events:
+                if kind == "row" and self.first_row_seconds is None:
+                    self.first_row_seconds = time.time() - self.start_time
+                    logger.info(f"First row of page {self.page_number} streamed after {self.first_row_seconds:.2f} seconds")
+                self.rows_sent = True
+                self.emit({"type": kind, "page": self.page_number, "table": table_index, kind: value})
+
+    def finish(self, result: Dict[str, Any]):
+        with self.lock:
+            self.parser = None
+            self.emit({"type": "page", "page": self.page_number, "content": result})
+
+def extraction_prompt_for(structure_analysis: str) -> str:
+    return f"""
+        Based on the structural analysis, extract ALL content from this document page into well-structured JSON.
+        
+        Structural analysis: {structure_analysis}
+        """
+
+def extraction_instructions_for_format() -> str:
+    if TABLE_FORMAT == "tsv":
+        return EXTRACTION_TSV_INSTRUCTIONS
+    return EXTRACTION_INSTRUCTIONS
+
+def request_structured_content(image_path: str, structure_analysis: str, deadline: Optional[Deadline] = None, hedge: bool = False,
+                               routing: Optional[ModelRouting] = None, uploads: Optional[PageUploadManager] = None,
+                               rows: Optional[PageRowStream] = None, escalate: bool = True) -> Dict[str, Any]:
+    routing = routing or default_routing
+    start_time = time.time()
+    image = PageImage(image_path, uploads)
+    extraction_prompt = extraction_prompt_for(structure_analysis)
+    extraction_instructions = extraction_instructions_for_format()
+
+    model_name = routing.model_for("extraction")
+    while True:
+        logger.info(f"Sending extraction request to Gemini ({model_name})...")
+        on_text = rows.start_attempt() if rows is not None else None
+        extract_text = generate_with_deadline("extraction", [extraction_prompt, image], deadline, hedge, model_name,
+                                              extraction_instructions, on_text).text
+        extraction_time = time.time() - start_time
+        logger.info(f"Content extraction completed in {extraction_time:.2f} seconds")
+        logger.info(f"Raw response length: {len(extract_text)} characters")
+
+        structured_data = parse_extraction_response(extract_text)
+        issues = extraction_quality_issues(structured_data)
+        model_name = routing.escalate("extraction", model_name, "; ".join(issues)) if issues and escalate else None
+        if not model_name:
             return structured_data
-    
+
+def extraction_failed(image_path: str, error: Exception) -> Dict[str, Any]:
+    if not retry_policy.is_retryable(error):
+        logger.error(f"Error extracting structured content: {error}")
+        return {"error": str(error)}
+    logger.error(f"All extraction attempts failed for {image_path}")
+    return {"error": f"API failed after {retry_policy.max_attempts} attempts: {str(error)}"}
+
+# Analysis calls started by a speculative extraction keep running here while the page moves on
+_speculation_executor = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculative-analysis")
+
+def _drop_analysis(analysis: concurrent.futures.Future):
+    """Cancel a speculative analysis that is no longer needed; one already sent cannot be recalled and still costs its call"""
+    if not analysis.cancel():
+        call_stats.record_unused_analysis()
+
+def speculative_extraction(image_path: str, deadline: Optional[Deadline] = None, hedge: bool = False,
+                           routing: Optional[ModelRouting] = None, uploads: Optional[PageUploadManager] = None,
+                           rows: Optional[PageRowStream] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Run structure analysis and a generic extraction in parallel.
+
+    Returns (extraction, None) when the generic extraction passes the quality checks, and otherwise
+    (None, analysis) once the analysis is in, with analysis None if that call failed too.
+    """
+    analysis = _speculation_executor.submit(request_structure_analysis, image_path, deadline, hedge, routing, uploads)
+    try:
+        structured_data = request_structured_content(image_path, GENERIC_STRUCTURE_ANALYSIS, deadline, hedge, routing, uploads, rows, escalate=False)
     except Exception as e:
-        logger.error(f"Error during verification: {e}")
-        return structured_data
+        # A failed call says nothing about the generic extraction, so the task queue backs off, retries or gives up as usual
+        if isinstance(e, (DeadlineExceeded, CircuitOpenError)) or retry_policy.is_retryable(e):
+            _drop_analysis(analysis)
+            raise
+        logger.warning(f"Speculative extraction of {os.path.basename(image_path)} failed ({e}), extracting again with the analysis")
+    else:
+        issues = extraction_quality_issues(structured_data)
+        call_stats.record_speculation(not issues)
+        if not issues:
+            _drop_analysis(analysis)
+            logger.info(f"⚡ Speculative extraction of {os.path.basename(image_path)} passed its checks, not waiting for the analysis")
+            return structured_data, None
+        logger.info(f"Speculative extraction of {os.path.basename(image_path)} rejected ({'; '.join(issues)}), extracting again with the analysis")
 
-def process_single_page(image_path: str) -> Dict[str, Any]:
     try:
-        structure_analysis = analyze_document_structure(image_path)
+        return None, analysis.result(timeout=deadline.remaining() if deadline is not None else None)
+    except concurrent.futures.TimeoutError:
+        raise DeadlineExceeded(f"Page deadline of {deadline.seconds:.0f}s exceeded waiting for analysis")
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.warning(f"Analysis for {os.path.basename(image_path)} failed alongside the speculative extraction: {e}")
+        return None, None
 
-        structured_data = extract_structured_content(image_path, structure_analysis)
+def parse_verification_response(verification_text: str, structured_data: Dict[str, Any], image_path: str) -> Tuple[Dict[str, Any], bool]:
+    """Return the verified data and whether the response followed the expected format"""
+    if "VERIFICATION_PASSED" in verification_text:
+        logger.info("Verification PASSED - no corrections needed")
+        return structured_data, True
 
-        verified_data = verify_extraction(image_path, structured_data)
+    elif "CORRECTIONS_NEEDED" in verification_text:
+        logger.info(f"Corrections needed for {image_path}")
+        json_start = verification_text.find('{')
+        json_end = verification_text.rfind('}') + 1
 
-        page_number = int(os.path.basename(image_path).split('_')[1].split('.')[0])
-        verified_data["page_info"] = {
-            "page_number": page_number,
-            "image_path": image_path
-        }
+        if json_start >= 0 and json_end > json_start:
+            json_content = verification_text[json_start:json_end]
+            try:
+                corrected_data = json.loads(json_content)
+                return corrected_data, True
+            except json.JSONDecodeError as e:
+                logger.error(f"Invalid JSON in verification response: {e}")
+                return structured_data, False
+        else:
+            logger.error("No corrected JSON found in verification response")
+            return structured_data, False
+    else:
+        logger.warning("Unexpected verification response format")
+        return structured_data, False
+
+def verification_prompt_for(structured_data: Dict[str, Any]) -> str:
+    structured_json = json.dumps(structured_data, indent=2)
+    return f"""
+        I need you to verify and correct the structured data extracted from this document image.
         
-        return verified_data
-    
-    except Exception as e:
-        logger.error(f"Error processing page {image_path}: {e}")
-        return {"error": str(e), "page": image_path}
-    
-def process_single_page_with_timeout(image_path: str, timeout_minutes=10) -> Dict[str, Any]:
-    """Process a single page with timeout protection"""
-    logger.info(f"Starting processing of {os.path.basename(image_path)}")
+        Extracted structured data:
+        ```json
+        {structured_json}
+        ```
+        """
+
+def request_verification(image_path: str, structured_data: Dict[str, Any], deadline: Optional[Deadline] = None, hedge: bool = False,
+                         routing: Optional[ModelRouting] = None, uploads: Optional[PageUploadManager] = None) -> Dict[str, Any]:
+    routing = routing or default_routing
     start_time = time.time()
-    
+    image = PageImage(image_path, uploads)
+    verification_prompt = verification_prompt_for(structured_data)
+
+    model_name = routing.model_for("verification")
+    while True:
+        logger.info(f"Sending verification request to Gemini ({model_name})...")
+        verification_text = generate_with_deadline("verification", [verification_prompt, image], deadline, hedge, model_name,
+                                                   VERIFICATION_INSTRUCTIONS).text
+        verification_time = time.time() - start_time
+        logger.info(f"Verification completed in {verification_time:.2f} seconds")
+
+        verified_data, well_formed = parse_verification_response(verification_text, structured_data, image_path)
+        model_name = None if well_formed else routing.escalate("verification", model_name, "unusable verification response")
+        if not model_name:
+            return verified_data
+
+def verification_failed(image_path: str, structured_data: Dict[str, Any], error: Exception) -> Dict[str, Any]:
+    if isinstance(error, DeadlineExceeded):
+        logger.warning(f"Skipping verification for {image_path}: {error}")
+    else:
+        logger.error(f"Error during verification: {error}")
+    return structured_data
+
+def request_cell_readings(page: HybridPage, deadline: Optional[Deadline] = None, hedge: bool = False,
+                          routing: Optional[ModelRouting] = None) -> Dict[str, str]:
+    """Read a hybrid page's flagged cells with one model call on a sheet of their crops"""
+    if not page.flagged:
+        return {}
+    routing = routing or default_routing
+    model_name = routing.model_for("extraction")
+    logger.info(f"Sending {len(page.flagged)} of {page.cell_count} cells of {os.path.basename(page.image_path)} to Gemini ({model_name})...")
+    response = generate_with_deadline("cells", [page.prompt(), page.sheet()], deadline, hedge, model_name, CELL_PROMPT)
+    readings = parse_cell_readings(response.text)
+    missing = len(page.flagged) - sum(1 for number in range(1, len(page.flagged) + 1) if str(number) in readings)
+    if missing:
+        logger.warning(f"Model returned no reading for {missing} cells of {os.path.basename(page.image_path)}; keeping the local OCR text")
+    return readings
+
+def read_hybrid_page(image_path: str, engine: HybridTableEngine, blocks: Optional[List[Dict[str, Any]]] = None) -> Optional[HybridPage]:
     try:
-        result = process_single_page(image_path)
-        processing_time = time.time() - start_time
-        logger.info(f"Completed {os.path.basename(image_path)} in {processing_time:.2f} seconds")
-        return result
+        return engine.read_page(image_path, blocks)
     except Exception as e:
-        processing_time = time.time() - start_time
-        logger.error(f"Failed {os.path.basename(image_path)} after {processing_time:.2f} seconds: {e}")
-        return {"error": str(e), "page": image_path}
+        logger.warning(f"Local OCR failed for {os.path.basename(image_path)}, using the Gemini pipeline: {e}")
+        return None
+
+class PageTask:
+    def __init__(self, image_path: str, timeout_minutes=10, hedge: bool = False, routing: Optional[ModelRouting] = None,
+                 uploads: Optional[PageUploadManager] = None):
+        self.image_path = image_path
+        self.timeout_minutes = timeout_minutes
+        self.hedge = hedge
+        self.routing = routing
+        self.uploads = uploads
+        self.rows = None
+        self.templates = None
+        self.template = None
+        self.engine = None
+        self.hybrid_page = None
+        self.router = None
+        self.route = None
+        self.verify = True
+        self.speculative = False
+        self.deadline = None
+        self.start_time = None
+        self.stage = "analysis"
+        self.failures = 0
+        self.structure_analysis = None
+        self.structured_data = None
+        self.result = None
+        self.cancel = None
+
+# How often a worker waiting on a backed-off task checks whether the run was cancelled
+CANCEL_POLL_SECONDS = 0.5
+
+class RetryQueue:
+    """Delay queue of page tasks; a failed stage is re-enqueued with its backoff so the worker can move on.
+    Once cancel is set, backed-off tasks are handed out straight away so they can be finished as cancelled"""
+    def __init__(self, cancel: Optional[Event] = None):
+        self.heap = []
+        self.counter = itertools.count()
+        self.condition = Condition()
+        self.outstanding = 0
+        self.cancel = cancel
+
+    def put(self, task: PageTask, delay: float = 0.0, new: bool = False):
+        with self.condition:
+            if new:
+                self.outstanding += 1
+            heapq.heappush(self.heap, (time.monotonic() + delay, next(self.counter), task))
+            self.condition.notify()
+
+    def task_done(self):
+        with self.condition:
+            self.outstanding -= 1
+            self.condition.notify_all()
+
+    def get(self) -> Optional[PageTask]:
+        with self.condition:
+            while True:
+                if self.outstanding == 0:
+                    return None
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+                wait_time = self.heap[0][0] - time.monotonic()
+                if wait_time <= 0 or (self.cancel is not None and self.cancel.is_set()):
+                    return heapq.heappop(self.heap)[2]
+                self.condition.wait(wait_time if self.cancel is None else min(wait_time, CANCEL_POLL_SECONDS))
+
+def _finish_page_task(task: PageTask, result: Dict[str, Any]):
+    name = os.path.basename(task.image_path)
+    processing_time = time.time() - task.start_time
+    page_info = page_info_for(task.image_path)
+    if "error" in result and "page" in result:
+        logger.error(f"Failed {name} after {processing_time:.2f} seconds: {result['error']}")
+    else:
+        result["page_info"] = page_info
+        logger.info(f"Completed {name} in {processing_time:.2f} seconds")
+    task.result = result
+
+def _stage_gave_up(task: PageTask, e: Exception) -> float:
+    task.failures = 0
+    if task.stage == "verification":
+        _finish_page_task(task, verification_failed(task.image_path, task.structured_data, e))
+    elif isinstance(e, DeadlineExceeded):
+        _finish_page_task(task, {"error": str(e), "page": task.image_path})
+    elif task.stage == "cells":
+        logger.error(f"Cell reading failed for {task.image_path}, keeping the local OCR text: {e}")
+        task.engine.record(task.hybrid_page)
+        _finish_page_task(task, task.hybrid_page.structured_data())
+    elif task.stage in ("route", "hybrid"):
+        logger.error(f"Local OCR failed for {task.image_path}, using the Gemini pipeline: {e}")
+        task.stage = "analysis"
+    elif task.stage == "analysis":
+        task.structure_analysis = analysis_failed(e)
+        task.stage = "extraction"
+    else:
+        task.structured_data = extraction_failed(task.image_path, e)
+        if task.verify:
+            task.stage = "verification"
+        else:
+            _finish_page_task(task, task.structured_data)
+    return 0.0
+
+def _extraction_done(task: PageTask, structured_data: Dict[str, Any]):
+    task.structured_data = structured_data
+    if task.templates is not None:
+        task.templates.record_extraction(task.image_path, structured_data, task.template)
+    if task.verify:
+        task.stage = "verification"
+    else:
+        _finish_page_task(task, structured_data)
+
+def advance_page_task(task: PageTask) -> float:
+    """Run one attempt of the task's current stage and return the delay before it should run again"""
+    if task.deadline is None:
+        logger.info(f"Starting processing of {os.path.basename(task.image_path)}")
+        task.start_time = time.time()
+        task.deadline = Deadline(task.timeout_minutes * 60) if task.timeout_minutes else Deadline()
+
+    if task.cancel is not None and task.cancel.is_set():
+        _finish_page_task(task, {"error": "Processing cancelled", "page": task.image_path})
+        return 0.0
+
+    try:
+        if task.stage == "route":
+            decision = task.router.route(task.image_path)
+            task.route = decision.route
+            if decision.result is not None:
+                _finish_page_task(task, decision.result)
+            elif task.engine is not None:
+                task.hybrid_page = read_hybrid_page(task.image_path, task.engine, decision.blocks)
+                task.stage = "cells" if task.hybrid_page is not None else "analysis"
+            else:
+                task.stage = "analysis"
+        elif task.stage == "hybrid":
+            task.hybrid_page = read_hybrid_page(task.image_path, task.engine)
+            task.stage = "cells" if task.hybrid_page is not None else "analysis"
+        elif task.stage == "cells":
+            readings = request_cell_readings(task.hybrid_page, task.deadline, task.hedge, task.routing)
+            task.engine.record(task.hybrid_page)
+            _finish_page_task(task, task.hybrid_page.structured_data(readings))
+        elif task.stage == "analysis":
+            if task.templates is not None and task.template is None:
+                task.template = task.templates.match(task.image_path)
+            if task.template is not None:
+                task.structure_analysis = task.template.describe()
+                task.stage = "extraction"
+            elif task.speculative:
+                # Speculate once; if the analysis failed too, the stage is retried without speculation
+                task.speculative = False
+                structured_data, structure_analysis = speculative_extraction(task.image_path, task.deadline, task.hedge, task.routing, task.uploads, task.rows)
+                if structured_data is not None:
+                    _extraction_done(task, structured_data)
+                elif structure_analysis is not None:
+                    task.structure_analysis = structure_analysis
+                    task.stage = "extraction"
+            else:
+                task.structure_analysis = request_structure_analysis(task.image_path, task.deadline, task.hedge, task.routing, task.uploads)
+                task.stage = "extraction"
+        elif task.stage == "extraction":
+            _extraction_done(task, request_structured_content(task.image_path, task.structure_analysis, task.deadline, task.hedge, task.routing, task.uploads, task.rows))
+        else:
+            _finish_page_task(task, request_verification(task.image_path, task.structured_data, task.deadline, task.hedge, task.routing, task.uploads))
+        task.failures = 0
+        return 0.0
+
+    except CircuitOpenError as e:
+        remaining = task.deadline.remaining()
+        if remaining is None or remaining > e.retry_in:
+            logger.info(f"Parking {os.path.basename(task.image_path)} ({task.stage}) for {e.retry_in:.1f}s while the circuit breaker is open")
+            return e.retry_in + random.uniform(0, 1.0)
+        return _stage_gave_up(task, e)
+
+    except Exception as e:
+        if not isinstance(e, DeadlineExceeded):
+            task.failures += 1
+            delay = retry_policy.next_delay(task.failures, e, task.deadline)
+            if delay is not None:
+                logger.warning(f"{task.stage.capitalize()} attempt {task.failures} failed for {os.path.basename(task.image_path)}: {e}. "
+                               f"Re-queued in {delay:.1f} seconds")
+                return delay
+        return _stage_gave_up(task, e)
+
+def _page_worker(queue: RetryQueue, on_complete):
+    while True:
+        task = queue.get()
+        if task is None:
+            return
+        # Run the page's next stage straight away unless it has to back off, so pages finish in order
+        # and their rows become available as early as possible
+        delay = 0.0
+        while task.result is None and delay == 0.0:
+            try:
+                delay = advance_page_task(task)
+            except Exception as e:
+                logger.error(f"Error processing page {task.image_path}: {e}")
+                task.result = {"error": str(e), "page": task.image_path}
+        if task.result is not None:
+            on_complete(task)
+            queue.task_done()
+        else:
+            queue.put(task, delay)
+
+def run_page_tasks(image_paths: List[str], max_workers: int = 2, timeout_minutes=10, hedge: bool = False,
+                   routing: Optional[ModelRouting] = None, uploads: Optional[PageUploadManager] = None,
+                   on_row: Optional[Callable[[Dict[str, Any]], None]] = None,
+                   templates: Optional[LayoutTemplateRegistry] = None, engine: Optional[HybridTableEngine] = None,
+                   router: Optional[PageRouter] = None, verify: bool = True, speculative: Optional[bool] = None,
+                   cancel: Optional[Event] = None) -> List[Dict[str, Any]]:
+    """Process the pages on a pool of workers; setting cancel stops them before their next model call"""
+    queue = RetryQueue(cancel)
+    for image_path in image_paths:
+        task = PageTask(image_path, timeout_minutes, hedge, routing, uploads)
+        task.cancel = cancel
+        if on_row is not None:
+            task.rows = PageRowStream(image_path, on_row)
+        task.templates = templates
+        task.verify = verify
+        task.speculative = SPECULATIVE_EXTRACTION if speculative is None else speculative
+        if engine is not None:
+            task.engine = engine
+            task.stage = "hybrid"
+        if router is not None:
+            task.router = router
+            task.stage = "route"
+        queue.put(task, new=True)
+
+    page_results = []
+    total_pages = len(image_paths)
+    progress_lock = Lock()
+
+    def on_complete(task: PageTask):
+        with progress_lock:
+            page_results.append(task.result)
+            completed = len(page_results)
+            logger.info(f"{os.path.basename(task.image_path)} completed ({completed}/{total_pages}) - {(completed/total_pages)*100:.1f}%")
+        if task.rows is not None:
+            task.rows.finish(task.result)
+        if task.templates is not None:
+            task.templates.forget(task.image_path)
+        if task.router is not None and task.route is not None:
+            task.router.record_page(task.route, time.time() - task.start_time)
+
+    worker_count = max(1, min(max_workers, total_pages))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=worker_count) as executor:
+        workers = [executor.submit(_page_worker, queue, on_complete) for _ in range(worker_count)]
+        for worker in workers:
+            worker.result()
+
+    return page_results
+
+def process_single_page_with_timeout(image_path: str, timeout_minutes=10, hedge: bool = False,
+                                     routing: Optional[ModelRouting] = None, uploads: Optional[PageUploadManager] = None,
+                                     templates: Optional[LayoutTemplateRegistry] = None, engine: Optional[HybridTableEngine] = None,
+                                     router: Optional[PageRouter] = None, verify: bool = True, speculative: Optional[bool] = None) -> Dict[str, Any]:
+    """Process a single page with timeout protection, through the same page tasks as a whole document"""
+    return run_page_tasks([image_path], 1, timeout_minutes, hedge, routing, uploads, templates=templates, engine=engine,
+                          router=router, verify=verify, speculative=speculative)[0]
+
+def iter_page_rows(image_paths: List[str], max_workers: int = 2, timeout_minutes=10, routing: Optional[ModelRouting] = None,
+                   uploads: Optional[PageUploadManager] = None, templates: Optional[LayoutTemplateRegistry] = None,
+                   engine: Optional[HybridTableEngine] = None, router: Optional[PageRouter] = None,
+                   verify: bool = True, hedge: bool = False) -> Iterator[Dict[str, Any]]:
+    """Process pages and yield table events while extraction is still streaming.
+
+    Events are dicts with a "type" and "page": "title", "headers" and "row" carry the table index and
+    value, "reset" drops the page's rows so far, and "page" carries the final verified content.
+    Closing the iterator early cancels the remaining pages and returns once the workers have stopped,
+    so the caller can then delete the uploads and images.
+    """
+    events = Queue()
+    finished = object()
+    cancel = Event()
+
+    def run():
+        try:
+            run_page_tasks(image_paths, max_workers, timeout_minutes, hedge, routing, uploads, on_row=events.put, templates=templates,
+                           engine=engine, router=router, verify=verify, cancel=cancel)
+        except Exception as e:
+            logger.error(f"Error streaming page rows: {e}")
+            events.put({"type": "error", "error": str(e)})
+        finally:
+            events.put(finished)
+
+    runner = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="page-rows")
+    runner.submit(run)
+    try:
+        while True:
+            event = events.get()
+            if event is finished:
+                return
+            yield event
+    finally:
+        cancel.set()
+        runner.shutdown(wait=True)
 
 def merge_page_results(page_results: List[Dict[str, Any]]) -> Dict[str, Any]:
     logger.info("Merging results from all pages")
@@ -363,32 +1714,99 @@ def merge_page_results(page_results: List[Dict[str, Any]]) -> Dict[str, Any]:
         page_info = page_data.pop("page_info", {})
         page_number = page_info.get("page_number", 0)
 
-        merged_data["pages"].append({
+        page_entry = {
             "page_number": page_number,
             "content": page_data
-        })
+        }
+        if "crop" in page_info:
+            page_entry["crop"] = page_info["crop"]
+        merged_data["pages"].append(page_entry)
     
     return merged_data
 
-def process_pdf_to_json(pdf_path: str, output_folder: str, json_output_path: Optional[str] = None) -> Dict[str, Any]:
+def log_call_stats(stats_source: Optional[CallStats] = None) -> Dict[str, Any]:
+    stats = (stats_source or call_stats).summary()
+    for stage, stage_stats in stats["stages"].items():
+        if stage_stats.get("calls"):
+            logger.info(f"📊 {stage}: {stage_stats['calls']} calls, p50 {stage_stats['p50_seconds']}s, "
+                        f"p95 {stage_stats['p95_seconds']}s, p99 {stage_stats['p99_seconds']}s, max {stage_stats['max_seconds']}s, "
+                        f"hedges {stage_stats['hedges_sent']} (won {stage_stats['hedge_wins']}), "
+                        f"deadline misses {stage_stats['deadline_misses']}, escalations {stage_stats['escalations']}")
+        else:
+            logger.info(f"📊 {stage}: deadline misses {stage_stats['deadline_misses']}")
+    for usage in stats["models"]:
+        logger.info(f"📊 {usage['stage']} on {usage['model']}: {usage['calls']} calls, avg {usage['avg_seconds']}s, "
+                    f"{usage['input_tokens']} input ({usage['cached_tokens']} cached) / {usage['output_tokens']} output tokens")
+    logger.info(f"📊 Extra calls spent on hedging: {stats['extra_calls']}")
+    if stats["speculation"]["accepted"] or stats["speculation"]["rejected"]:
+        logger.info(f"📊 Speculative extractions: {stats['speculation']['accepted']} used directly, "
+                    f"{stats['speculation']['rejected']} redone with the structure analysis, "
+                    f"{stats['speculation']['unused_analyses']} analysis calls made but not used")
+    return stats
+
+def run_settings(preset: Optional[str] = None, hedge: bool = False,
+                 routing: Optional[ModelRouting] = None) -> Tuple[int, int, bool, int, bool, Optional[ModelRouting]]:
+    """(dpi, max_workers, verify, jpeg_quality, hedge, routing) for a run with the preset, or GEMINI_PRESET"""
+    settings = get_preset(preset or DEFAULT_PRESET)
+    if settings is None:
+        return 300, 2, True, 95, hedge, routing
+    logger.info(f"Using preset '{settings.name}': {settings.to_dict()}")
+    return (settings.dpi, settings.max_workers, settings.verify, settings.jpeg_quality,
+            hedge or settings.hedge, routing or settings.routing)
+
+def stream_pdf_rows(pdf_path: str, output_folder: str, preset: Optional[str] = None, page_timeout_minutes: float = 10,
+                    hedge: bool = False, routing: Optional[ModelRouting] = None, upload_pages: bool = True) -> Iterator[Dict[str, Any]]:
+    """Yield a "document" event with the page count, then the iter_page_rows events of the PDF, with the
+    same settings as process_pdf_to_json. Uploads are deleted once the workers have stopped"""
+    dpi, max_workers, verify, jpeg_quality, hedge, routing = run_settings(preset, hedge, routing)
+    image_paths = convert_pdf_to_images(pdf_path, output_folder, dpi, jpeg_quality=jpeg_quality)
+    uploads = PageUploadManager() if upload_pages else None
+    rows = iter_page_rows(image_paths, max_workers, page_timeout_minutes, routing, uploads, templates=template_registry,
+                          engine=hybrid_engine, router=page_router, verify=verify, hedge=hedge)
+    try:
+        yield {"type": "document", "total_pages": len(image_paths)}
+        yield from rows
+    finally:
+        rows.close()
+        if uploads is not None:
+            uploads.delete_all()
+
+def process_pdf_to_json(pdf_path: str, output_folder: str, json_output_path: Optional[str] = None, page_timeout_minutes: float = 10,
+                        hedge: bool = False, routing: Optional[ModelRouting] = None, upload_pages: bool = True,
+                        preset: Optional[str] = None) -> Dict[str, Any]:
     try:
-        image_paths = convert_pdf_to_images(pdf_path, output_folder)
+        dpi, max_workers, verify, jpeg_quality, hedge, routing = run_settings(preset, hedge, routing)
+
+        image_paths = convert_pdf_to_images(pdf_path, output_folder, dpi, jpeg_quality=jpeg_quality)
 
-        page_results = []
         total_pages = len(image_paths)
         logger.info(f"Starting parallel processing of {total_pages} pages...")
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=min(2, len(image_paths))) as executor:
-            future_to_page = {executor.submit(process_single_page_with_timeout, image_path): i+1 for i, image_path in enumerate(image_paths)}
-            
-            completed = 0
-            for future in concurrent.futures.as_completed(future_to_page):
-                page_num = future_to_page[future]
-                completed += 1
-                logger.info(f"Page {page_num} completed ({completed}/{total_pages}) - {(completed/total_pages)*100:.1f}%")
-                page_results.append(future.result())
+        uploads = PageUploadManager() if upload_pages else None
+        document_stats = call_stats.begin_document()
+        try:
+            page_results = run_page_tasks(image_paths, max_workers, page_timeout_minutes, hedge, routing, uploads,
+                                          templates=template_registry, engine=hybrid_engine, router=page_router, verify=verify)
+        finally:
+            call_stats.end_document(document_stats)
+            if uploads is not None:
+                uploads.delete_all()
+                uploads.log_summary()
 
         merged_data = merge_page_results(page_results)
+        log_call_stats(document_stats)
+        if template_registry is not None:
+            template_registry.save()
+            summary = template_registry.summary()
+            logger.info(f"📐 Layout templates: {summary['matched_pages']} pages matched, {summary['learned']} learned, {summary['templates']} known")
+        if hybrid_engine is not None:
+            summary = hybrid_engine.summary()
+            logger.info(f"🧮 Hybrid tables: {summary['pages']} pages, {summary['model_cells']}/{summary['cells']} cells sent to the model, "
+                        f"{summary['model_pixels']} of {summary['page_pixels']} page pixels")
+        if page_router is not None:
+            for route, route_stats in page_router.summary()["routes"].items():
+                logger.info(f"🚦 {route} route: {route_stats['pages']} pages, avg {route_stats['avg_seconds']}s per page, "
+                            f"{route_stats['pages_per_minute']} pages/min")
 
         if json_output_path:
             with open(json_output_path, 'w', encoding='utf-8') as f:
@@ -405,7 +1823,8 @@ def perform_final_qc(merged_data: Dict[str, Any], pdf_path: str) -> Dict[str, An
     logger.info("Performing final quality check")
     return merged_data
 
-def main(pdf_path: str, output_folder: str = "extracted_images", json_output_path: Optional[str] = None):
+def main(pdf_path: str, output_folder: str = "extracted_images", json_output_path: Optional[str] = None, page_timeout_minutes: float = 10,
+         hedge: bool = False, routing: Optional[ModelRouting] = None, upload_pages: bool = True, preset: Optional[str] = None):
     if not json_output_path:
         pdf_name = os.path.basename(pdf_path).split('.')[0]
         json_output_path = f"{pdf_name}_extracted.json"
@@ -414,7 +1833,7 @@ def main(pdf_path: str, output_folder: str = "extracted_images", json_output_pat
     logger.info(f"Starting processing of {pdf_path} at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     logger.info(f"Output JSON will be saved to {json_output_path}")
 
-    merged_data = process_pdf_to_json(pdf_path, output_folder, None)
+    merged_data = process_pdf_to_json(pdf_path, output_folder, None, page_timeout_minutes, hedge, routing, upload_pages, preset)
 
     final_data = perform_final_qc(merged_data, pdf_path)
 
@@ -432,7 +1851,34 @@ if __name__ == "__main__":
     parser.add_argument("pdf_path", help="Path to the PDF file")
     parser.add_argument("--output-folder", default="extracted_images", help="Folder to save extracted images")
     parser.add_argument("--json-output", help="Path to save the JSON output")
+    parser.add_argument("--page-timeout", type=float, default=10, help="Per-page deadline in minutes across all stages")
+    parser.add_argument("--hedge", action="store_true", help="Send a duplicate request when a call runs past the observed p95 latency")
+    parser.add_argument("--preset", choices=list(PRESETS), default=DEFAULT_PRESET, help="Speed/quality preset setting DPI, workers, verification, models and image quality together")
+    parser.add_argument("--analysis-model", default=None, help="Model for structure analysis (overrides the preset)")
+    parser.add_argument("--extraction-model", default=None, help="Model for content extraction (overrides the preset)")
+    parser.add_argument("--verification-model", default=None, help="Model for verification (overrides the preset)")
+    parser.add_argument("--table-format", choices=TABLE_FORMATS, default=TABLE_FORMAT, help="Ask for tables as JSON arrays or as tab-separated text (fewer output tokens)")
+    parser.add_argument("--templates", default=None, help="JSON file to load learned form layout templates from and save them to (implies --learn-templates)")
+    parser.add_argument("--learn-templates", action="store_true", help="Learn recurring form layouts and skip structure analysis on pages that match one")
+    parser.add_argument("--hybrid-tables", action="store_true", help="Read ruled tables with local OCR and send only uncertain or handwritten cells to the model")
+    parser.add_argument("--route-pages", action="store_true", help="Extract clean printed pages with local OCR alone and send only the rest to Gemini")
+    parser.add_argument("--no-crop", action="store_true", help="Send full pages instead of cropping them to their content")
+    parser.add_argument("--speculative", action="store_true", help="Run structure analysis and a generic extraction in parallel, using the generic result when it passes the quality checks")
+    parser.add_argument("--inline-images", action="store_true", help="Send page images inline with every call instead of uploading each page once via the File API")
+    parser.add_argument("--escalation-model", default=None, help="Model to retry a stage with when its output fails parsing or quality checks (defaults to the extraction model)")
     
     args = parser.parse_args()
-    
-    main(args.pdf_path, args.output_folder, args.json_output)
\ No newline at end of file
+
+    TABLE_FORMAT = args.table_format
+    if args.no_crop:
+        CROP_PAGES = False
+    if args.speculative:
+        SPECULATIVE_EXTRACTION = True
+    if args.hybrid_tables:
+        hybrid_engine = HybridTableEngine()
+    if args.route_pages or (page_router is not None and args.hybrid_tables):
+        page_router = PageRouter(hybrid_engine)
+    if args.templates or args.learn_templates:
+        template_registry = LayoutTemplateRegistry(args.templates)
+    routing = preset_routing(args.preset, args.analysis_model, args.extraction_model, args.verification_model, args.escalation_model)
+    main(args.pdf_path, args.output_folder, args.json_output, args.page_timeout, args.hedge, routing, not args.inline_images, args.preset)
\ No newline at end of file
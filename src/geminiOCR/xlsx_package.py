@@ -0,0 +1,137 @@
+import re
+import math
+import zipfile
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+from xml.sax.saxutils import escape, quoteattr
+
+from openpyxl.utils import get_column_letter
+from openpyxl.workbook.child import avoid_duplicate_name
+
+# Characters XML 1.0 cannot carry; they are dropped from cell text (openpyxl refuses them outright)
+ILLEGAL_XML_CHARACTERS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PACKAGE_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+SHEET_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+# Day 0 of Excel's (1900) date system; dates are written as days since then
+EXCEL_EPOCH = datetime(1899, 12, 30)
+# Ids below this are Excel's built-in number formats
+FIRST_CUSTOM_NUMBER_FORMAT = 164
+
+def styles_xml(definitions: Dict[str, Dict[str, Any]]) -> Tuple[str, Dict[str, int]]:
+    """styles.xml for the given style definitions, and the cellXfs index of each style name (0 is the default)"""
+    fonts = ['<font><sz val="11"/><name val="Calibri"/><family val="2"/><scheme val="minor"/></font>']
+    fills = ['<fill><patternFill patternType="none"/></fill>', '<fill><patternFill patternType="gray125"/></fill>']
+    borders = ['<border><left/><right/><top/><bottom/><diagonal/></border>']
+    xfs = ['<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>']
+    number_formats = []
+    style_ids = {}
+
+    for name, definition in definitions.items():
+        font_id = fill_id = border_id = number_format_id = 0
+        if definition.get("number_format"):
+            number_formats.append(f'<numFmt numFmtId="{FIRST_CUSTOM_NUMBER_FORMAT + len(number_formats)}" formatCode={quoteattr(definition["number_format"])}/>')
+            number_format_id = FIRST_CUSTOM_NUMBER_FORMAT + len(number_formats) - 1
+        if definition.get("bold") or definition.get("size"):
+            fonts.append(f'<font>{"<b/>" if definition.get("bold") else ""}<sz val="{definition.get("size", 11)}"/>'
+                         f'<name val="Calibri"/><family val="2"/><scheme val="minor"/></font>')
+            font_id = len(fonts) - 1
+        if definition.get("fill"):
+            fills.append(f'<fill><patternFill patternType="solid"><fgColor rgb="FF{definition["fill"]}"/>'
+                         f'<bgColor rgb="FF{definition["fill"]}"/></patternFill></fill>')
+            fill_id = len(fills) - 1
+        if definition.get("border"):
+            borders.append('<border><left style="thin"/><right style="thin"/><top style="thin"/><bottom style="thin"/><diagonal/></border>')
+            border_id = len(borders) - 1
+        applied = "".join(f' apply{part}="1"' for part, used in [("NumberFormat", number_format_id), ("Font", font_id), ("Fill", fill_id),
+                                                                 ("Border", border_id), ("Alignment", definition.get("align"))] if used)
+        xf = f'<xf numFmtId="{number_format_id}" fontId="{font_id}" fillId="{fill_id}" borderId="{border_id}" xfId="0"{applied}'
+        xfs.append(f'{xf}><alignment horizontal="{definition["align"]}"/></xf>' if definition.get("align") else f"{xf}/>")
+        style_ids[name] = len(xfs) - 1
+
+    xml = (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<styleSheet xmlns="{MAIN_NS}">'
+           + (f'<numFmts count="{len(number_formats)}">{"".join(number_formats)}</numFmts>' if number_formats else "") +
+           f'<fonts count="{len(fonts)}">{"".join(fonts)}</fonts>'
+           f'<fills count="{len(fills)}">{"".join(fills)}</fills>'
+           f'<borders count="{len(borders)}">{"".join(borders)}</borders>'
+           '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+           f'<cellXfs count="{len(xfs)}">{"".join(xfs)}</cellXfs>'
+           '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+           '</styleSheet>')
+    return xml, style_ids
+
+def cell_xml(reference: str, value: Any, style_id: int) -> str:
+    style = f' s="{style_id}"' if style_id else ""
+    if value is None or value == "":
+        return f'<c r="{reference}"{style}/>' if style_id else ""
+    if isinstance(value, datetime):
+        return f'<c r="{reference}"{style}><v>{(value.replace(tzinfo=None) - EXCEL_EPOCH).total_seconds() / 86400!r}</v></c>'
+    if isinstance(value, bool):
+        return f'<c r="{reference}"{style} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, int) or (isinstance(value, float) and math.isfinite(value)):
+        return f'<c r="{reference}"{style}><v>{value!r}</v></c>'
+    text = ILLEGAL_XML_CHARACTERS.sub("", str(value))
+    space = ' xml:space="preserve"' if text != text.strip() else ""
+    # Strings are written inline, so a sheet renders without any shared state and can be built in any process
+    return f'<c r="{reference}"{style} t="inlineStr"><is><t{space}>{escape(text)}</t></is></c>'
+
+def stored_column_width(characters: float) -> float:
+    """The width Excel stores for a column showing this many characters of the default font, as XlsxWriter writes it"""
+    # Calibri 11's digits are 7 pixels wide, with 5 pixels of cell padding (12 pixels per character below 1)
+    pixels = int(characters * 12 + 0.5) if characters < 1 else int(characters * 7 + 0.5) + 5
+    return int(pixels / 7 * 256) / 256
+
+def sheet_xml(rows: Iterable[List[Tuple[Any, Optional[str]]]], column_widths: Dict[int, float], style_ids: Dict[str, int]) -> bytes:
+    """A worksheet part from rows of (value, style name) cells"""
+    parts = [f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<worksheet xmlns="{MAIN_NS}">']
+    if column_widths:
+        parts.append("<cols>")
+        parts.extend(f'<col min="{col}" max="{col}" width="{stored_column_width(width)}" customWidth="1"/>' for col, width in sorted(column_widths.items()))
+        parts.append("</cols>")
+    parts.append("<sheetData>")
+    for row_idx, row in enumerate(rows, 1):
+        cells = "".join(cell_xml(f"{get_column_letter(col_idx)}{row_idx}", value, style_ids.get(style, 0))
+                        for col_idx, (value, style) in enumerate(row, 1))
+        if cells:
+            parts.append(f'<row r="{row_idx}">{cells}</row>')
+    parts.append("</sheetData></worksheet>")
+    return "".join(parts).encode("utf-8")
+
+class XlsxPackageWriter:
+    """Assembles an xlsx file from pre-rendered worksheet parts, written to the zip in order as they arrive"""
+    def __init__(self, path: str, styles: str):
+        self.zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+        self.styles = styles
+        self.sheet_names = []
+
+    def add_sheet(self, name: str, xml: bytes):
+        """Add the next worksheet; a name already in use is numbered the way openpyxl numbers it"""
+        self.sheet_names.append(avoid_duplicate_name(self.sheet_names, name))
+        self.zip.writestr(f"xl/worksheets/sheet{len(self.sheet_names)}.xml", xml)
+
+    def close(self):
+        count = len(self.sheet_names)
+        sheets = "".join(f'<sheet name={quoteattr(name)} sheetId="{i}" r:id="rId{i}"/>' for i, name in enumerate(self.sheet_names, 1))
+        sheet_rels = "".join(f'<Relationship Id="rId{i}" Type="{REL_NS}/worksheet" Target="worksheets/sheet{i}.xml"/>' for i in range(1, count + 1))
+        sheet_types = "".join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType="{SHEET_CONTENT_TYPE}"/>' for i in range(1, count + 1))
+
+        self.zip.writestr("xl/styles.xml", self.styles)
+        self.zip.writestr("xl/workbook.xml",
+                          f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}"><sheets>{sheets}</sheets></workbook>')
+        self.zip.writestr("xl/_rels/workbook.xml.rels",
+                          f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<Relationships xmlns="{PACKAGE_REL_NS}">{sheet_rels}'
+                          f'<Relationship Id="rId{count + 1}" Type="{REL_NS}/styles" Target="styles.xml"/></Relationships>')
+        self.zip.writestr("_rels/.rels",
+                          f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<Relationships xmlns="{PACKAGE_REL_NS}">'
+                          f'<Relationship Id="rId1" Type="{REL_NS}/officeDocument" Target="xl/workbook.xml"/></Relationships>')
+        self.zip.writestr("[Content_Types].xml",
+                          '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                          '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                          '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                          '<Default Extension="xml" ContentType="application/xml"/>'
+                          '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                          '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+                          f'{sheet_types}</Types>')
+        self.zip.close()
@@ -0,0 +1,82 @@
+import os
+import sys
+import time
+from threading import Lock
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The pipeline modules import their siblings directly when run as scripts; do the same here
+sys.path.insert(0, os.path.join(ROOT, "src", "geminiOCR"))
+# pdf_to_json refuses to import without a key; the tests never call the API
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+
+import pdf_to_json
+
+class ScriptedResponse:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+class ScriptedModel:
+    """Gemini model stand-in: call n takes outcomes[n] seconds (the last outcome repeats), or raises it
+    when it is an exception, and answers with text"""
+    def __init__(self, outcomes=(0.0,), text="{}"):
+        self.outcomes = list(outcomes)
+        self.text = text
+        self.calls = 0
+        self.prompts = []
+        self.lock = Lock()
+
+    def generate_content(self, contents, stream=False, request_options=None, **kwargs):
+        with self.lock:
+            outcome = self.outcomes[min(self.calls, len(self.outcomes) - 1)]
+            self.calls += 1
+            self.prompts.append("".join(part for part in contents if isinstance(part, str)))
+        if isinstance(outcome, Exception):
+            raise outcome
+        time.sleep(outcome)
+        return ScriptedResponse(self.text)
+
+class ScriptedBackend:
+    """Answers every model name with model, or with its own entry in models"""
+    def __init__(self, model: ScriptedModel, models=None):
+        self.scripted_model = model
+        self.models = models or {}
+
+    def create_model(self, api_key: str, model_name: str):
+        return self.models.get(model_name, self.scripted_model)
+
+    def upload_file(self, api_key: str, path: str, mime_type: str, timeout: float = 60.0):
+        raise RuntimeError("uploads are not scripted")
+
+@pytest.fixture
+def scripted_model(monkeypatch):
+    """Send Gemini calls to a ScriptedModel through an unthrottled key, with fresh call stats and breaker"""
+    model = ScriptedModel()
+    monkeypatch.setattr(pdf_to_json, "call_stats", pdf_to_json.CallStats())
+    monkeypatch.setattr(pdf_to_json, "circuit_breaker", pdf_to_json.CircuitBreaker())
+    monkeypatch.setattr(pdf_to_json, "key_pool", pdf_to_json.APIKeyPool(["test-key"], calls_per_minute=6000,
+                                                                        backend=ScriptedBackend(model)))
+    return model
+
+@pytest.fixture
+def web_app(tmp_path, monkeypatch):
+    """The Flask app module, working in tmp_path with no jobs"""
+    # The app works in folders relative to the current directory, created when it is first imported
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(os.path.join(ROOT, "app"))
+    import app as web_app
+    for folder in ("UPLOAD_FOLDER", "PROCESSING_FOLDER", "OUTPUT_FOLDER"):
+        os.makedirs(web_app.app.config[folder], exist_ok=True)
+    monkeypatch.setattr(web_app.app, "root_path", str(tmp_path / "app"))
+    monkeypatch.setattr(web_app, "job_status", {})
+    return web_app
+
+@pytest.fixture
+def batch_server():
+    """Local stand-in for the Gemini Batch API whose jobs finish at once, answered by the benchmark's fake model"""
+    import benchmark
+    server = benchmark.FakeBatchServer(benchmark.FakeGeminiBackend(latency=0), job_seconds=0)
+    yield server
+    server.close()
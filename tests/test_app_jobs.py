@@ -0,0 +1,45 @@
+import json
+import os
+
+import pandas as pd
+
+def fake_extraction(title):
+    def extract(pdf_path, processing_dir, json_output, preset=None):
+        document = {"pages": [{"page_number": 1, "content": {"tables": [
+            {"table_title": title, "headers": ["Asset", "Amount"], "data": [[title, "1,200"]]}
+        ]}}]}
+        with open(json_output, "w", encoding="utf-8") as f:
+            json.dump(document, f)
+    return extract
+
+def run_job(web_app, monkeypatch, title):
+    job_id = f"job-{title}"
+    web_app.job_status[job_id] = web_app.ProcessingJob(job_id, f"{title}.pdf")
+    monkeypatch.setattr(web_app, "pdf_to_json_main", fake_extraction(title))
+    web_app.process_pdf_async(job_id, f"{title}.pdf")
+    return web_app.job_status[job_id]
+
+def test_each_job_keeps_its_own_results(web_app, tmp_path, monkeypatch):
+    first = run_job(web_app, monkeypatch, "First")
+    second = run_job(web_app, monkeypatch, "Second")
+
+    assert first.status == second.status == "completed"
+    assert first.output_dir == str(tmp_path / "output" / "job-First")
+    assert {first.json_path, first.excel_path, first.parquet_path}.isdisjoint(
+        {second.json_path, second.excel_path, second.parquet_path})
+
+    client = web_app.app.test_client()
+    for job, title in [(first, "First"), (second, "Second")]:
+        response = client.get(f"/download/{job.job_id}?format=parquet")
+        assert response.status_code == 200
+        path = tmp_path / f"{title}.parquet"
+        path.write_bytes(response.data)
+        assert title in set(pd.read_parquet(path)["value"].astype(str))
+
+def test_parquet_download_does_not_export_on_request(web_app, monkeypatch):
+    job = run_job(web_app, monkeypatch, "Only")
+    os.remove(job.parquet_path)
+
+    response = web_app.app.test_client().get(f"/download/{job.job_id}?format=parquet")
+    assert response.status_code == 404
+    assert not os.path.exists(job.parquet_path)
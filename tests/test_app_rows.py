@@ -0,0 +1,53 @@
+import io
+import json
+import os
+
+def fake_rows(calls):
+    def stream(pdf_path, processing_dir, preset=None):
+        calls.append((pdf_path, processing_dir, preset))
+        os.makedirs(processing_dir, exist_ok=True)
+        image_path = os.path.join(processing_dir, "page_1.jpg")
+        yield {"type": "document", "total_pages": 2}
+        yield {"type": "row", "page": 1, "table": 0, "row": ["1", "Pump"]}
+        yield {"type": "page", "page": 1, "content": {"tables": [], "page_info": {
+            "page_number": 1, "image_path": image_path, "crop": {"offset_x": 4}}}}
+        yield {"type": "page", "page": 2, "content": {"error": f"[Errno 2] No such file: '{image_path}'",
+                                                        "page": image_path}}
+        raise RuntimeError(f"Unable to get page count from {pdf_path}")
+    return stream
+
+def post_pdf(web_app, **form):
+    return web_app.app.test_client().post("/convert-pdf/rows", data=dict(
+        file=(io.BytesIO(b"%PDF-1.4"), "ledger.pdf"), **form), content_type="multipart/form-data")
+
+def test_streamed_events_carry_no_server_paths(web_app, monkeypatch, tmp_path):
+    calls = []
+    monkeypatch.setattr(web_app, "stream_pdf_rows", fake_rows(calls))
+
+    response = post_pdf(web_app, preset="fast")
+    body = response.get_data(as_text=True)
+    events = [json.loads(line) for line in body.splitlines()]
+
+    assert calls[0][2] == "fast"
+    assert [event["type"] for event in events] == ["document", "row", "page", "page", "error"]
+    assert events[2]["content"]["page_info"] == {"page_number": 1, "crop": {"offset_x": 4}}
+    assert "page" not in events[3]["content"]
+    for path in calls[0][:2]:
+        assert path not in body and os.path.abspath(path) not in body
+    assert str(tmp_path) not in body
+
+def test_temp_files_are_removed_after_the_stream(web_app, monkeypatch):
+    calls = []
+    monkeypatch.setattr(web_app, "stream_pdf_rows", fake_rows(calls))
+
+    post_pdf(web_app).get_data()
+
+    pdf_path, processing_dir, _ = calls[0]
+    assert not os.path.exists(pdf_path)
+    assert not os.path.exists(processing_dir)
+
+def test_unknown_preset_is_rejected(web_app):
+    response = post_pdf(web_app, preset="turbo")
+
+    assert response.status_code == 400
+    assert "turbo" in response.get_json()["error"]
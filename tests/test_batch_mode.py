@@ -0,0 +1,89 @@
+import json
+import os
+
+import pytest
+from PIL import Image
+
+import batch_mode
+from pdf_to_json import ModelRouting
+
+@pytest.fixture
+def documents(tmp_path):
+    """Two documents of three blank page images each"""
+    documents = {}
+    for document in range(2):
+        folder = tmp_path / f"document_{document + 1}"
+        folder.mkdir()
+        paths = []
+        for page in range(3):
+            path = folder / f"page_{page + 1}.jpg"
+            Image.new("RGB", (60, 80), "white").save(path)
+            paths.append(str(path))
+        documents[f"document_{document + 1}.pdf"] = paths
+    return documents
+
+def run_batch(batch_server, documents, tmp_path, **kwargs):
+    client = batch_mode.GeminiBatchClient("fake-batch-key", batch_server.base_url)
+    return batch_mode.process_pages_in_batch(documents, str(tmp_path), client=client, poll_seconds=0.01, **kwargs)
+
+def job_models(batch_server):
+    return [job["model"] for _, job in sorted(batch_server.jobs.items(), key=lambda item: int(item[0].split("-")[-1]))]
+
+def page_tables(outputs):
+    return [[bool(page["content"].get("tables")) for page in output["pages"]] for output in outputs.values()]
+
+def test_each_page_image_is_uploaded_once_for_every_stage(batch_server, documents, tmp_path):
+    outputs = run_batch(batch_server, documents, tmp_path)
+
+    image_bytes = sum(os.path.getsize(path) for paths in documents.values() for path in paths)
+    assert batch_server.image_bytes == image_bytes
+    assert len(batch_server.jobs) == 3
+    assert page_tables(outputs) == [[True] * 3, [True] * 3]
+    # Only the job output files are left once the run is over
+    assert len(batch_server.files) == len(batch_server.jobs)
+
+def test_stages_are_split_into_jobs_of_at_most_max_requests(batch_server, documents, tmp_path):
+    outputs = run_batch(batch_server, documents, tmp_path, max_requests=4, verify=False)
+
+    assert len(batch_server.jobs) == 4
+    assert batch_server.requests == 12
+    assert page_tables(outputs) == [[True] * 3, [True] * 3]
+
+def test_pages_failing_the_quality_checks_are_escalated_in_one_more_batch(batch_server, documents, tmp_path, monkeypatch):
+    backend = batch_server.backend
+    respond = backend.respond
+    ragged = {"left": 2}
+
+    def first_extractions_ragged(prompt, *args):
+        text = respond(prompt, *args)
+        if '"tables"' in text and ragged["left"]:
+            ragged["left"] -= 1
+            data = json.loads(text)
+            data["tables"][0]["data"][0].pop()
+            return json.dumps(data)
+        return text
+    monkeypatch.setattr(backend, "respond", first_extractions_ragged)
+
+    routing = ModelRouting("lite", "lite", "lite", "strong")
+    outputs = run_batch(batch_server, documents, tmp_path, routing=routing, verify=False)
+
+    assert job_models(batch_server) == ["lite", "lite", "strong"]
+    assert batch_server.requests == 6 + 6 + 2
+    assert page_tables(outputs) == [[True] * 3, [True] * 3]
+
+def test_a_failed_chunk_keeps_the_other_chunks_results(batch_server, documents, tmp_path, monkeypatch):
+    job_status = batch_server.job_status
+
+    def first_extraction_job_fails(name):
+        if name == "batches/fake-3":
+            return {"name": name, "metadata": {"state": "BATCH_STATE_FAILED"}, "error": {"message": "internal error"}}
+        return job_status(name)
+    monkeypatch.setattr(batch_server, "job_status", first_extraction_job_fails)
+
+    routing = ModelRouting("lite", "lite", "lite", "strong")
+    outputs = run_batch(batch_server, documents, tmp_path, routing=routing, max_requests=4, verify=False)
+
+    # Analysis is jobs 1-2 and extraction jobs 3-4; the four pages of failed job 3 go round again on the escalation model
+    assert job_models(batch_server) == ["lite"] * 4 + ["strong"]
+    assert batch_server.requests == 6 + 2 + 4
+    assert page_tables(outputs) == [[True] * 3, [True] * 3]
@@ -0,0 +1,81 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from cell_types import DATE, INDIAN_NUMBER, NUMBER, infer_column, infer_table_types, type_rows
+
+def column(*values):
+    return pd.Series(list(values), dtype=object)
+
+def test_plain_and_western_numbers():
+    typed, kind = infer_column(column("12", "1,234", "-5.5", "1,000,000.25", "0"))
+
+    assert kind == NUMBER
+    assert list(typed) == [12, 1234, -5.5, 1000000.25, 0]
+    assert isinstance(typed[0], int) and isinstance(typed[2], float)
+
+def test_lakh_crore_amounts_with_rupee_marks():
+    typed, kind = infer_column(column("₹ 1,23,456.00", "Rs. 12,34,56,789/-", "45,000", "INR 2,50,000"))
+
+    assert kind == INDIAN_NUMBER
+    assert list(typed) == [123456, 123456789, 45000, 250000]
+
+def test_day_first_dates():
+    typed, kind = infer_column(column("31/03/2026", "01-04-26", "15.08.2025", "7/1/2024"))
+
+    assert kind == DATE
+    assert [value.to_pydatetime() for value in typed] == [
+        datetime(2026, 3, 31), datetime(2026, 4, 1), datetime(2025, 8, 15), datetime(2024, 1, 7)
+    ]
+
+def test_cells_that_do_not_convert_keep_their_text():
+    values = ["100", "200", "300", "400", "Signature detected"]
+    typed, kind = infer_column(column(*values))
+
+    assert kind == NUMBER
+    assert list(typed) == [100, 200, 300, 400, "Signature detected"]
+
+def test_mostly_text_column_is_left_alone():
+    values = column("North", "South", "12", "East", "West")
+    typed, kind = infer_column(values)
+
+    assert kind is None
+    assert typed is values
+
+@pytest.mark.parametrize("values", [
+    ("1234567890123456", "9876543210987654", "1111222233334444"),
+    ("007", "0123", "0042"),
+    ("A-12", "B-13", "C-14"),
+    ("12/34", "56/78", "99/99"),
+])
+def test_identifiers_are_not_numbers_or_dates(values):
+    assert infer_column(column(*values))[1] is None
+
+def test_empty_cells_do_not_count_against_the_column():
+    typed, kind = infer_column(column("10", None, "", "  ", "20", "30"))
+
+    assert kind == NUMBER
+    assert list(typed) == [10, None, "", "  ", 20, 30]
+
+def test_empty_column():
+    assert infer_column(column(None, "", " "))[1] is None
+
+def test_table_kinds_by_position():
+    df = pd.DataFrame([["1", "Pump", "1,200.00", "01/04/2025"], ["2", "Valve", "950", "02/04/2025"]],
+                      columns=["S. No", "Asset", "Amount", "Date"], dtype=object)
+    typed, kinds = infer_table_types(df)
+
+    assert kinds == {0: NUMBER, 1: None, 2: NUMBER, 3: DATE}
+    assert list(typed.columns) == list(df.columns)
+    assert typed.iloc[1, 2] == 950 and typed.iloc[0, 1] == "Pump"
+
+def test_ragged_rows_keep_their_lengths():
+    rows = [["1", "10"], ["2"], ["3", "30", "extra"]]
+    typed, kinds = type_rows(rows)
+
+    assert typed == [[1, 10], [2], [3, 30, "extra"]]
+    assert kinds[0] == NUMBER and kinds[2] is None
+
+def test_no_rows():
+    assert type_rows([]) == ([], {})
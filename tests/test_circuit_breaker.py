@@ -0,0 +1,130 @@
+import time
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+import pdf_to_json
+from pdf_to_json import CircuitBreaker, CircuitOpenError, Deadline, generate_with_deadline
+
+def open_breaker(reset_timeout=60.0):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=reset_timeout, probe_wait=1.0)
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure(RuntimeError("503"))
+    return breaker
+
+def test_opens_at_the_failure_threshold():
+    breaker = CircuitBreaker(failure_threshold=3)
+    for _ in range(2):
+        breaker.record_failure(RuntimeError("503"))
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+    breaker.record_failure(RuntimeError("503"))
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError) as raised:
+        breaker.before_call()
+    assert 0 < raised.value.retry_in <= 60
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=3)
+    breaker.record_failure(RuntimeError("503"))
+    breaker.record_failure(RuntimeError("503"))
+    breaker.record_success()
+    breaker.record_failure(RuntimeError("503"))
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.consecutive_failures == 1
+
+def test_half_open_lets_a_single_probe_through():
+    breaker = open_breaker(reset_timeout=0.05)
+    time.sleep(0.06)
+
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+def test_probe_success_closes():
+    breaker = open_breaker(reset_timeout=0.05)
+    time.sleep(0.06)
+    breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+    breaker.before_call()
+
+def test_probe_failure_reopens():
+    breaker = open_breaker(reset_timeout=0.05)
+    time.sleep(0.06)
+    breaker.before_call()
+
+    breaker.record_failure(RuntimeError("still down"))
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.times_opened == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+def test_released_probe_lets_the_next_call_probe():
+    breaker = open_breaker(reset_timeout=0.05)
+    time.sleep(0.06)
+    breaker.before_call()
+
+    breaker.release_probe()
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+def test_status():
+    breaker = CircuitBreaker(failure_threshold=3)
+    assert breaker.status() == {
+        "state": "closed",
+        "consecutive_failures": 0,
+        "failure_threshold": 3,
+        "times_opened": 0,
+        "last_error": None
+    }
+
+    breaker = open_breaker()
+    status = breaker.status()
+    assert status["state"] == "open"
+    assert status["times_opened"] == 1
+    assert status["last_error"] == "503"
+    assert 0 < status["next_probe_in_seconds"] <= 60
+    assert "opened_at" in status
+
+def test_server_errors_count_against_the_backend(scripted_model):
+    scripted_model.outcomes = [google_exceptions.ServiceUnavailable("503")]
+
+    with pytest.raises(google_exceptions.ServiceUnavailable):
+        generate_with_deadline("analysis", ["prompt"], Deadline(5))
+    assert pdf_to_json.circuit_breaker.consecutive_failures == 1
+
+@pytest.mark.parametrize("error", [
+    google_exceptions.InvalidArgument("bad request"),
+    google_exceptions.PermissionDenied("no"),
+    google_exceptions.ResourceExhausted("429 quota"),
+])
+def test_client_and_quota_errors_leave_the_breaker_as_it_was(scripted_model, error):
+    breaker = pdf_to_json.circuit_breaker
+    breaker.record_failure(RuntimeError("503"))
+    breaker.record_failure(RuntimeError("503"))
+    scripted_model.outcomes = [error]
+
+    with pytest.raises(type(error)):
+        generate_with_deadline("analysis", ["prompt"], Deadline(5))
+    assert breaker.consecutive_failures == 2
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_client_error_on_a_probe_lets_the_next_call_probe(scripted_model, monkeypatch):
+    breaker = open_breaker(reset_timeout=0.05)
+    monkeypatch.setattr(pdf_to_json, "circuit_breaker", breaker)
+    time.sleep(0.06)
+    scripted_model.outcomes = [google_exceptions.InvalidArgument("bad request"), 0.0]
+
+    with pytest.raises(google_exceptions.InvalidArgument):
+        generate_with_deadline("analysis", ["prompt"], Deadline(5))
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    generate_with_deadline("analysis", ["prompt"], Deadline(5))
+    assert breaker.state == CircuitBreaker.CLOSED
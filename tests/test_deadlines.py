@@ -0,0 +1,81 @@
+import concurrent.futures
+import time
+
+import pytest
+
+import pdf_to_json
+from pdf_to_json import Deadline, DeadlineExceeded, generate_with_deadline
+
+def prime_latencies(stage: str, seconds: float, samples: int = 10):
+    for _ in range(samples):
+        pdf_to_json.call_stats.record(stage, seconds)
+
+def test_call_within_the_deadline(scripted_model):
+    scripted_model.outcomes = [0.01]
+
+    response = generate_with_deadline("analysis", ["prompt"], Deadline(5))
+
+    assert response.text == "{}"
+    assert pdf_to_json.call_stats.summary()["stages"]["analysis"]["calls"] == 1
+
+def test_slow_call_stops_at_the_deadline(scripted_model):
+    scripted_model.outcomes = [2.0]
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        generate_with_deadline("extraction", ["prompt"], Deadline(0.2))
+
+    assert time.monotonic() - started < 1.0
+    assert pdf_to_json.call_stats.summary()["stages"]["extraction"]["deadline_misses"] == 1
+
+def test_expired_deadline_makes_no_call(scripted_model):
+    deadline = Deadline(0.01)
+    time.sleep(0.02)
+
+    with pytest.raises(DeadlineExceeded):
+        generate_with_deadline("analysis", ["prompt"], deadline)
+    assert scripted_model.calls == 0
+
+def test_call_slower_than_p95_is_hedged(scripted_model):
+    prime_latencies("extraction", 0.05)
+    scripted_model.outcomes = [2.0, 0.01]
+
+    started = time.monotonic()
+    generate_with_deadline("extraction", ["prompt"], Deadline(5), hedge=True)
+
+    assert time.monotonic() - started < 1.0
+    assert scripted_model.calls == 2
+    stage = pdf_to_json.call_stats.summary()["stages"]["extraction"]
+    assert stage["hedges_sent"] == 1 and stage["hedge_wins"] == 1
+
+def test_no_hedge_before_enough_samples(scripted_model):
+    prime_latencies("extraction", 0.01, samples=3)
+    scripted_model.outcomes = [0.2]
+
+    generate_with_deadline("extraction", ["prompt"], Deadline(5), hedge=True)
+
+    assert scripted_model.calls == 1
+    assert pdf_to_json.call_stats.summary()["stages"]["extraction"]["hedges_sent"] == 0
+
+def test_fast_call_is_not_hedged(scripted_model):
+    prime_latencies("extraction", 0.5)
+    scripted_model.outcomes = [0.01]
+
+    generate_with_deadline("extraction", ["prompt"], Deadline(5), hedge=True)
+    time.sleep(0.6)
+
+    assert scripted_model.calls == 1
+
+def test_queued_calls_are_cancelled_at_the_deadline(scripted_model, monkeypatch):
+    # With a single call worker the hedge waits behind the slow call, so it is still queued when the deadline passes
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(pdf_to_json, "_call_executor", executor)
+    prime_latencies("extraction", 0.05)
+    scripted_model.outcomes = [0.6, 0.01]
+
+    with pytest.raises(DeadlineExceeded):
+        generate_with_deadline("extraction", ["prompt"], Deadline(0.3), hedge=True)
+    executor.shutdown(wait=True)
+
+    assert scripted_model.calls == 1
+    assert pdf_to_json.call_stats.summary()["stages"]["extraction"]["hedges_sent"] == 1
@@ -0,0 +1,110 @@
+import json
+import zipfile
+from copy import copy
+from xml.etree import ElementTree
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+from json_to_excel import (INDIAN_NUMBER_FORMAT, PACKAGE_STYLE_IDS, PACKAGE_STYLES, STYLE_DEFINITIONS, StyleRegistry,
+                           convert_json_to_excel)
+from xlsx_package import XlsxPackageWriter, sheet_xml
+
+@pytest.mark.parametrize("name", list(STYLE_DEFINITIONS))
+def test_registry_styles_cells_as_openpyxl_does(name):
+    wb = Workbook()
+    styles = StyleRegistry(wb)
+    ws = wb.active
+    registered, public = ws["A1"], ws["A2"]
+
+    styles.apply(registered, name)
+    public.style = name
+
+    assert registered.style == name
+    for attribute in ("font", "fill", "border", "alignment", "number_format"):
+        assert copy(getattr(registered, attribute)) == copy(getattr(public, attribute))
+
+def test_registry_reuses_the_workbooks_styles():
+    wb = Workbook()
+    StyleRegistry(wb)
+    styles = StyleRegistry(wb)
+
+    styles.apply(wb.active["A1"], "ocr_header")
+
+    assert wb.named_styles.count("ocr_header") == 1
+    assert wb.active["A1"].font.b
+
+def sheet_names(path: str):
+    """Sheet names as written in workbook.xml; openpyxl would quietly renumber duplicates on load"""
+    with zipfile.ZipFile(path) as package:
+        workbook = ElementTree.fromstring(package.read("xl/workbook.xml"))
+    return [sheet.get("name") for sheet in workbook.iter("{http://schemas.openxmlformats.org/spreadsheetml/2006/main}sheet")]
+
+def write_document(path, pages) -> str:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"pages": pages}, f)
+    return str(path)
+
+@pytest.mark.parametrize("backend", ["openpyxl", "streaming", "xlsxwriter", "parallel"])
+def test_pages_with_the_same_number_get_their_own_sheets(tmp_path, backend):
+    # Pages that failed have no page number, so two of them both land on "Page 0"
+    failed = {"content": {"error": "API failed after 3 attempts"}}
+    json_path = write_document(tmp_path / "document.json", [failed, {"page_number": 1, "content": {}}, failed])
+
+    excel_path = convert_json_to_excel(json_path, str(tmp_path / "document.xlsx"), backend=backend)
+
+    assert sheet_names(excel_path) == ["Page 0", "Page 1", "Page 01"]
+
+def test_package_writer_numbers_repeated_sheet_names(tmp_path):
+    path = str(tmp_path / "package.xlsx")
+    package = XlsxPackageWriter(path, PACKAGE_STYLES)
+    for name in ["Page 0", "page 0", "Page 1"]:
+        package.add_sheet(name, sheet_xml([[("x", None)]], {}, PACKAGE_STYLE_IDS))
+    package.close()
+
+    assert sheet_names(path) == ["Page 0", "page 01", "Page 1"]
+
+LEDGER_PAGE = {
+    "document_type": "ledger",
+    "page_metadata": {"page_number": "1", "header": "Northern Region", "footer": ""},
+    "tables": [{"table_title": "Receipts", "headers": ["S. No", "Date", "Description", "Amount (Rs.)"],
+                "data": [["1", "01/04/2025", "Opening balance brought forward", "1,23,456.00"],
+                         ["2", "15/04/2025", "Diesel", "₹ 4,500.50/-"],
+                         ["3", "30/04/2025", "Lubricants", "12,34,56,789.00"]]}],
+    "sections": [{"section_type": "text", "section_title": "Note", "content": "Audited"},
+                 {"section_type": "form", "section_title": "Approval", "content": {"Approved by": "Regional Manager"}}],
+    "key_value_pairs": {"Voucher": "RV-118", "Cashier": "A. Kumar"}
+}
+
+def cell_appearance(cell):
+    """A cell's value and how it looks, independent of how the writer registered its styles"""
+    font, fill, border = cell.font, cell.fill, cell.border
+    solid = fill.fill_type == "solid"
+    return (cell.value, bool(font.b), float(font.sz or 11), fill.fgColor.rgb[-6:] if solid else None,
+            border.left.style, border.top.style, cell.alignment.horizontal, cell.number_format)
+
+def workbook_appearance(path: str):
+    """Each sheet's cells that hold a value or look different from a blank cell, and its column widths"""
+    blank = cell_appearance(Workbook().active["A1"])
+    wb = load_workbook(path)
+    sheets = {}
+    for ws in wb.worksheets:
+        cells = {cell.coordinate: cell_appearance(cell) for row in ws.iter_rows() for cell in row
+                 if cell_appearance(cell) != blank}
+        widths = {letter: dimension.width for letter, dimension in ws.column_dimensions.items() if dimension.customWidth}
+        sheets[ws.title] = (cells, widths)
+    return sheets
+
+def test_every_backend_writes_the_same_workbook(tmp_path):
+    json_path = write_document(tmp_path / "ledger.json", [{"page_number": 1, "content": LEDGER_PAGE},
+                                                          {"page_number": 2, "content": LEDGER_PAGE}])
+
+    workbooks = {backend: workbook_appearance(convert_json_to_excel(json_path, str(tmp_path / f"{backend}.xlsx"),
+                                                                    backend=backend, consolidate=True))
+                 for backend in ["openpyxl", "streaming", "xlsxwriter", "parallel"]}
+
+    expected = workbooks.pop("openpyxl")
+    assert list(expected) == ["Page 1", "Page 2", "Table 1 - Receipts"]
+    assert expected["Page 1"][0]["D7"][-1] == INDIAN_NUMBER_FORMAT
+    for backend, sheets in workbooks.items():
+        assert sheets == expected, backend
@@ -0,0 +1,106 @@
+import io
+import json
+import random
+
+import pytest
+
+from json_to_excel import IncrementalJSONReader, read_pages
+
+WORDS = ["Asset", "Region", "North", "₹ 1,23,456.00/-", "Signature detected", "line\nbreak", 'quote "x"', "tab\there",
+         "back\\slash", "ünïcödé", "", " ", "{not json}", "[1, 2]", "1.5e3"]
+
+def random_scalar(rng: random.Random):
+    kind = rng.randrange(7)
+    if kind == 0:
+        return rng.randint(-10 ** 12, 10 ** 12)
+    if kind == 1:
+        return rng.uniform(-1e6, 1e6)
+    if kind == 2:
+        return rng.choice([0, -0.5, 1e-7, 2.5e21, 123456789.125])
+    if kind == 3:
+        return rng.choice([True, False, None])
+    if kind == 4:
+        return "".join(chr(rng.choice([rng.randrange(32, 127), rng.randrange(0xa0, 0x2fff)])) for _ in range(rng.randrange(12)))
+    return rng.choice(WORDS)
+
+def random_value(rng: random.Random, depth: int = 0):
+    kind = rng.randrange(5 if depth < 4 else 1)
+    if kind <= 1:
+        return random_scalar(rng)
+    if kind == 2:
+        return [random_value(rng, depth + 1) for _ in range(rng.randrange(6))]
+    return {rng.choice(WORDS) + str(i): random_value(rng, depth + 1) for i in range(rng.randrange(6))}
+
+def random_page(rng: random.Random, page_number: int):
+    headers = [rng.choice(WORDS) for _ in range(rng.randrange(1, 6))]
+    data = [[random_scalar(rng) for _ in headers] for _ in range(rng.randrange(8))]
+    return {
+        "page_number": page_number,
+        "content": {
+            "document_type": rng.choice(WORDS),
+            "tables": [{"table_title": rng.choice(WORDS), "headers": headers, "data": data}],
+            "extra": random_value(rng)
+        }
+    }
+
+def random_document(rng: random.Random):
+    document = {"pages": [random_page(rng, number) for number in range(1, rng.randrange(1, 5))]}
+    # Other top-level keys before and after the pages are skipped
+    if rng.random() < 0.5:
+        document = {"document_metadata": random_value(rng), **document}
+    if rng.random() < 0.5:
+        document["qc"] = random_value(rng)
+    return document
+
+def dump(document, rng: random.Random) -> str:
+    return json.dumps(document, indent=rng.choice([None, 0, 2]), ensure_ascii=rng.random() < 0.5,
+                      separators=rng.choice([None, (",", ":"), (" , ", " : ")]))
+
+def read_value(text: str, chunk_size: int):
+    reader = IncrementalJSONReader(io.StringIO(text), chunk_size)
+    value = reader.value()
+    assert reader.peek() == ""
+    return value
+
+def test_read_pages_matches_json_load_on_random_documents(tmp_path):
+    rng = random.Random(44)
+    path = tmp_path / "document.json"
+    for _ in range(600):
+        document = random_document(rng)
+        text = dump(document, rng)
+        path.write_text(text, encoding="utf-8")
+        expected = json.loads(text)["pages"]
+
+        assert list(read_pages(str(path))) == expected
+        assert read_value(text, rng.choice([1, 2, 3, 5, 8, 13, 64])) == json.loads(text)
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 4, 7, 16, 63, 64, 1 << 16])
+def test_values_split_across_chunks(chunk_size):
+    # Numbers, escapes and multi-byte characters land on every possible chunk boundary
+    document = {
+        "numbers": [1.5e3, -0.25, 12345678901234567890, 0, 1e-9, -7, 3.0],
+        "text": ["a\\\"b", "ü€𝄞", "\n\t\u0001", ""],
+        "nested": {"pages": [[], {}, [[[]]], {"a": {"b": None}}]},
+        "flags": [True, False, None]
+    }
+    for indent in (None, 1):
+        text = json.dumps(document, indent=indent, ensure_ascii=False)
+        assert read_value(text, chunk_size) == document
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 16])
+def test_number_at_the_end_of_the_buffer_is_not_cut_short(chunk_size):
+    for text in ["1.5e3", "[1.5e3]", "-12345", "[0.000125 ,2]"]:
+        assert read_value(text, chunk_size) == json.loads(text)
+
+def test_read_pages_of_an_empty_document(tmp_path):
+    path = tmp_path / "empty.json"
+    for text in ["{}", '{"pages": []}', '{ "document_metadata": {"total_pages": 0} }']:
+        path.write_text(text, encoding="utf-8")
+        assert list(read_pages(str(path))) == []
+
+@pytest.mark.parametrize("text", ['{"pages": [1, 2', '{"pages" [1]}', '["pages"]', '{"pages": [1 2]}', '{"pages": [{"a": }]}'])
+def test_malformed_documents_raise(tmp_path, text):
+    path = tmp_path / "bad.json"
+    path.write_text(text, encoding="utf-8")
+    with pytest.raises(json.JSONDecodeError):
+        list(read_pages(str(path)))
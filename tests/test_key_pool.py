@@ -0,0 +1,77 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+import pdf_to_json
+from conftest import ScriptedBackend, ScriptedModel
+from pdf_to_json import APIKeyPool, Deadline, generate_with_deadline
+
+def fill_window(slot, calls: int):
+    """Count calls against a key's window without moving its next free slot"""
+    now = time.time()
+    slot.limiter.recent_calls.extend([now] * calls)
+
+def test_calls_go_to_the_key_with_the_most_budget_left():
+    pool = APIKeyPool(["a", "b", "c"], calls_per_minute=10)
+    fill_window(pool.slots[0], 6)
+    fill_window(pool.slots[1], 2)
+    fill_window(pool.slots[2], 4)
+
+    assert pool.acquire().name == "key2"
+
+def test_keys_are_used_in_turn():
+    pool = APIKeyPool(["a", "b"], calls_per_minute=6000)
+
+    assert [pool.acquire().name for _ in range(4)] == ["key1", "key2", "key1", "key2"]
+    assert [slot["calls"] for slot in pool.status()] == [2, 2]
+
+def test_quota_error_takes_the_key_out_of_rotation_until_its_cooldown_ends():
+    pool = APIKeyPool(["a", "b"], calls_per_minute=6000)
+    first = pool.slots[0]
+    fill_window(pool.slots[1], 100)
+
+    pool.report_error(first, google_exceptions.ResourceExhausted("429 Quota exceeded, please retry in 0.2s"))
+    assert pool.acquire().name == "key2"
+    assert pool.status()[0]["quota_errors"] == 1
+    assert 0 < pool.status()[0]["cooling_down_seconds"] <= 0.2
+
+    time.sleep(0.25)
+    assert pool.acquire().name == "key1"
+
+def test_other_errors_do_not_cool_a_key_down():
+    pool = APIKeyPool(["a", "b"], calls_per_minute=6000)
+    fill_window(pool.slots[1], 100)
+
+    pool.report_error(pool.slots[0], google_exceptions.ServiceUnavailable("503"))
+    assert pool.acquire().name == "key1"
+
+def test_when_every_key_cools_down_the_first_back_is_waited_for():
+    pool = APIKeyPool(["a", "b"], calls_per_minute=6000, quota_cooldown=0.4)
+    pool.report_error(pool.slots[0], google_exceptions.ResourceExhausted("429"))
+    pool.report_error(pool.slots[1], google_exceptions.ResourceExhausted("429 retry in 0.2s"))
+
+    started = time.monotonic()
+    assert pool.acquire().name == "key2"
+    assert 0.15 <= time.monotonic() - started < 0.4
+
+def test_no_keys():
+    with pytest.raises(ValueError):
+        APIKeyPool([])
+
+def test_calls_in_flight_grow_with_the_key_pool(monkeypatch):
+    model = ScriptedModel([0.3])
+    monkeypatch.setattr(pdf_to_json, "call_stats", pdf_to_json.CallStats())
+    monkeypatch.setattr(pdf_to_json, "circuit_breaker", pdf_to_json.CircuitBreaker())
+    pool = APIKeyPool([f"key-{i}" for i in range(4)], calls_per_minute=6000, backend=ScriptedBackend(model))
+    monkeypatch.setattr(pdf_to_json, "key_pool", pool)
+    monkeypatch.setattr(pdf_to_json, "_call_executor", pdf_to_json.create_call_executor(pool))
+    calls = 4 * pdf_to_json.CALLS_IN_FLIGHT_PER_KEY
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=calls) as pages:
+        list(pages.map(lambda _: generate_with_deadline("extraction", ["prompt"], Deadline(10)), range(calls)))
+
+    assert model.calls == calls
+    assert time.monotonic() - started < 0.55
@@ -0,0 +1,82 @@
+from PIL import Image, ImageDraw
+
+from layout_templates import LayoutTemplateRegistry
+
+HEADERS = ["S. No", "Asset", "Sign", "Remarks"]
+COLUMNS = [80, 180, 460, 640, 920]
+
+def draw_form(path, rows: int, filled: int, offset: int = 0) -> str:
+    """A ruled form with rows body rows, the first filled of them holding a mark in their first cell"""
+    page = Image.new("RGB", (1000, 1400), "white")
+    draw = ImageDraw.Draw(page)
+    xs = [x + offset for x in COLUMNS]
+    ys = [150 + offset, 210 + offset] + [210 + offset + (r + 1) * 40 for r in range(rows)]
+    for y in ys:
+        draw.line([(xs[0], y), (xs[-1], y)], fill="black", width=2)
+    for x in xs:
+        draw.line([(x, ys[0]), (x, ys[-1])], fill="black", width=2)
+    for y0 in ys[1:filled + 1]:
+        draw.rectangle([xs[0] + 20, y0 + 14, xs[0] + 60, y0 + 26], fill="black")
+    page.save(path)
+    return str(path)
+
+def extraction(rows: int, headers=HEADERS):
+    data = [[str(i + 1), f"Asset {i + 1}", "", ""] for i in range(rows)]
+    return {"document_type": "asset register", "tables": [{"table_title": "Assets", "headers": headers, "data": data}]}
+
+def learned_registry(tmp_path) -> LayoutTemplateRegistry:
+    registry = LayoutTemplateRegistry()
+    registry.record_extraction(draw_form(tmp_path / "first.png", rows=10, filled=6), extraction(6))
+    return registry
+
+def test_fingerprint_counts_the_filled_rows(tmp_path):
+    fingerprint = LayoutTemplateRegistry().fingerprint(draw_form(tmp_path / "page.png", rows=10, filled=4))
+
+    assert len(fingerprint.columns) == len(COLUMNS)
+    assert fingerprint.filled_rows == 4
+
+def test_form_is_learned_and_matched_on_a_shifted_scan(tmp_path):
+    registry = learned_registry(tmp_path)
+
+    template = registry.match(draw_form(tmp_path / "second.png", rows=10, filled=3, offset=6))
+
+    assert template is not None and template.headers == HEADERS
+    assert registry.summary() == {"templates": 1, "learned": 1, "matched_pages": 1}
+
+def test_template_is_not_learned_from_a_table_missing_rows(tmp_path):
+    registry = LayoutTemplateRegistry()
+    registry.record_extraction(draw_form(tmp_path / "first.png", rows=10, filled=6), extraction(4))
+
+    assert registry.templates == []
+
+def test_prompted_headers_alone_do_not_confirm_a_template(tmp_path):
+    registry = learned_registry(tmp_path)
+    page = draw_form(tmp_path / "second.png", rows=10, filled=8)
+    template = registry.match(page)
+
+    # The headers come straight from the prompt; the row count does not
+    registry.record_extraction(page, extraction(5), template)
+
+    assert (template.hits, template.misses) == (0, 1)
+    assert not template.active
+    assert registry.match(page) is None
+
+def test_rows_matching_the_grid_confirm_a_template(tmp_path):
+    registry = learned_registry(tmp_path)
+    page = draw_form(tmp_path / "second.png", rows=10, filled=8)
+    template = registry.match(page)
+
+    registry.record_extraction(page, extraction(8), template)
+
+    assert (template.hits, template.misses) == (1, 0)
+
+def test_templates_are_saved_and_loaded(tmp_path):
+    path = str(tmp_path / "templates.json")
+    registry = LayoutTemplateRegistry(path)
+    registry.record_extraction(draw_form(tmp_path / "first.png", rows=10, filled=6), extraction(6))
+    registry.save()
+
+    loaded = LayoutTemplateRegistry(path)
+
+    assert [t.headers for t in loaded.templates] == [HEADERS]
+    assert loaded.match(draw_form(tmp_path / "second.png", rows=10, filled=2)) is not None
@@ -0,0 +1,104 @@
+import json
+
+import pytest
+from PIL import Image
+
+import pdf_to_json
+from conftest import ScriptedBackend, ScriptedModel
+from pdf_to_json import (Deadline, ModelRouting, request_structure_analysis, request_structured_content,
+                         request_verification)
+
+GOOD_EXTRACTION = json.dumps({"tables": [{"table_title": "Assets", "headers": ["S. No"], "data": [["1"]]}]})
+
+@pytest.fixture
+def page(tmp_path):
+    path = tmp_path / "page_1.jpg"
+    Image.new("RGB", (40, 40), "white").save(path)
+    return str(path)
+
+@pytest.fixture
+def models(monkeypatch):
+    """One scripted model per name; set each model's text before the call"""
+    lite, strong = ScriptedModel(text=GOOD_EXTRACTION), ScriptedModel(text=GOOD_EXTRACTION)
+    monkeypatch.setattr(pdf_to_json, "call_stats", pdf_to_json.CallStats())
+    monkeypatch.setattr(pdf_to_json, "circuit_breaker", pdf_to_json.CircuitBreaker())
+    backend = ScriptedBackend(ScriptedModel(), {"lite": lite, "strong": strong})
+    monkeypatch.setattr(pdf_to_json, "key_pool", pdf_to_json.APIKeyPool(["test-key"], calls_per_minute=6000, backend=backend))
+    return lite, strong
+
+def escalations(stage: str) -> int:
+    return pdf_to_json.call_stats.summary()["stages"][stage]["escalations"]
+
+def test_each_stage_uses_its_own_model(page, models):
+    lite, strong = models
+    routing = ModelRouting(analysis="lite", extraction="strong", verification="lite", escalation="strong")
+    lite.text = "One table."
+
+    assert request_structure_analysis(page, Deadline(5), routing=routing) == "One table."
+    assert request_structured_content(page, "One table.", Deadline(5), routing=routing)["tables"][0]["data"] == [["1"]]
+    assert (lite.calls, strong.calls) == (1, 1)
+
+def test_failed_extraction_check_escalates(page, models):
+    lite, strong = models
+    lite.text = "Sorry, I cannot read this page."
+    routing = ModelRouting(extraction="lite", escalation="strong")
+
+    structured_data = request_structured_content(page, "One table.", Deadline(5), routing=routing)
+
+    assert structured_data["tables"][0]["table_title"] == "Assets"
+    assert (lite.calls, strong.calls) == (1, 1)
+    assert escalations("extraction") == 1
+
+def test_malformed_table_escalates(page, models):
+    lite, strong = models
+    lite.text = json.dumps({"tables": [{"table_title": "Assets", "data": "1, 2, 3"}]})
+
+    request_structured_content(page, "One table.", Deadline(5), routing=ModelRouting(extraction="lite", escalation="strong"))
+
+    assert strong.calls == 1
+
+def test_escalation_model_failing_its_check_is_not_retried(page, models):
+    lite, strong = models
+    lite.text = strong.text = "no json here"
+
+    structured_data = request_structured_content(page, "One table.", Deadline(5), routing=ModelRouting(extraction="lite", escalation="strong"))
+
+    assert structured_data["error"] == "No JSON found in response"
+    assert (lite.calls, strong.calls) == (1, 1)
+
+def test_no_escalation_when_the_stage_already_uses_the_escalation_model(page, models):
+    _, strong = models
+    strong.text = "no json here"
+
+    request_structured_content(page, "One table.", Deadline(5), routing=ModelRouting(extraction="strong", escalation="strong"))
+
+    assert strong.calls == 1
+
+def test_passing_extraction_is_not_escalated(page, models):
+    lite, strong = models
+
+    request_structured_content(page, "One table.", Deadline(5), routing=ModelRouting(extraction="lite", escalation="strong"))
+
+    assert (lite.calls, strong.calls) == (1, 0)
+
+def test_empty_analysis_escalates(page, models):
+    lite, strong = models
+    lite.text, strong.text = "  ", "Two tables."
+
+    assert request_structure_analysis(page, Deadline(5), routing=ModelRouting(analysis="lite", escalation="strong")) == "Two tables."
+    assert escalations("analysis") == 1
+
+def test_unusable_verification_escalates(page, models):
+    lite, strong = models
+    lite.text, strong.text = "Looks fine to me", "VERIFICATION_PASSED"
+    structured_data = json.loads(GOOD_EXTRACTION)
+
+    verified = request_verification(page, structured_data, Deadline(5), routing=ModelRouting(verification="lite", escalation="strong"))
+
+    assert verified == structured_data
+    assert (lite.calls, strong.calls) == (1, 1)
+    assert escalations("verification") == 1
+
+def test_escalation_defaults_to_the_extraction_model():
+    assert ModelRouting(analysis="lite", extraction="strong").escalation_model == "strong"
+    assert ModelRouting().model_for("verification") == pdf_to_json.DEFAULT_MODEL_NAME
@@ -0,0 +1,68 @@
+from PIL import Image, ImageDraw
+
+from page_crop import crop_to_content
+
+def blank_page(width=1000, height=1400):
+    return Image.new("RGB", (width, height), "white")
+
+def draw_title(draw: ImageDraw.ImageDraw):
+    for i in range(8):
+        draw.rectangle([230 + i * 70, 120, 280 + i * 70, 140], fill="black")
+
+def draw_table(draw: ImageDraw.ImageDraw, top: int, bottom: int):
+    for y in range(top, bottom, 60):
+        draw.line([(80, y), (920, y)], fill="black", width=3)
+    for x in range(80, 921, 140):
+        draw.line([(x, top), (x, bottom)], fill="black", width=3)
+    for y in range(top + 20, bottom, 60):
+        for x in range(100, 900, 140):
+            draw.rectangle([x, y, x + 60, y + 12], fill="black")
+
+def test_table_running_off_the_page_edge_is_kept():
+    page = blank_page()
+    draw = ImageDraw.Draw(page)
+    draw_title(draw)
+    draw_table(draw, 250, page.height - 1)
+
+    cropped, crop = crop_to_content(page)
+
+    assert crop is not None
+    assert crop["offset_y"] <= 120
+    assert crop["offset_y"] + crop["height"] == page.height
+    assert crop["offset_x"] <= 80 and crop["offset_x"] + crop["width"] >= 920
+    assert cropped.size == (crop["width"], crop["height"])
+
+def test_thin_scanner_border_is_cropped_away():
+    page = blank_page()
+    draw = ImageDraw.Draw(page)
+    draw.rectangle([0, 0, page.width - 1, 14], fill=(40, 40, 40))
+    draw_title(draw)
+    draw_table(draw, 250, 900)
+
+    _, crop = crop_to_content(page)
+
+    assert crop is not None
+    assert crop["offset_y"] > 14
+    assert crop["offset_y"] + crop["height"] < page.height
+
+def test_page_is_left_alone_when_the_box_would_lose_ink():
+    page = blank_page()
+    draw = ImageDraw.Draw(page)
+    draw_title(draw)
+    # Faint specks too small to count as blobs on their own, but most of the page's ink
+    for y in range(300, 1300, 40):
+        for x in range(100, 900, 40):
+            draw.rectangle([x, y, x + 4, y + 4], fill="black")
+
+    cropped, crop = crop_to_content(page)
+
+    assert crop is None
+    assert cropped is page
+
+def test_blank_page_is_not_cropped():
+    page = blank_page()
+
+    cropped, crop = crop_to_content(page)
+
+    assert crop is None
+    assert cropped is page
@@ -0,0 +1,67 @@
+import json
+
+from PIL import Image, ImageDraw
+
+import pdf_to_json
+from page_router import LOCAL_ROUTE, MODEL_ROUTE, PageRouter
+
+PAGE = {"document_type": "table", "page_metadata": {"page_number": "", "header": "", "footer": ""}, "sections": [],
+        "tables": [{"table_title": "", "headers": ["Asset", "Region"], "data": [["Pump", "North"]]}], "key_value_pairs": {}}
+
+def printed_blocks(rows: int = 4):
+    """Two confidently read columns of printed text"""
+    return [{"text": f"r{r}c{c}", "confidence": 0.97, "min_x": 100 + c * 300, "max_x": 200 + c * 300,
+             "min_y": 100 + r * 40, "max_y": 120 + r * 40} for r in range(rows) for c in range(2)]
+
+class FakeEngine:
+    """Local OCR stand-in returning fixed blocks; read_page fails when given an error"""
+    def __init__(self, blocks, read_page_error=None):
+        self.blocks = blocks
+        self.read_page_error = read_page_error
+
+    def read_blocks(self, image_path):
+        return self.blocks
+
+    def read_page(self, image_path, blocks=None):
+        if self.read_page_error is not None:
+            raise self.read_page_error
+        return None
+
+def blank_page(tmp_path, ruled: bool = False) -> str:
+    page = Image.new("RGB", (1000, 1400), "white")
+    if ruled:
+        draw = ImageDraw.Draw(page)
+        for y in range(80, 300, 40):
+            draw.line([(80, y), (720, y)], fill="black", width=2)
+        for x in (80, 400, 720):
+            draw.line([(x, 80), (x, 280)], fill="black", width=2)
+    path = tmp_path / "page_1.png"
+    page.save(path)
+    return str(path)
+
+def test_clean_printed_page_is_extracted_locally(tmp_path):
+    decision = PageRouter(FakeEngine(printed_blocks())).route(blank_page(tmp_path))
+
+    assert decision.route == LOCAL_ROUTE
+    assert decision.result["tables"][0]["data"][0] == ["r1c0", "r1c1"]
+
+def test_local_extraction_failure_sends_the_page_to_the_model(tmp_path):
+    engine = FakeEngine(printed_blocks(), read_page_error=RuntimeError("OCR model crashed"))
+
+    decision = PageRouter(engine).route(blank_page(tmp_path, ruled=True))
+
+    assert decision.route == MODEL_ROUTE
+    assert decision.result is None
+    assert decision.reasons == ["local extraction failed: OCR model crashed"]
+
+class BrokenRouter:
+    def route(self, image_path):
+        raise RuntimeError("router crashed")
+
+def test_failed_routing_falls_back_to_the_gemini_pipeline(scripted_model, tmp_path):
+    scripted_model.text = json.dumps(PAGE)
+
+    results = pdf_to_json.run_page_tasks([blank_page(tmp_path)], max_workers=1, router=BrokenRouter(), verify=False)
+
+    assert results[0]["tables"] == PAGE["tables"]
+    assert scripted_model.calls == 2
@@ -0,0 +1,146 @@
+import pytest
+from PIL import Image
+
+import pdf_to_json
+from pdf_to_json import APIKeySlot, Deadline, PageImage, PageUploadManager, UploadedFile
+
+class UploadBackend:
+    """File API stand-in that records uploads and deletions; fail_uploads makes every upload raise"""
+    def __init__(self, fail_uploads: bool = False, fail_deletes: bool = False):
+        self.fail_uploads = fail_uploads
+        self.fail_deletes = fail_deletes
+        self.uploads = []
+        self.timeouts = []
+        self.files = set()
+
+    def upload_file(self, api_key: str, path: str, mime_type: str, timeout: float = 60.0) -> UploadedFile:
+        self.timeouts.append(timeout)
+        if self.fail_uploads:
+            raise TimeoutError("File API still processing")
+        name = f"files/{len(self.uploads) + 1}"
+        self.uploads.append((api_key, path))
+        self.files.add(name)
+        return UploadedFile(name, f"https://files.example/{name}", mime_type, lambda: self.delete(name))
+
+    def delete(self, name: str):
+        if self.fail_deletes:
+            raise RuntimeError("delete failed")
+        self.files.remove(name)
+
+@pytest.fixture
+def page(tmp_path):
+    path = tmp_path / "page_1.jpg"
+    Image.new("RGB", (40, 40), "white").save(path)
+    return str(path)
+
+def slot(backend, name="key1"):
+    return APIKeySlot(name, f"{name}-secret", 60, backend)
+
+def test_page_is_uploaded_once_per_key_and_reused(page):
+    backend = UploadBackend()
+    uploads = PageUploadManager()
+    first, second = slot(backend), slot(backend, "key2")
+
+    parts = [PageImage(page, uploads).resolve(first) for _ in range(3)]
+    PageImage(page, uploads).resolve(second)
+
+    assert backend.uploads == [("key1-secret", page), ("key2-secret", page)]
+    assert all(part.file_data.file_uri == parts[0].file_data.file_uri for part in parts)
+    assert parts[0].file_data.mime_type == "image/jpeg"
+    summary = uploads.summary()
+    assert summary["inline_equivalent_bytes"] == 2 * summary["uploaded_bytes"]
+    assert summary["reduction_percent"] == 50.0
+
+def test_failed_upload_falls_back_to_the_inline_image(page):
+    backend = UploadBackend(fail_uploads=True)
+    uploads = PageUploadManager()
+
+    part = PageImage(page, uploads).resolve(slot(backend))
+
+    assert isinstance(part, Image.Image)
+    assert uploads.summary()["uploaded_bytes"] == 0
+    assert uploads.summary()["inline_bytes"] > 0
+
+def test_without_a_manager_the_image_goes_inline(page):
+    assert isinstance(PageImage(page).resolve(slot(UploadBackend())), Image.Image)
+
+def test_processing_wait_is_capped_by_the_page_deadline(page):
+    backend = UploadBackend()
+
+    PageImage(page, PageUploadManager()).resolve(slot(backend), Deadline(2))
+    PageImage(page, PageUploadManager()).resolve(slot(backend))
+
+    assert 0 < backend.timeouts[0] <= 2
+    assert backend.timeouts[1] == pdf_to_json.FILE_PROCESSING_TIMEOUT
+
+def test_delete_all_removes_every_upload(page, tmp_path):
+    other = tmp_path / "page_2.jpg"
+    Image.new("RGB", (40, 40), "white").save(other)
+    backend = UploadBackend()
+    uploads = PageUploadManager()
+    for path in (page, str(other)):
+        PageImage(path, uploads).resolve(slot(backend))
+
+    uploads.delete_all()
+
+    assert backend.files == set()
+    assert uploads.uploads == {}
+
+def test_failed_deletes_do_not_raise(page):
+    backend = UploadBackend(fail_deletes=True)
+    uploads = PageUploadManager()
+    PageImage(page, uploads).resolve(slot(backend))
+
+    uploads.delete_all()
+
+    assert uploads.uploads == {}
+
+class FakeFile:
+    def __init__(self, state):
+        self.name = "files/abc"
+        self.uri = "https://files.example/files/abc"
+        self.state = state
+
+class FakeFileClient:
+    """FileServiceClient stand-in whose upload stays in the given state"""
+    instances = []
+
+    def __init__(self, client_options=None, state=None):
+        self.state = state
+        self.deleted = []
+        FakeFileClient.instances.append(self)
+
+    def create_file(self, path, mime_type=None, display_name=None):
+        return FakeFile(self.state)
+
+    def get_file(self, name):
+        return FakeFile(self.state)
+
+    def delete_file(self, name):
+        self.deleted.append(name)
+
+def file_client_in_state(monkeypatch, state):
+    FakeFileClient.instances = []
+    monkeypatch.setattr(pdf_to_json, "FileServiceClient", lambda client_options=None: FakeFileClient(client_options, state))
+
+def test_upload_still_processing_at_the_timeout_is_deleted(monkeypatch, page):
+    file_client_in_state(monkeypatch, pdf_to_json.glm.File.State.PROCESSING)
+
+    with pytest.raises(TimeoutError):
+        pdf_to_json.GeminiBackend().upload_file("key", page, "image/jpeg", timeout=0)
+    assert FakeFileClient.instances[0].deleted == ["files/abc"]
+
+def test_upload_the_file_api_could_not_process_raises(monkeypatch, page):
+    file_client_in_state(monkeypatch, pdf_to_json.glm.File.State.FAILED)
+
+    with pytest.raises(ValueError):
+        pdf_to_json.GeminiBackend().upload_file("key", page, "image/jpeg")
+
+def test_processed_upload_can_be_deleted(monkeypatch, page):
+    file_client_in_state(monkeypatch, pdf_to_json.glm.File.State.ACTIVE)
+
+    uploaded = pdf_to_json.GeminiBackend().upload_file("key", page, "image/jpeg")
+    uploaded.delete()
+
+    assert uploaded.uri == "https://files.example/files/abc"
+    assert FakeFileClient.instances[0].deleted == ["files/abc"]
@@ -0,0 +1,55 @@
+import pytest
+
+import pdf_to_json
+from pdf_to_json import PRESETS, get_preset, preset_routing, run_settings
+
+@pytest.fixture(autouse=True)
+def no_preset_env(monkeypatch):
+    monkeypatch.setattr(pdf_to_json, "DEFAULT_PRESET", None)
+    monkeypatch.delenv("GEMINI_ESCALATION_MODEL", raising=False)
+
+def test_unknown_preset_is_rejected():
+    assert get_preset(None) is None
+    with pytest.raises(ValueError):
+        get_preset("fastest")
+
+def test_without_a_preset_the_previous_defaults_apply():
+    assert run_settings() == (300, 2, True, 95, False, None)
+
+def test_preset_sets_every_run_setting():
+    fast = PRESETS["fast"]
+
+    dpi, max_workers, verify, jpeg_quality, hedge, routing = run_settings("fast")
+
+    assert (dpi, max_workers, verify, jpeg_quality, hedge) == (200, 4, False, 80, True)
+    assert routing is fast.routing
+
+def test_gemini_preset_is_the_default(monkeypatch):
+    monkeypatch.setattr(pdf_to_json, "DEFAULT_PRESET", "accurate")
+
+    assert run_settings()[0] == 400
+    assert run_settings("fast")[0] == 200
+
+def test_explicit_routing_and_hedge_win_over_the_preset():
+    routing = pdf_to_json.ModelRouting("a", "b", "c")
+
+    assert run_settings("balanced", hedge=True, routing=routing)[4:] == (True, routing)
+
+def test_explicit_models_override_the_preset_models():
+    routing = preset_routing("fast", extraction="gemini-2.5-pro", escalation="gemini-2.5-pro")
+
+    assert routing.stage_models == {"analysis": "gemini-2.0-flash-lite", "extraction": "gemini-2.5-pro",
+                                    "verification": "gemini-2.0-flash-lite"}
+    assert routing.escalation_model == "gemini-2.5-pro"
+
+def test_preset_models_are_kept_without_overrides():
+    routing = preset_routing("accurate")
+
+    assert routing.stage_models == PRESETS["accurate"].routing.stage_models
+    assert routing.escalation_model == PRESETS["accurate"].routing.escalation_model
+
+def test_without_a_preset_escalation_follows_the_extraction_override():
+    routing = preset_routing(None, extraction="gemini-2.5-pro")
+
+    assert routing.model_for("extraction") == "gemini-2.5-pro"
+    assert routing.escalation_model == "gemini-2.5-pro"
@@ -0,0 +1,147 @@
+import time
+from threading import Event, Thread
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+import pdf_to_json
+from pdf_to_json import CircuitOpenError, Deadline, DeadlineExceeded, PageTask, RetryPolicy, RetryQueue
+
+class TestRetryQueue:
+    def test_tasks_come_out_in_delay_order(self):
+        queue = RetryQueue()
+        late, early, now = PageTask("page_1.jpg"), PageTask("page_2.jpg"), PageTask("page_3.jpg")
+        queue.put(late, delay=0.2, new=True)
+        queue.put(early, delay=0.05, new=True)
+        queue.put(now, new=True)
+
+        started = time.monotonic()
+        assert [queue.get(), queue.get(), queue.get()] == [now, early, late]
+        assert time.monotonic() - started >= 0.2
+
+    def test_equal_delays_keep_insertion_order(self):
+        queue = RetryQueue()
+        tasks = [PageTask(f"page_{number}.jpg") for number in range(5)]
+        for task in tasks:
+            queue.put(task, new=True)
+
+        assert [queue.get() for _ in tasks] == tasks
+
+    def test_get_returns_none_once_every_task_is_done(self):
+        queue = RetryQueue()
+        queue.put(PageTask("page_1.jpg"), new=True)
+        queue.get()
+        queue.task_done()
+
+        assert queue.get() is None
+
+    def test_waiting_worker_is_released_when_the_last_task_finishes(self):
+        queue = RetryQueue()
+        queue.put(PageTask("page_1.jpg"), new=True)
+        queue.get()
+        results = []
+        worker = Thread(target=lambda: results.append(queue.get()))
+        worker.start()
+        time.sleep(0.05)
+        assert worker.is_alive()
+
+        queue.task_done()
+        worker.join(timeout=1)
+        assert results == [None]
+
+    def test_requeued_task_does_not_count_twice(self):
+        queue = RetryQueue()
+        task = PageTask("page_1.jpg")
+        queue.put(task, new=True)
+        queue.put(queue.get(), delay=0.01)
+
+        assert queue.get() is task
+        queue.task_done()
+        assert queue.get() is None
+
+    def test_cancel_hands_out_backed_off_tasks_straight_away(self):
+        cancel = Event()
+        queue = RetryQueue(cancel)
+        task = PageTask("page_1.jpg")
+        queue.put(task, delay=60, new=True)
+        Thread(target=lambda: (time.sleep(0.05), cancel.set())).start()
+
+        started = time.monotonic()
+        assert queue.get() is task
+        assert time.monotonic() - started < pdf_to_json.CANCEL_POLL_SECONDS + 1
+
+class TestRetryPolicy:
+    def test_gives_up_after_max_attempts(self):
+        policy = RetryPolicy(max_attempts=3, base_delay=1.0)
+        error = google_exceptions.ServiceUnavailable("busy")
+
+        assert policy.next_delay(1, error) is not None
+        assert policy.next_delay(2, error) is not None
+        assert policy.next_delay(3, error) is None
+
+    @pytest.mark.parametrize("error", [
+        DeadlineExceeded("late"),
+        CircuitOpenError(5),
+        FileNotFoundError("page_1.jpg"),
+        google_exceptions.InvalidArgument("bad request"),
+        google_exceptions.PermissionDenied("no"),
+    ])
+    def test_non_retryable_errors_give_up_at_once(self, error):
+        assert RetryPolicy().next_delay(1, error) is None
+
+    def test_backoff_is_capped(self):
+        policy = RetryPolicy(max_attempts=50, base_delay=2.0, max_delay=5.0)
+        error = RuntimeError("flaky")
+
+        for failures in range(1, 20):
+            assert 0 <= policy.next_delay(failures, error) <= 5.0
+
+    def test_server_hint_sets_the_delay(self):
+        policy = RetryPolicy(base_delay=0.5)
+        error = google_exceptions.ResourceExhausted("Quota exceeded, please retry in 7.5s")
+
+        assert 7.5 <= policy.next_delay(1, error) <= 8.0
+
+    def test_gives_up_when_the_delay_would_pass_the_deadline(self):
+        policy = RetryPolicy(base_delay=0.5)
+        error = google_exceptions.ResourceExhausted("retry in 30s")
+
+        assert policy.next_delay(1, error, Deadline(5)) is None
+        assert policy.next_delay(1, error, Deadline(60)) is not None
+        assert policy.next_delay(1, error, Deadline(None)) is not None
+
+    def test_run_retries_then_returns(self, monkeypatch):
+        sleeps = []
+        monkeypatch.setattr(pdf_to_json.time, "sleep", sleeps.append)
+        attempts = []
+
+        def attempt():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise RuntimeError("flaky")
+            return "ok"
+
+        assert RetryPolicy(max_attempts=3).run("extraction", attempt) == "ok"
+        assert len(attempts) == 3 and len(sleeps) == 2
+
+    def test_run_raises_the_last_error(self, monkeypatch):
+        monkeypatch.setattr(pdf_to_json.time, "sleep", lambda seconds: None)
+        attempts = []
+
+        def attempt():
+            attempts.append(1)
+            raise RuntimeError(f"failure {len(attempts)}")
+
+        with pytest.raises(RuntimeError, match="failure 2"):
+            RetryPolicy(max_attempts=2).run("analysis", attempt)
+
+    def test_run_does_not_retry_non_retryable_errors(self):
+        attempts = []
+
+        def attempt():
+            attempts.append(1)
+            raise google_exceptions.PermissionDenied("no")
+
+        with pytest.raises(google_exceptions.PermissionDenied):
+            RetryPolicy().run("analysis", attempt)
+        assert len(attempts) == 1
@@ -0,0 +1,81 @@
+import json
+import time
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+from PIL import Image
+
+import pdf_to_json
+from conftest import ScriptedBackend, ScriptedModel
+from pdf_to_json import CircuitOpenError, Deadline, ModelRouting, speculative_extraction
+
+GOOD_EXTRACTION = json.dumps({"tables": [{"table_title": "Assets", "headers": ["S. No", "Asset"], "data": [["1", "Pump"]]}]})
+RAGGED_EXTRACTION = json.dumps({"tables": [{"table_title": "Assets", "headers": ["S. No", "Asset"], "data": [["1"]]}]})
+ROUTING = ModelRouting(analysis="analysis", extraction="extraction", verification="analysis", escalation="extraction")
+
+@pytest.fixture
+def page(tmp_path):
+    path = tmp_path / "page_1.jpg"
+    Image.new("RGB", (40, 40), "white").save(path)
+    return str(path)
+
+@pytest.fixture
+def models(monkeypatch):
+    """Scripted analysis and extraction models"""
+    analysis, extraction = ScriptedModel(text="One table."), ScriptedModel(text=GOOD_EXTRACTION)
+    monkeypatch.setattr(pdf_to_json, "call_stats", pdf_to_json.CallStats())
+    monkeypatch.setattr(pdf_to_json, "circuit_breaker", pdf_to_json.CircuitBreaker())
+    backend = ScriptedBackend(ScriptedModel(), {"analysis": analysis, "extraction": extraction})
+    monkeypatch.setattr(pdf_to_json, "key_pool", pdf_to_json.APIKeyPool(["test-key"], calls_per_minute=6000, backend=backend))
+    return analysis, extraction
+
+def speculation():
+    return pdf_to_json.call_stats.summary()["speculation"]
+
+def test_passing_generic_extraction_is_used_without_the_analysis(page, models):
+    analysis, _ = models
+    analysis.outcomes = [0.3]
+
+    structured_data, structure_analysis = speculative_extraction(page, Deadline(5), routing=ROUTING)
+
+    assert structured_data["tables"][0]["data"] == [["1", "Pump"]]
+    assert structure_analysis is None
+    # The analysis was already running, so its call is made (and paid for) regardless
+    assert speculation() == {"accepted": 1, "rejected": 0, "unused_analyses": 1}
+    # Let the analysis finish inside the test
+    time.sleep(0.4)
+
+def test_extraction_failing_its_checks_is_redone_with_the_analysis(page, models):
+    _, extraction = models
+    extraction.text = RAGGED_EXTRACTION
+
+    assert speculative_extraction(page, Deadline(5), routing=ROUTING) == (None, "One table.")
+    assert speculation() == {"accepted": 0, "rejected": 1, "unused_analyses": 0}
+
+@pytest.mark.parametrize("error", [
+    google_exceptions.ServiceUnavailable("503 backend unavailable"),
+    google_exceptions.ResourceExhausted("429 quota exceeded"),
+])
+def test_call_errors_go_back_to_the_task_queue(page, models, error):
+    _, extraction = models
+    extraction.outcomes = [error]
+
+    with pytest.raises(type(error)):
+        speculative_extraction(page, Deadline(5), routing=ROUTING)
+    assert speculation()["rejected"] == 0
+
+def test_open_circuit_goes_back_to_the_task_queue(page, models, monkeypatch):
+    breaker = pdf_to_json.CircuitBreaker(failure_threshold=1)
+    breaker.record_failure(google_exceptions.ServiceUnavailable("503"))
+    monkeypatch.setattr(pdf_to_json, "circuit_breaker", breaker)
+
+    with pytest.raises(CircuitOpenError):
+        speculative_extraction(page, Deadline(5), routing=ROUTING)
+    assert speculation()["rejected"] == 0
+
+def test_client_error_falls_back_to_the_analysis_without_a_rejection(page, models):
+    _, extraction = models
+    extraction.outcomes = [google_exceptions.InvalidArgument("400 bad request")]
+
+    assert speculative_extraction(page, Deadline(5), routing=ROUTING) == (None, "One table.")
+    assert speculation() == {"accepted": 0, "rejected": 0, "unused_analyses": 0}
@@ -0,0 +1,30 @@
+from json_to_excel import TableConsolidator
+
+def table(rows, headers=(), title=""):
+    return {"table_title": title, "headers": list(headers), "data": [list(row) for row in rows]}
+
+def consolidate(*pages):
+    consolidator = TableConsolidator()
+    for page_number, tables in enumerate(pages, 1):
+        consolidator.add_page(page_number, {"tables": tables})
+    return [(title, pages, df.iloc[:, 1:].values.tolist()) for title, pages, df in consolidator.tables()]
+
+def test_headerless_tables_continue_only_the_table_before_them():
+    logical_tables = consolidate(
+        [table([["1", "Pump"]], title="Assets")],
+        [table([["2", "Valve"]])],
+        [table([["Diesel", "400"]], headers=["Item", "Litres"], title="Fuel")],
+        [table([["Petrol", "150"]])],
+    )
+
+    # Two separate tables without a header row, each joined to the table its page continues
+    assert logical_tables == [("Assets", [1, 2], [["1", "Pump"], ["2", "Valve"]]),
+                              ("Fuel", [3, 4], [["Diesel", "400"], ["Petrol", "150"]])]
+
+def test_headerless_tables_not_opening_a_page_are_tables_of_their_own():
+    logical_tables = consolidate(
+        [table([["1", "Pump"]])],
+        [table([["Diesel", "400"]], headers=["Item", "Litres"], title="Fuel"), table([["North", "12"]])],
+    )
+
+    assert [(title, pages) for title, pages, _ in logical_tables] == [("", [1]), ("Fuel", [2]), ("", [2])]
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from pdf_to_json import TableRowStreamParser
+
+TABLES = [
+    {
+        "table_title": "Asset Register",
+        "headers": ["S. No", "Asset", "Remarks"],
+        "data": [["1", "Pump \"A\"", "Signature detected"], ["2", "Valve [x]", "{braces}, commas"], ["3", "", "line\nbreak"]]
+    },
+    {"table_title": "Empty", "headers": ["Only"], "data": []},
+    {"table_title": "Nested ", "headers": ["a", "b"], "data": [["ü€", "\\"], ["1,23,456.00", "12/03/2025"]]}
+]
+
+def extraction_json(tables, indent=None) -> str:
+    return json.dumps({
+        "document_type": "asset register",
+        "page_metadata": {"page_number": "1", "header": "data: [\"not\", \"a row\"]", "footer": ""},
+        "sections": [{"title": "tables", "content": "[1, 2]"}],
+        "tables": tables,
+        "key_value_pairs": {"headers": ["not", "a table"]}
+    }, indent=indent, ensure_ascii=False)
+
+def expected_events(tables):
+    events = []
+    for index, table in enumerate(tables):
+        events.append(("title", index, table["table_title"]))
+        events.append(("headers", index, table["headers"]))
+        events.extend(("row", index, row) for row in table["data"])
+    return events
+
+def feed_in_chunks(text: str, chunk_size: int):
+    parser = TableRowStreamParser()
+    events = []
+    for start in range(0, len(text), chunk_size):
+        events.extend(parser.feed(text[start:start + chunk_size]))
+    return parser, events
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 8, 17, 64, 1 << 16])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_json_tables_emit_the_same_events_at_any_chunk_size(chunk_size, indent):
+    parser, events = feed_in_chunks(extraction_json(TABLES, indent), chunk_size)
+
+    assert events == expected_events(TABLES)
+    assert parser.done
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 1 << 16])
+def test_text_around_the_json_is_ignored(chunk_size):
+    text = "```json\n" + extraction_json(TABLES) + "\n```\nTrailing note with [brackets] and {braces}"
+    parser, events = feed_in_chunks(text, chunk_size)
+
+    assert events == expected_events(TABLES)
+    assert parser.done
+
+def test_rows_are_emitted_before_the_response_is_complete():
+    text = extraction_json(TABLES)
+    cut = text.index('"Valve')
+    parser = TableRowStreamParser()
+
+    events = parser.feed(text[:cut])
+
+    assert events == expected_events(TABLES)[:3]
+    assert not parser.done
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from pdf_to_json import TSV_LINE_BREAK, decode_tsv_tables, parse_extraction_response
+from test_table_row_stream import TABLES, expected_events, extraction_json, feed_in_chunks
+
+def response_with(tsv: str, **table) -> str:
+    return "```json\n" + json.dumps({"document_type": "register", "tables": [dict(table_title="Assets", tsv=tsv, **table)]}) + "\n```"
+
+def test_tsv_table_is_decoded_into_headers_and_rows():
+    structured_data = parse_extraction_response(response_with("S. No\tAsset\tRemarks\n1\tPump\tok\n2\tValve\t\n"))
+    table = structured_data["tables"][0]
+
+    assert "tsv" not in table
+    assert table["headers"] == ["S. No", "Asset", "Remarks"]
+    assert table["data"] == [["1", "Pump", "ok"], ["2", "Valve", ""]]
+
+def test_line_breaks_inside_cells():
+    structured_data = parse_extraction_response(response_with(f"Address\tNote\nPlot 4{TSV_LINE_BREAK}Sector 9\ta{TSV_LINE_BREAK}b{TSV_LINE_BREAK}c"))
+
+    assert structured_data["tables"][0]["data"] == [["Plot 4\nSector 9", "a\nb\nc"]]
+
+def test_ragged_lines_keep_their_cells():
+    structured_data = parse_extraction_response(response_with("A\tB\tC\n1\n1\t2\t3\t4\n\t\t"))
+
+    assert structured_data["tables"][0]["data"] == [["1"], ["1", "2", "3", "4"], ["", "", ""]]
+
+def test_blank_and_windows_lines():
+    structured_data = parse_extraction_response(response_with("A\tB\r\n\r\n1\t2\r\n\n3\t4\r\n"))
+    table = structured_data["tables"][0]
+
+    assert table["headers"] == ["A", "B"]
+    assert table["data"] == [["1", "2"], ["3", "4"]]
+
+def test_empty_tsv():
+    table = parse_extraction_response(response_with(""))["tables"][0]
+
+    assert table["headers"] == [] and table["data"] == []
+
+def test_json_tables_are_left_alone():
+    document = {"tables": [{"table_title": "Assets", "headers": ["A"], "data": [["a<br>b"]]}, "not a table"]}
+
+    assert decode_tsv_tables(json.loads(json.dumps(document))) == document
+
+def test_unparseable_response_is_an_error():
+    assert parse_extraction_response('{"tables": [{"tsv": "A\tB"')["error"] == "No JSON found in response"
+    assert parse_extraction_response('{"tables": [{"tsv": "A\\tB}')["error"] == "Failed to parse JSON"
+
+def tsv_tables():
+    tables = []
+    for table in TABLES:
+        lines = [table["headers"]] + table["data"]
+        tsv = "\n".join("\t".join(cell.replace("\n", TSV_LINE_BREAK) for cell in line) for line in lines)
+        tables.append({"table_title": table["table_title"], "tsv": tsv + "\n"})
+    return tables
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 13, 1 << 16])
+def test_tsv_tables_stream_each_line_as_it_closes(chunk_size):
+    parser, events = feed_in_chunks(extraction_json(tsv_tables()), chunk_size)
+
+    assert events == expected_events(TABLES)
+    assert parser.done
+
+def test_streamed_and_parsed_tsv_tables_agree():
+    text = extraction_json(tsv_tables())
+    _, events = feed_in_chunks(text, 5)
+    tables = parse_extraction_response(text)["tables"]
+
+    assert [table["data"] for table in tables] == [[value for kind, index, value in events if kind == "row" and index == i]
+                                                   for i in range(len(tables))]